@@ -0,0 +1,6 @@
+import os
+import sys
+
+# timelads is a single module at the repo root, not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+from timelads import FadeEngine, FakeVolumeBackend
+
+
+def wait_for(cond, timeout=2.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if cond():
+            return True
+        time.sleep(0.005)
+    return cond()
+
+
+@pytest.fixture
+def backend():
+    return FakeVolumeBackend([("music", 101, 1.0), ("browser", 102, 0.7), ("mic", 103, 0.5)])
+
+
+@pytest.fixture
+def engine(backend):
+    eng = FadeEngine(backend)
+    yield eng
+    eng.release_all()
+
+
+def test_duck_and_restore(engine, backend):
+    engine.duck("playback", 0.2, fade=0.0)
+    assert wait_for(lambda: all(v == 0.2 for v in backend.volumes.values()))
+    engine.release("playback", fade=0.0)
+    assert wait_for(lambda: backend.volumes == {"music": 1.0, "browser": 0.7, "mic": 0.5})
+    assert wait_for(lambda: not engine.active)
+
+
+def test_fade_ramps_through_intermediate_levels(engine, backend):
+    seen = []
+    set_volume = backend.set_volume
+
+    def record(ctl, value):
+        if ctl == "music":
+            seen.append(value)
+        set_volume(ctl, value)
+
+    backend.set_volume = record
+    engine.duck("playback", 0.0, fade=0.3)
+    assert wait_for(lambda: backend.volumes["music"] == 0.0)
+    assert len(seen) > 3
+    assert any(0.1 < v < 0.9 for v in seen)
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_overlapping_owners_hold_lowest_level(engine, backend):
+    engine.duck("playback", 0.5, fade=0.0)
+    engine.duck("voice", 0.1, fade=0.0)
+    assert wait_for(lambda: backend.volumes["music"] == 0.1)
+    engine.release("voice", fade=0.0)
+    assert wait_for(lambda: backend.volumes["music"] == 0.5)
+    # the remaining hold keeps every session down
+    assert backend.volumes["browser"] == 0.5
+    engine.release("playback", fade=0.0)
+    assert wait_for(lambda: backend.volumes["music"] == 1.0 and backend.volumes["browser"] == 0.7)
+
+
+def test_excluded_pids_are_left_alone(engine, backend):
+    engine.duck("mic", 0.1, fade=0.0, exclude_pids={103})
+    assert wait_for(lambda: backend.volumes["music"] == 0.1)
+    assert backend.volumes["mic"] == 0.5
+
+
+def test_release_all_restores_synchronously(engine, backend):
+    engine.duck("manual", 0.05, fade=0.0)
+    assert wait_for(lambda: backend.volumes["browser"] == 0.05)
+    engine.release_all(timeout=1.0)
+    assert backend.volumes == {"music": 1.0, "browser": 0.7, "mic": 0.5}
+
+
+def test_vanished_session_does_not_break_fades(engine, backend):
+    engine.duck("playback", 0.3, fade=0.0)
+    assert wait_for(lambda: backend.volumes["music"] == 0.3)
+    backend.remove_session("browser")
+    engine.release("playback", fade=0.0)
+    assert wait_for(lambda: backend.volumes == {"music": 1.0, "mic": 0.5})
+
+
+def test_sessions_are_opened_once(engine, backend):
+    for level in (0.5, 0.4, 0.3):
+        engine.duck("playback", level, fade=0.0)
+        assert wait_for(lambda: backend.volumes["music"] == level)
+    assert backend.opens == 3
+
+
+def test_no_backend_is_a_no_op():
+    engine = FadeEngine(None)
+    assert engine.duck("playback", 0.2) is False
+    assert engine.release("playback") is False
+    assert not engine.active
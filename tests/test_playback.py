@@ -0,0 +1,168 @@
+import struct
+import threading
+import time
+import wave
+
+import timelads
+from timelads import (PRIORITY_MANUAL, PRIORITY_PLAYLIST, PRIORITY_SCHEDULED, QUEUE_ADDED,
+                      QUEUE_MERGED, NullSink, PlaybackEngine, PlaybackQueue)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def drain(queue):
+    out = []
+    while True:
+        item = queue.get(timeout=0)
+        if item is None:
+            return out
+        out.append(item)
+
+
+def test_priority_then_fifo():
+    q = PlaybackQueue(max_wait={})
+    q.put("a.wav", priority=PRIORITY_PLAYLIST)
+    q.put("b.wav", priority=PRIORITY_SCHEDULED)
+    q.put("c.wav", priority=PRIORITY_PLAYLIST)
+    q.put("d.wav", priority=PRIORITY_MANUAL)
+    assert [i["path"] for i in drain(q)] == ["d.wav", "b.wav", "a.wav", "c.wav"]
+
+
+def test_duplicate_is_ignored():
+    q = PlaybackQueue()
+    assert q.put("a.wav") == QUEUE_ADDED
+    assert q.put("a.wav") is None
+    assert len(q) == 1
+    assert len(drain(q)) == 1
+
+
+def test_duplicate_upgrades_priority_and_repeats():
+    q = PlaybackQueue()
+    q.put("a.wav", priority=PRIORITY_PLAYLIST)
+    q.put("b.wav", priority=PRIORITY_SCHEDULED)
+    assert q.put("a.wav", repeats=3, priority=PRIORITY_MANUAL) == QUEUE_MERGED
+    items = drain(q)
+    assert [i["path"] for i in items] == ["a.wav", "b.wav"]
+    assert items[0]["repeats"] == 3
+    assert items[0]["priority"] == PRIORITY_MANUAL
+
+
+def test_expired_items_are_dropped():
+    clock = Clock()
+    dropped = []
+    q = PlaybackQueue(max_wait={PRIORITY_SCHEDULED: 60.0}, on_expired=dropped.append, clock=clock)
+    q.put("old.wav")
+    clock.now += 30
+    q.put("new.wav")
+    q.put("manual.wav", priority=PRIORITY_MANUAL)
+    clock.now += 45
+    assert [i["path"] for i in drain(q)] == ["manual.wav", "new.wav"]
+    assert [i["path"] for i in dropped] == ["old.wav"]
+
+
+def test_merge_keeps_original_queue_time():
+    clock = Clock()
+    dropped = []
+    q = PlaybackQueue(max_wait={PRIORITY_SCHEDULED: 60.0, PRIORITY_PLAYLIST: 60.0},
+                      on_expired=dropped.append, clock=clock)
+    q.put("a.wav", priority=PRIORITY_PLAYLIST)
+    clock.now += 50
+    q.put("a.wav", priority=PRIORITY_SCHEDULED)
+    clock.now += 20
+    assert drain(q) == []
+    assert len(dropped) == 1
+
+
+def source(path):
+    # (pcm buffer, rate, channels, seconds): no audio, just a length
+    return None, 0, 0, 0.01
+
+
+def test_engine_plays_in_order_with_busy_idle_callbacks():
+    sink = NullSink(realtime=False)
+    events = []
+    idle = threading.Event()
+    engine = PlaybackEngine(on_busy=lambda: events.append("busy"),
+                            on_idle=lambda: (events.append("idle"), idle.set()),
+                            sink=sink, source=source, name="Teste")
+    # queued before start, so the order is decided by the queue alone
+    engine.enqueue("late.wav", priority=PRIORITY_PLAYLIST)
+    engine.enqueue("spot.wav", repeats=2, gain=0.5)
+    engine.enqueue("now.wav", priority=PRIORITY_MANUAL)
+    engine.start()
+    try:
+        assert idle.wait(2.0)
+    finally:
+        engine.stop()
+    assert events == ["busy", "idle"]
+    assert [p[1] for p in sink.played] == ["now.wav", "spot.wav", "late.wav"]
+    spot = sink.played[1]
+    assert spot[3] == 2
+    assert spot[4] == 0.5
+
+
+def test_engine_level_applies_duck():
+    sink = NullSink(realtime=False)
+    done = threading.Event()
+    engine = PlaybackEngine(on_idle=done.set, sink=sink, source=source)
+    engine.set_duck(0.25)
+    engine.enqueue("a.wav", gain=0.8)
+    engine.start()
+    try:
+        assert done.wait(2.0)
+    finally:
+        engine.stop()
+    assert abs(sink.played[0][4] - 0.2) < 1e-9
+
+
+def test_engine_goes_busy_again_after_idle():
+    sink = NullSink(realtime=False)
+    events = []
+    idle = threading.Event()
+    engine = PlaybackEngine(on_busy=lambda: events.append("busy"),
+                            on_idle=lambda: (events.append("idle"), idle.set()),
+                            sink=sink, source=source)
+    engine.start()
+    try:
+        for name in ("a.wav", "b.wav"):
+            idle.clear()
+            engine.enqueue(name)
+            assert idle.wait(2.0)
+            time.sleep(0.01)
+    finally:
+        engine.stop()
+    assert events == ["busy", "idle", "busy", "idle"]
+    assert [p[1] for p in sink.played] == ["a.wav", "b.wav"]
+
+
+def test_file_zone_writes_scaled_pcm(tmp_path):
+    out = tmp_path / "zona.wav"
+    sink = timelads.make_sink("Teste", {"sink": "file", "path": str(out)})
+    assert isinstance(sink, timelads.FileSink)
+    pcm = struct.pack("<4h", 1000, -1000, 2000, -2000)
+    done = threading.Event()
+    engine = PlaybackEngine(on_idle=done.set, sink=sink, source=lambda path: (pcm, 8000, 1, 0.0005),
+                            name="Teste")
+    engine.enqueue("a.wav", repeats=2, gain=0.5)
+    engine.start()
+    try:
+        assert done.wait(2.0)
+    finally:
+        engine.stop()
+    sink.close()
+    with wave.open(str(out), "rb") as w:
+        assert (w.getnchannels(), w.getframerate()) == (1, 8000)
+        frames = struct.unpack("<8h", w.readframes(8))
+    assert frames == (500, -500, 1000, -1000) * 2
+
+
+def test_file_zone_without_numpy_is_null(monkeypatch, tmp_path):
+    monkeypatch.setattr(timelads, "numpy_available", lambda: False)
+    sink = timelads.make_sink("Teste", {"sink": "file", "path": str(tmp_path / "zona.wav")})
+    assert type(sink) is timelads.NullSink
@@ -0,0 +1,84 @@
+import json
+import wave
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pygame")
+
+import timelads
+
+RATE = 44100
+
+
+def write_wav(path, seconds, value):
+    frames = int(seconds * RATE)
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(np.full((frames, 2), value, dtype="<i2").tobytes())
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    # transcoded PCM goes to the test folder, not avisos/.pcm
+    original = timelads.TranscodeCache
+    monkeypatch.setattr(timelads, "TranscodeCache", lambda store: original(store, root=str(tmp_path / "pcm")))
+    write_wav(tmp_path / "a.wav", 1.0, 1000)
+    write_wav(tmp_path / "b.wav", 0.5, 2000)
+    playlists = {"P": {"active": True, "time": "", "files": [
+        {"path": str(tmp_path / "a.wav"), "times": ["08:00"], "repeats": 2},
+        {"path": str(tmp_path / "b.wav"), "times": ["08:00", "08:01"], "repeats": 1, "media_volume": 0.5},
+        {"path": str(tmp_path / "gone.wav"), "times": ["08:02"], "repeats": 1},
+    ]}}
+    (tmp_path / "playlists.json").write_text(json.dumps(playlists))
+    (tmp_path / "config.json").write_text(json.dumps({"normalize_lufs": None}))
+    return tmp_path
+
+
+def render(tmp, out, *extra):
+    return timelads.main(["--playlists", str(tmp / "playlists.json"), "--config", str(tmp / "config.json"),
+                          "--render", "2026-03-01 08:00", "2026-03-01 08:03", str(out), *extra])
+
+
+def read(path):
+    with wave.open(str(path)) as w:
+        assert (w.getframerate(), w.getnchannels(), w.getsampwidth()) == (RATE, 2, 2)
+        return np.frombuffer(w.readframes(w.getnframes()), dtype="<i2").reshape(-1, 2)
+
+
+def cues(path):
+    lines = path.read_text().splitlines()
+    assert lines[0] == "saida;inicio;fim;zona;arquivo;repeticoes;volume;situacao"
+    return [line.split(";") for line in lines[1:]]
+
+
+def test_render_real_time(setup):
+    out = setup / "day.wav"
+    assert render(setup, out) == 0
+    x = read(out)
+    assert len(x) == 180 * RATE
+    at = lambda s: int(x[int(s * RATE), 0])
+    assert at(0.5) == 1000 and at(1.5) == 1000      # two repeats of a
+    assert at(2.2) == 1000                          # b at half volume
+    assert at(2.6) == 0
+    assert at(60.2) == 1000
+    assert at(60.6) == 0 and at(120.5) == 0         # gone.wav takes no time
+    assert cues(setup / "day.csv") == [
+        ["0.000", "2026-03-01 08:00:00", "2026-03-01 08:00:02", "Principal", "a.wav", "2", "1.000", "ok"],
+        ["2.000", "2026-03-01 08:00:02", "2026-03-01 08:00:02", "Principal", "b.wav", "1", "0.500", "ok"],
+        ["60.000", "2026-03-01 08:01:00", "2026-03-01 08:01:00", "Principal", "b.wav", "1", "0.500", "ok"],
+        ["120.000", "2026-03-01 08:02:00", "2026-03-01 08:02:00", "Principal", "gone.wav", "1", "1.000", "ignorado"],
+    ]
+
+
+def test_render_compact_and_duck(setup):
+    out = setup / "compact.wav"
+    assert render(setup, out, "--render-compact", "--render-duck", "08:01-08:02") == 0
+    x = read(out)
+    # 2.5 s, 1 s gap, 0.5 s
+    assert len(x) == 4 * RATE
+    assert int(x[int(3.75 * RATE), 0]) == 250       # b at 0.5, ducked to a quarter
+    assert [(c[0], c[4], c[7]) for c in cues(setup / "compact.csv")] == [
+        ("0.000", "a.wav", "ok"), ("2.000", "b.wav", "ok"), ("3.500", "b.wav", "ok"), ("4.000", "gone.wav", "ignorado")]
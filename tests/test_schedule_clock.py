@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import timelads
+from timelads import ManualClock, ScheduleEngine, ScheduleIndex, TimeWarp, TimelyAdsCore
+
+
+def replay(index, start, end, grace=timelads.SCHEDULE_GRACE):
+    # steps the scheduler like TimeWarp does; returns its trace
+    clock = ManualClock(start)
+    trace = []
+    fired = []
+    engine = ScheduleEngine(index, on_fire=lambda *e: fired.append(e), grace=grace, clock=clock, trace=trace)
+    while True:
+        delay = engine.step()
+        nxt = clock.now() + timedelta(seconds=delay)
+        if nxt >= end:
+            break
+        clock.set(nxt)
+    assert len(fired) == len(trace)
+    return trace
+
+
+def make_index(playlists):
+    index = ScheduleIndex()
+    index.build(playlists)
+    return index
+
+
+def test_fires_each_minute_once_across_midnight():
+    spot = {"path": "spot.wav", "times": ["23:58", "00:00", "00:01"]}
+    index = make_index({"P": {"active": True, "time": "23:59", "files": [spot]}})
+    trace = replay(index, datetime(2026, 3, 1, 23, 57), datetime(2026, 3, 2, 0, 3))
+    assert [(t[0], t[2]) for t in trace] == [
+        (datetime(2026, 3, 1, 23, 58), "media"),
+        (datetime(2026, 3, 1, 23, 59), "playlist"),
+        (datetime(2026, 3, 2, 0, 0), "media"),
+        (datetime(2026, 3, 2, 0, 1), "media"),
+    ]
+    # a stepped clock fires exactly on the minute
+    assert all(scheduled == fired for scheduled, fired, *_ in trace)
+
+
+def test_current_minute_fires_on_start():
+    spot = {"path": "spot.wav", "times": ["12:00"]}
+    index = make_index({"P": {"active": True, "time": "", "files": [spot]}})
+    trace = replay(index, datetime(2026, 3, 1, 12, 0, 30), datetime(2026, 3, 1, 12, 5))
+    assert [t[0] for t in trace] == [datetime(2026, 3, 1, 12, 0)]
+    assert trace[0][1] == datetime(2026, 3, 1, 12, 0, 30)
+
+
+def test_full_day_replays_twice_without_gaps():
+    spot = {"path": "spot.wav", "times": ["00:00", "06:30", "12:00", "23:59"]}
+    index = make_index({"P": {"active": True, "time": "", "files": [spot]}})
+    trace = replay(index, datetime(2026, 3, 1), datetime(2026, 3, 3))
+    assert len(trace) == 8
+    assert trace[-1][0] == datetime(2026, 3, 2, 23, 59)
+
+
+def test_inactive_playlists_do_not_fire():
+    spot = {"path": "spot.wav", "times": ["10:00"]}
+    index = make_index({"P": {"active": False, "time": "10:00", "files": [spot]}})
+    assert replay(index, datetime(2026, 3, 1, 9), datetime(2026, 3, 1, 11)) == []
+
+
+def test_stale_minutes_are_skipped_after_a_clock_jump():
+    spot = {"path": "spot.wav", "times": ["10:00", "10:30"]}
+    index = make_index({"P": {"active": True, "time": "", "files": [spot]}})
+    clock = ManualClock(datetime(2026, 3, 1, 9, 59))
+    trace = []
+    engine = ScheduleEngine(index, on_fire=None, grace=600, clock=clock, trace=trace)
+    engine.step()
+    clock.set(datetime(2026, 3, 1, 10, 20))      # 20 min suspend: 10:00 is past the grace window
+    engine.step()
+    clock.set(datetime(2026, 3, 1, 10, 35))      # 5 min late: still played
+    engine.step()
+    assert [(t[0].strftime("%H:%M"), t[1].strftime("%H:%M")) for t in trace] == [("10:30", "10:35")]
+
+
+@pytest.fixture
+def core(tmp_path):
+    core = TimelyAdsCore(str(tmp_path / "playlists.json"), str(tmp_path / "config.json"))
+    yield core
+    core.playlist_writer.close()
+    core.media_info.close()
+
+
+def dense_playlists(count=6, spots=10):
+    playlists = {}
+    for p in range(count):
+        files = [{"path": f"/nao/existe/p{p}_{i}.wav", "repeats": 1,
+                  "times": [f"{h:02d}:{m:02d}" for h in range(24) for m in range((i + p) % 4, 60, 4)]}
+                 for i in range(spots)]
+        playlists[f"P{p}"] = {"active": True, "time": f"{p:02d}:30", "files": files}
+    return playlists
+
+
+def test_time_warp_dense_day_has_no_misses_or_doubles(core):
+    core.playlists = dense_playlists()
+    core.index.build(core.playlists)
+    start = datetime(2026, 3, 1, 6, 0)
+    warp = TimeWarp(core, start, start + timedelta(days=1))
+    trace = warp.run()
+    assert len(trace) == 6 * 10 * 360 + 6
+    assert warp.check() == ([], [])
+    assert warp.max_delay() == 0.0
+    # the files don't exist: live playback skips them at once, so does the plan
+    assert all(s["skipped"] for segs in warp.playback.segments.values() for s in segs)
+
+
+def test_time_warp_check_reports_missing_and_doubled(core):
+    core.playlists = {"P": {"active": True, "time": "", "files": [{"path": "x.wav", "times": ["10:00", "11:00"]}]}}
+    core.index.build(core.playlists)
+    warp = TimeWarp(core, datetime(2026, 3, 1, 9), datetime(2026, 3, 1, 12))
+    warp.run()
+    warp.trace.append(warp.trace[0])
+    del warp.trace[1]
+    missing, doubled = warp.check()
+    assert [m[0] for m in missing] == [datetime(2026, 3, 1, 11)]
+    assert [(d[0], d[4]) for d in doubled] == [(datetime(2026, 3, 1, 10), 1)]
+
+
+def test_time_warp_at_speed_matches_instant(core):
+    spot = {"path": "x.wav", "times": ["10:00", "10:01", "10:02"]}
+    core.playlists = {"P": {"active": True, "time": "10:01", "files": [spot]}}
+    core.index.build(core.playlists)
+    start, end = datetime(2026, 3, 1, 9, 59, 50), datetime(2026, 3, 1, 10, 3)
+    instant = TimeWarp(core, start, end).run()
+    warp = TimeWarp(core, start, end, speed=600)
+    fast = warp.run()
+    assert [t[0] for t in fast] == [t[0] for t in instant]
+    assert warp.check() == ([], [])
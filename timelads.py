@@ -11,34 +11,131 @@
 import os
 import json
 import time
+_IMPORT_T0 = time.perf_counter()
+import heapq
 import shutil
+import tempfile
+import itertools
 import threading
+import argparse
+import signal
 import traceback
 import pathlib
-from datetime import datetime
+import wave
+import struct
+import math
+import re
+import io
+import mmap
+import tarfile
+import hashlib
+import sqlite3
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog, Menu
 
-# audio playback
-import pygame
-from pygame import mixer
-
-# optional: pycaw for Windows session volume control
-PYCAW_OK = True
 try:
-    from comtypes import CLSCTX_ALL
-    from pycaw.pycaw import AudioUtilities, ISimpleAudioVolume
-except Exception:
-    PYCAW_OK = False
+    import fcntl
+except ImportError:    # Windows
+    fcntl = None
 
-# optional: sounddevice + numpy for low-latency mic passthrough
-SOUND_OK = True
-try:
-    import sounddevice as sd
-    import numpy as np
-except Exception:
-    SOUND_OK = False
+# ------------------------ Startup profile ------------------------
+class StartupProfile:
+    # Wall time per startup phase, printed with --profile-startup.
+    def __init__(self):
+        self.enabled = False
+        self.t0 = time.perf_counter()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        # always recorded (a handful of entries); only printed when enabled
+        self.phases.append((name, seconds))
+
+    def report(self, title="startup"):
+        total = time.perf_counter() - self.t0
+        lines = [f"--- {title}: {total * 1000:.1f} ms since import ---"]
+        for name, seconds in self.phases:
+            lines.append(f"{seconds * 1000:9.1f} ms  {name}")
+        return "\n".join(lines)
+
+STARTUP = StartupProfile()
+STARTUP.t0 = _IMPORT_T0
+STARTUP.add("module imports (stdlib + tkinter)", time.perf_counter() - _IMPORT_T0)
+
+# ------------------------ Optional audio deps (lazy) ------------------------
+# pygame, pycaw/comtypes, sounddevice and numpy are imported on first use of the mixer,
+# ducking or mic features, so the window doesn't wait for them.
+pygame = None
+mixer = None
+AudioUtilities = None       # pycaw: Windows session volume control
+ISimpleAudioVolume = None
+sd = None                   # sounddevice: low-latency mic passthrough
+np = None
+_LAZY = {}                  # name -> import succeeded?
+
+def _lazy_import(name, loader):
+    ok = _LAZY.get(name)
+    if ok is None:
+        with STARTUP.phase(f"import {name}"):
+            try:
+                loader()
+                ok = True
+            except Exception:
+                ok = False
+        _LAZY[name] = ok
+    return ok
+
+def _import_pygame():
+    global pygame, mixer
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import pygame as _pygame
+    from pygame import mixer as _mixer
+    pygame, mixer = _pygame, _mixer
+
+def _import_pycaw():
+    global AudioUtilities, ISimpleAudioVolume
+    import comtypes  # noqa: F401  (initializes COM for this thread)
+    from pycaw.pycaw import AudioUtilities as _au, ISimpleAudioVolume as _isav
+    AudioUtilities, ISimpleAudioVolume = _au, _isav
+
+def _import_numpy():
+    global np
+    import numpy as _np
+    np = _np
+
+def _import_sounddevice():
+    global sd
+    import sounddevice as _sd
+    sd = _sd
+
+def load_pygame():
+    # required for playback: raise so callers can report the real error
+    if not _lazy_import("pygame", _import_pygame):
+        _LAZY.pop("pygame", None)
+        _import_pygame()
+    return pygame
+
+def pycaw_available():
+    return _lazy_import("pycaw", _import_pycaw)
+
+def numpy_available():
+    return _lazy_import("numpy", _import_numpy)
+
+def sound_available():
+    # mic passthrough needs both sounddevice and numpy
+    return numpy_available() and _lazy_import("sounddevice", _import_sounddevice)
 
 # ------------------------ Settings / Paths ------------------------
 BASE_DIR = pathlib.Path(__file__).parent.resolve()
@@ -65,52 +162,3485 @@ HEADER_FONT = ("Segoe UI", 12, "bold")
 H2_FONT = ("Segoe UI", 11, "bold")
 TREE_HEADING_FONT = ("Segoe UI", 11, "bold")
 TREE_FONT = ("Segoe UI", 10)
+TABLE_PAGE = 200    # media rows materialized at a time
+
+# ------------------------ Utility Helpers ------------------------
+def safe_load_json(path, default):
+    try:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception:
+        return default
+    return default
+
+# read once at startup: os.umask() can only be queried by setting it, which races other threads
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+def atomic_write_text(path, text):
+    # temp file in the same folder + fsync + rename: readers see the old or the new file, never half
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp makes the file 0600: keep the target's mode, or the umask default for new files
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except OSError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+def safe_save_json(path, data):
+    try:
+        atomic_write_text(path, json.dumps(data, indent=4, ensure_ascii=False))
+        return True
+    except Exception as e:
+        print("save json error:", e)
+        return False
+
+SAVE_DEBOUNCE = 0.5     # quiet time before a burst of edits is written
+SAVE_MAX_DELAY = 5.0    # ...but never hold a dirty file longer than this
+
+class DebouncedJsonWriter:
+    # Coalesces save requests for one JSON file into a single atomic write on a background
+    # thread, once requests have been quiet for `delay` seconds. `snapshot()` returns the data.
+    def __init__(self, path, snapshot, delay=SAVE_DEBOUNCE, max_delay=SAVE_MAX_DELAY):
+        self.path = path
+        self._snapshot = snapshot
+        self._delay = delay
+        self._max_delay = max_delay
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._dirty_since = None
+        self._last_request = None
+        self._closed = False
+        self._thread = None
+        self.writes = 0
+
+    def request(self):
+        with self._cond:
+            now = time.monotonic()
+            if self._dirty_since is None:
+                self._dirty_since = now
+            self._last_request = now
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="json-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def flush(self):
+        # write now if anything is pending (menu "Salvar Tudo", shutdown)
+        with self._cond:
+            pending = self._dirty_since is not None
+            self._dirty_since = self._last_request = None
+        if pending:
+            self._write()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._dirty_since is None:
+                        self._cond.wait()
+                        continue
+                    now = time.monotonic()
+                    due = min(self._last_request + self._delay, self._dirty_since + self._max_delay)
+                    if now >= due:
+                        break
+                    self._cond.wait(due - now)
+                if self._closed:
+                    self._thread = None
+                    return
+                self._dirty_since = self._last_request = None
+            self._write()
+
+    def _write(self):
+        with self._io_lock:
+            text = None
+            for _ in range(5):
+                try:
+                    text = json.dumps(self._snapshot(), indent=4, ensure_ascii=False)
+                    break
+                except RuntimeError:
+                    # edited on another thread mid-serialization; that edit requested a save too
+                    time.sleep(0.01)
+            if text is None:
+                self.request()
+                return
+            try:
+                atomic_write_text(self.path, text)
+                self.writes += 1
+            except Exception as e:
+                print("Erro salvando JSON:", e)
+
+class InstanceLock:
+    # Advisory lock on "<playlists>.lock", held for its whole life by the program that owns
+    # playlists.json (the GUI), so other writers can tell. Never blocks; the OS drops the
+    # lock with the process.
+    def __init__(self, path):
+        self.path = path + ".lock"
+        self._f = None
+
+    def acquire(self):
+        try:
+            f = open(self.path, "a+b")
+        except OSError:
+            return False
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        self._f = f
+        return True
+
+    def release(self):
+        if self._f is not None:
+            self._f.close()     # closing drops the lock on both platforms
+            self._f = None
+
+def _media_key(path):
+    return os.path.normcase(os.path.abspath(path)) if path else ""
+
+# ------------------------ Media store ------------------------
+# Audio is kept once under avisos/.store/<2 hex>/<digest><ext>, keyed by content hash. Playlist
+# entries keep their original "path" (the name shown in the UI) plus the blob "hash";
+# playback and exports use the blob. Blobs are reflinked in where the filesystem can (no extra
+# disk space) and copied otherwise; never hardlinked from the source, which stays editable.
+# Blobs are the canonical copy and read-only, so exports hardlink them (a plain copy only
+# across volumes) without an edit in an export folder reaching the store. Entries also keep
+# the source's "mtime"/"size" at hashing time, so a file replaced at the same path is hashed again.
+MEDIA_STORE = str(BASE_DIR / "avisos" / ".store")
+HASH_CHUNK = 1024 * 1024
+BLOB_MODE = 0o444
+INGEST_INTERVAL = 60   # seconds between checks of the sources for edits
+
+def valid_digest(value):
+    return isinstance(value, str) and re.fullmatch(r"[0-9a-f]{64}", value) is not None
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+def _reflink(src, dst):
+    # copy-on-write clone (btrfs/xfs); no-op elsewhere
+    if fcntl is None or not hasattr(fcntl, "ioctl"):
+        return False
+    FICLONE = 0x40049409
+    try:
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except Exception:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+def clone_or_copy(src, dst):
+    # reflink, then a plain copy. Returns how the file got there.
+    if _reflink(src, dst):
+        return "reflink"
+    shutil.copy2(src, dst)
+    return "copy"
+
+def link_or_clone(src, dst):
+    # hardlink (same volume, NTFS included), else clone_or_copy. Only for read-only blobs.
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        return clone_or_copy(src, dst)
+
+def _remove(path):
+    # os.remove that also takes read-only files on Windows
+    try:
+        os.remove(path)
+    except PermissionError:
+        if os.name != "nt":
+            raise
+        os.chmod(path, 0o666 & ~_UMASK)
+        os.remove(path)
+
+def _writable(path):
+    return bool(os.stat(path).st_mode & 0o222)
+
+class MediaStore:
+    def __init__(self, root=MEDIA_STORE):
+        self.root = root
+        self._lock = threading.Lock()
+        self._digests = {}  # media key -> (mtime, size, digest)
+        self._found = {}    # digest -> blob path
+        self._absent = set()    # digests looked up and not stored (find without check)
+
+    def blob_path(self, digest, ext=""):
+        return os.path.join(self.root, digest[:2], digest + ext.lower())
+
+    def owns(self, path):
+        try:
+            return os.path.commonpath([os.path.abspath(path), os.path.abspath(self.root)]) == os.path.abspath(self.root)
+        except ValueError:
+            return False    # other drive
+
+    def find(self, digest, check=True):
+        # blob file for a digest, whatever its extension. check=False answers from what was
+        # already looked up (hot paths); the store itself keeps that in step.
+        if not valid_digest(digest):
+            return None
+        path = self._found.get(digest)
+        if path and (not check or os.path.exists(path)):
+            return path
+        if not check and digest in self._absent:
+            return None
+        folder = os.path.join(self.root, digest[:2])
+        try:
+            for name in os.listdir(folder):
+                if name.startswith(digest) and not name.endswith(".part"):
+                    self._found[digest] = path = os.path.join(folder, name)
+                    self._absent.discard(digest)
+                    return path
+        except OSError:
+            pass
+        self._absent.add(digest)
+        return None
+
+    def digest(self, path):
+        # hashes once per (mtime, size) of the file
+        st = os.stat(path)
+        key = _media_key(path)
+        with self._lock:
+            known = self._digests.get(key)
+        if known and known[0] == st.st_mtime and known[1] == st.st_size:
+            return known[2]
+        digest = file_digest(path)
+        with self._lock:
+            self._digests[key] = (st.st_mtime, st.st_size, digest)
+        return digest
+
+    def remember(self, path, mtime, size, digest):
+        # digest already known (media library), saves hashing the file again
+        with self._lock:
+            self._digests[_media_key(path)] = (mtime, size, digest)
+
+    def put(self, path):
+        # stores a file, returns its digest
+        digest = self.digest(path)
+        ext = os.path.splitext(path)[1]
+        if self.find(digest) and self.unshare(digest):
+            return digest
+        dst = self.blob_path(digest, ext)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = dst + ".part"
+        try:
+            if os.path.exists(tmp):
+                _remove(tmp)
+            clone_or_copy(path, tmp)
+            os.chmod(tmp, BLOB_MODE)
+            os.replace(tmp, dst)
+            self._found[digest] = dst
+            self._absent.discard(digest)
+        except Exception:
+            try:
+                _remove(tmp)
+            except OSError:
+                pass
+            raise
+        return digest
+
+    def unshare(self, digest):
+        # blobs stored by older versions are writable and may still be hardlinks of the user's
+        # file: give them their own read-only copy, or drop them when an edit in place already
+        # changed the content. Read-only blobs are canonical (their links are exports).
+        # False when the blob is gone.
+        blob = self.find(digest)
+        if not blob:
+            return False
+        try:
+            if not _writable(blob):
+                return True
+            if os.stat(blob).st_nlink <= 1:
+                os.chmod(blob, BLOB_MODE)
+                return True
+            tmp = blob + ".part"
+            shutil.copy2(blob, tmp)
+            if file_digest(tmp) != digest:
+                os.remove(tmp)
+                _remove(blob)
+                self._found.pop(digest, None)
+                return False
+            os.chmod(tmp, BLOB_MODE)
+            _remove(blob)
+            os.replace(tmp, blob)
+            return True
+        except OSError as e:
+            print("Armazenamento: não foi possível separar", os.path.basename(blob), e)
+            return True
+
+    def put_stream(self, digest, ext, f):
+        # stores what f yields if it hashes to digest; a mismatch leaves nothing behind
+        if not valid_digest(digest) or not re.fullmatch(r"(\.[A-Za-z0-9]{1,8})?", ext or ""):
+            raise ValueError(f"hash inválido: {digest!r}")
+        dst = self.blob_path(digest, ext)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = dst + ".part"
+        h = hashlib.sha256()
+        try:
+            with open(tmp, "wb") as out:
+                while True:
+                    chunk = f.read(HASH_CHUNK)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+                    out.write(chunk)
+            if h.hexdigest() != digest:
+                raise ValueError(f"checksum inválido para {digest[:12]}")
+            os.chmod(tmp, BLOB_MODE)
+            os.replace(tmp, dst)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self._found[digest] = dst
+        self._absent.discard(digest)
+        return dst
+
+    def export(self, digest, dst):
+        src = self.find(digest)
+        if not src:
+            raise FileNotFoundError(digest)
+        if os.path.exists(dst):
+            _remove(dst)
+        return link_or_clone(src, dst)
+
+    def blobs(self):
+        out = {}
+        try:
+            folders = os.listdir(self.root)
+        except OSError:
+            return out
+        for folder in folders:
+            full = os.path.join(self.root, folder)
+            if len(folder) != 2 or not os.path.isdir(full):
+                continue
+            for name in os.listdir(full):
+                if not name.endswith(".part"):
+                    out[os.path.splitext(name)[0]] = os.path.join(full, name)
+        return out
+
+    def gc(self, referenced):
+        # drops blobs no playlist references any more; returns (files, bytes) removed
+        removed = freed = 0
+        for digest, path in self.blobs().items():
+            if digest in referenced:
+                continue
+            try:
+                st = os.stat(path)
+                _remove(path)
+            except OSError:
+                continue
+            self._found.pop(digest, None)
+            removed += 1
+            # a blob still linked elsewhere (an export, an old version's source file) gave back no space
+            if st.st_nlink <= 1:
+                freed += st.st_size
+        for folder in os.listdir(self.root) if os.path.isdir(self.root) else ():
+            try:
+                os.rmdir(os.path.join(self.root, folder))
+            except OSError:
+                pass
+        return removed, freed
+
+# ------------------------ Media library ------------------------
+# Index of the audio files under the library roots (avisos/ by default), kept in
+# media_library.json next to the config. Paths written on another machine
+# ("C:/Users/.../avisos/export_CID\\cid entrada.wav") are matched by blob hash first, then by
+# file name, preferring the candidate whose parent folders match best; no disk access per lookup.
+# Files playlists use from outside the roots are recorded by the scan as well, so "is this path
+# still here" is answered from the index too.
+LIBRARY_ROOTS = [str(BASE_DIR / "avisos")]
+LIBRARY_FILE = "media_library.json"
+AUDIO_EXTS = (".wav", ".mp3", ".ogg", ".flac")
+
+def _path_parts(path):
+    # either separator, whatever OS wrote the path
+    return [p for p in re.split(r"[\\/]+", path or "") if p]
+
+class MediaLibrary:
+    def __init__(self, index_file, roots=None):
+        self.index_file = index_file
+        self.roots = [os.path.abspath(r) for r in (roots or LIBRARY_ROOTS)]
+        self._lock = threading.Lock()
+        self.files = {}     # media key -> [path, size, mtime, digest]
+        self._by_name = {}  # lower-case basename -> [media key, ...]
+        self._by_hash = {}  # digest -> media key
+        self.scans = 0
+
+    def load(self):
+        data = safe_load_json(self.index_file, {})
+        files = data.get("files", {}) if isinstance(data, dict) else {}
+        with self._lock:
+            self.files = {k: list(v) for k, v in files.items() if isinstance(v, list) and len(v) == 4}
+            self._reindex()
+
+    def save(self):
+        with self._lock:
+            data = {"roots": self.roots, "files": dict(self.files)}
+        return safe_save_json(self.index_file, data)
+
+    def _reindex(self):
+        # caller holds the lock
+        self._by_name, self._by_hash = {}, {}
+        for key, (path, _size, _mtime, digest) in self.files.items():
+            self._by_name.setdefault(os.path.basename(path).lower(), []).append(key)
+            if digest:
+                self._by_hash.setdefault(digest, key)
+
+    def scan(self, digest=file_digest, extra=()):
+        # walks the roots, plus the `extra` files outside them; only new or changed files
+        # (size/mtime) are hashed again. Returns (added/changed, removed).
+        seen = {}
+        for path in extra:
+            if not path or self.under_roots(path):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            seen[_media_key(path)] = (path, st.st_size, st.st_mtime)
+        for root in self.roots:
+            for folder, dirs, names in os.walk(root):
+                dirs[:] = [d for d in dirs if not d.startswith(".")]    # .store and friends
+                for name in names:
+                    if not name.lower().endswith(AUDIO_EXTS):
+                        continue
+                    path = os.path.join(folder, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    seen[_media_key(path)] = (path, st.st_size, st.st_mtime)
+        with self._lock:
+            old = dict(self.files)
+        files, changed = {}, 0
+        for key, (path, size, mtime) in seen.items():
+            row = old.get(key)
+            if row and row[1] == size and row[2] == mtime and row[3]:
+                files[key] = row
+                continue
+            try:
+                files[key] = [path, size, mtime, digest(path)]
+                changed += 1
+            except OSError:
+                pass
+        removed = len(set(old) - set(files))
+        with self._lock:
+            self.files = files
+            self._reindex()
+            self.scans += 1
+        return changed, removed
+
+    def known(self, path):
+        return _media_key(path) in self.files
+
+    def under_roots(self, path):
+        key = _media_key(path)
+        return any(key.startswith(_media_key(r) + os.sep) for r in self.roots)
+
+    def path_for_hash(self, digest):
+        key = self._by_hash.get(digest)
+        return self.files[key][0] if key else None
+
+    def digest_for(self, path):
+        row = self.files.get(_media_key(path))
+        return row[3] if row else None
+
+    def resolve(self, path, digest=None):
+        # local file for a (possibly foreign) path, or None
+        with self._lock:
+            if digest and digest in self._by_hash:
+                return self.files[self._by_hash[digest]][0]
+            parts = [p.lower() for p in _path_parts(path)]
+            if not parts:
+                return None
+            best, best_score = None, -1
+            for key in self._by_name.get(parts[-1], ()):
+                cand, _size, _mtime, cand_digest = self.files[key]
+                if digest and cand_digest and cand_digest != digest:
+                    continue    # same name, other content
+                cparts = [p.lower() for p in _path_parts(cand)]
+                score = 0
+                # count matching trailing folders: export_CID\x.wav beats avisos/x.wav
+                while score < min(len(parts), len(cparts)) and parts[-1 - score] == cparts[-1 - score]:
+                    score += 1
+                if score > best_score:
+                    best, best_score = cand, score
+            return best
+
+# ------------------------ Export ------------------------
+EXPORT_WORKERS = 4
+
+def _same_file(src, dst, store=None):
+    # True when dst already holds src's content: same inode, same size+mtime, or same hash
+    try:
+        if os.path.samefile(src, dst):
+            return True
+        s, d = os.stat(src), os.stat(dst)
+    except OSError:
+        return False
+    if s.st_size != d.st_size:
+        return False
+    if int(s.st_mtime) == int(d.st_mtime):
+        return True
+    digest = store.digest if store else file_digest
+    try:
+        return digest(src) == digest(dst)
+    except OSError:
+        return False
+
+class ExportJob:
+    # Copies one playlist's files into a folder on a thread pool. Files already there with the
+    # same content are skipped; playlist_config.json is written only once every file made it.
+    # progress/cancel are polled by the GUI, run() blocks (call it from a worker thread).
+    def __init__(self, folder, items, config, store=None, workers=EXPORT_WORKERS):
+        self.folder = folder
+        self.items = items          # [(src, name), ...]
+        self.config = config        # playlist_config.json content
+        self.store = store
+        self.workers = workers
+        self.done = 0
+        self.skipped = 0
+        self.failed = []
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.ok = False
+
+    @property
+    def total(self):
+        return len(self.items)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _copy(self, src, name):
+        if self.cancelled.is_set():
+            return None
+        dst = os.path.join(self.folder, name)
+        if _same_file(src, dst, self.store):
+            return "skip"
+        tmp = dst + ".part"
+        if os.path.exists(tmp):
+            _remove(tmp)
+        # stored blobs are read-only, so the export can share their data
+        if self.store and self.store.owns(src):
+            link_or_clone(src, tmp)
+        else:
+            clone_or_copy(src, tmp)
+        if os.path.exists(dst):
+            _remove(dst)
+        os.replace(tmp, dst)
+        return "copy"
+
+    def run(self):
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export") as pool:
+                futures = {pool.submit(self._copy, src, name): name for src, name in self.items}
+                for fut in as_completed(futures):
+                    try:
+                        result = fut.result()
+                    except Exception as e:
+                        self.failed.append((futures[fut], str(e)))
+                        continue
+                    if result == "skip":
+                        self.skipped += 1
+                    if result is not None:
+                        self.done += 1
+            if self.cancelled.is_set() or self.failed:
+                return False
+            atomic_write_text(os.path.join(self.folder, "playlist_config.json"),
+                              json.dumps(self.config, indent=4, ensure_ascii=False))
+            self.ok = True
+            return True
+        except Exception as e:
+            self.failed.append(("", str(e)))
+            return False
+        finally:
+            self.finished.set()
+
+# ------------------------ Bundles ------------------------
+# One .tads file per playlist: an uncompressed tar stream holding manifest.json first, then
+# media/<sha256><ext> for every distinct file. Written and read member by member, so neither
+# side ever holds more than a chunk of audio in memory.
+BUNDLE_EXT = ".tads"
+BUNDLE_FORMAT = "timelyads-bundle"
+BUNDLE_VERSION = 1
+
+class BundleError(Exception):
+    pass
+
+class _HashingReader:
+    # file wrapper that hashes what tarfile reads from it
+    def __init__(self, f):
+        self.f = f
+        self.h = hashlib.sha256()
+
+    def read(self, n=-1):
+        data = self.f.read(n)
+        self.h.update(data)
+        return data
+
+def write_bundle(path, manifest, files, progress=None, cancel=None):
+    # files: [(digest, src, member name)] in manifest order. Atomic: a cancelled or failed
+    # export leaves no half bundle behind.
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            with tarfile.open(fileobj=out, mode="w|") as tar:
+                data = json.dumps(manifest, indent=2, ensure_ascii=False).encode("utf-8")
+                info = tarfile.TarInfo("manifest.json")
+                info.size = len(data)
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+                for i, (digest, src, name) in enumerate(files):
+                    if cancel is not None and cancel.is_set():
+                        raise BundleError("cancelado")
+                    info = tarfile.TarInfo(name)
+                    info.size = os.path.getsize(src)
+                    info.mtime = int(os.path.getmtime(src))
+                    with open(src, "rb") as f:
+                        reader = _HashingReader(f)
+                        tar.addfile(info, reader)
+                    if reader.h.hexdigest() != digest:
+                        raise BundleError(f"{os.path.basename(src)} mudou durante a exportação")
+                    if progress:
+                        progress(i + 1, len(files))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+def read_bundle(path, store, progress=None, cancel=None):
+    # streams the media into the store, verifying each checksum. Blobs the store already
+    # has are skipped without being written. Returns (manifest, stats). Blobs stored before
+    # a cancel stay unreferenced until the next garbage collection.
+    stats = {"added": 0, "skipped": 0, "bytes": 0}
+    with tarfile.open(path, mode="r|") as tar:
+        first = tar.next()
+        if first is None or first.name != "manifest.json":
+            raise BundleError("manifest.json não encontrado")
+        try:
+            manifest = json.loads(tar.extractfile(first).read().decode("utf-8"))
+        except Exception as e:
+            raise BundleError(f"manifest inválido: {e}")
+        if manifest.get("format") != BUNDLE_FORMAT:
+            raise BundleError("não é um pacote do TimelyAds")
+        # nothing from the manifest reaches the store before it is checked
+        blobs = manifest.get("blobs", [])
+        if not isinstance(blobs, list) or not all(isinstance(b, dict) for b in blobs):
+            raise BundleError("manifest inválido: blobs")
+        for b in blobs:
+            if not valid_digest(b.get("hash")):
+                raise BundleError(f"manifest inválido: hash {b.get('hash')!r}")
+            if b.get("member") != "media/" + b["hash"] + os.path.splitext(str(b.get("member")))[1] \
+                    or not re.fullmatch(r"(\.[A-Za-z0-9]{1,8})?", os.path.splitext(b["member"])[1]):
+                raise BundleError(f"manifest inválido: {b.get('member')!r}")
+        known = {b["hash"] for b in blobs}
+        for e in manifest.get("playlist", {}).get("files", []):
+            if not isinstance(e, dict) or e.get("hash") not in known:
+                raise BundleError("manifest inválido: arquivo sem hash conhecido")
+        expected = {b["member"]: b for b in blobs}
+        for member in tar:
+            if cancel is not None and cancel.is_set():
+                raise BundleError("cancelado")
+            blob = expected.pop(member.name, None)
+            if blob is None or not member.isfile():
+                continue
+            if blob.get("size") is not None and member.size != blob["size"]:
+                raise BundleError(f"{member.name}: tamanho diferente do manifest")
+            if store.find(blob["hash"]):
+                stats["skipped"] += 1
+            else:
+                try:
+                    store.put_stream(blob["hash"], os.path.splitext(member.name)[1], tar.extractfile(member))
+                except ValueError as e:
+                    raise BundleError(f"{member.name}: {e}")
+                stats["added"] += 1
+                stats["bytes"] += member.size
+            if progress:
+                progress(stats["added"] + stats["skipped"], len(blobs))
+        missing = [b["hash"] for b in expected.values() if not store.find(b["hash"])]
+        if missing:
+            raise BundleError(f"{len(missing)} arquivo(s) ausente(s) no pacote")
+    return manifest, stats
+
+# ------------------------ Clock ------------------------
+# Everything that schedules by wall time asks a clock instead of datetime.now()/time.time():
+# the scheduler, the playback queues, the null/file sinks and the GUI clock. SYSTEM_CLOCK is
+# the real one; WarpClock runs from any start time at N x speed, ManualClock only moves when
+# it is told to (instant replays, the offline renderer).
+class SystemClock:
+    speed = 1.0
+
+    def now(self):
+        return datetime.now()
+
+    def time(self):
+        return time.time()
+
+    def wait(self, event, timeout=None):
+        # event.wait() with the timeout in clock seconds
+        return event.wait(timeout)
+
+SYSTEM_CLOCK = SystemClock()
+
+class WarpClock(SystemClock):
+    def __init__(self, start, speed=1.0):
+        if speed <= 0:
+            raise ValueError("a velocidade deve ser positiva")
+        self.start = start
+        self.speed = float(speed)
+        self._t0 = time.monotonic()
+
+    def now(self):
+        return self.start + timedelta(seconds=(time.monotonic() - self._t0) * self.speed)
+
+    def time(self):
+        return self.now().timestamp()
+
+    def wait(self, event, timeout=None):
+        return event.wait(None if timeout is None else timeout / self.speed)
+
+class ManualClock(SystemClock):
+    # waits never block: whoever drives it steps the engines and advances the time
+    speed = None
+
+    def __init__(self, start):
+        self._now = start
+
+    def now(self):
+        return self._now
+
+    def time(self):
+        return self._now.timestamp()
+
+    def wait(self, event, timeout=None):
+        return event.is_set()
+
+    def set(self, when):
+        self._now = when
+
+    def advance(self, seconds):
+        self._now += timedelta(seconds=seconds)
+
+# ------------------------ Schedule index ------------------------
+MINUTES_PER_DAY = 24 * 60
+
+def _parse_hhmm(value):
+    try:
+        hh, mm = str(value).strip().split(":")
+        hh, mm = int(hh), int(mm)
+    except Exception:
+        return None
+    if not (0 <= hh < 24 and 0 <= mm < 60):
+        return None
+    return hh, mm
+
+def _minute_of_day(value):
+    hhmm = _parse_hhmm(value)
+    return None if hhmm is None else hhmm[0] * 60 + hhmm[1]
+
+class ScheduleIndex:
+    # Compiled schedule: a 1440-slot minute-of-day table of (kind, playlist, media) entries
+    # for active playlists, plus a lazily rebuilt "next non-empty minute" table, so both
+    # "what plays at HH:MM" and "what plays next" are O(1). Patched per media/playlist by
+    # the editors instead of being rebuilt from the nested "HH:MM" dicts.
+    def __init__(self, on_change=None):
+        self._on_change = on_change
+        self._lock = threading.RLock()
+        self.version = 0    # bumped on every change, for analyses cached on the index
+        self._clear()
+
+    def _clear(self):
+        self._slots = [None] * MINUTES_PER_DAY      # minute -> list of entries
+        self._media = {}                            # id(media) -> (pl_name, media, [minutes])
+        self._playlists = {}                        # pl_name -> (minute or None, {id(media)})
+        self._next = None
+        self.count = 0
+
+    # building / patching
+    def build(self, playlists):
+        with self._lock:
+            self._clear()
+            for name, pl in playlists.items():
+                self._add_playlist(name, pl)
+        self._changed()
+
+    def set_playlist(self, name, pl):
+        # (re)index a whole playlist; inactive ones are simply left out
+        with self._lock:
+            self._remove_playlist(name)
+            if pl is not None:
+                self._add_playlist(name, pl)
+        self._changed()
+
+    def remove_playlist(self, name):
+        self.set_playlist(name, None)
+
+    def rename_playlist(self, old, new, pl):
+        with self._lock:
+            self._remove_playlist(old)
+            self._remove_playlist(new)
+            self._add_playlist(new, pl)
+        self._changed()
+
+    def update_media(self, pl_name, media):
+        # after a media's `times` changed
+        with self._lock:
+            self._remove_media(id(media))
+            entry = self._playlists.get(pl_name)
+            if entry is not None and isinstance(media, dict):
+                entry[1].add(id(media))
+                self._add_media(pl_name, media)
+        self._changed()
+
+    def remove_media(self, media):
+        with self._lock:
+            pl_name = self._remove_media(id(media))
+            if pl_name in self._playlists:
+                self._playlists[pl_name][1].discard(id(media))
+        self._changed()
+
+    def _add_playlist(self, name, pl):
+        if not pl.get("active", True):
+            return
+        minute = _minute_of_day(pl.get("time"))
+        if minute is not None:
+            self._put(minute, ("playlist", name, None))
+        ids = set()
+        for m in pl.get("files", []):
+            if isinstance(m, dict):
+                ids.add(id(m))
+                self._add_media(name, m)
+        self._playlists[name] = (minute, ids)
+
+    def _remove_playlist(self, name):
+        entry = self._playlists.pop(name, None)
+        if entry is None:
+            return
+        minute, ids = entry
+        if minute is not None:
+            self._take(minute, lambda e: e[0] == "playlist" and e[1] == name)
+        for key in ids:
+            self._remove_media(key)
+
+    def _add_media(self, pl_name, media):
+        minutes = []
+        for t in media.get("times", []):
+            minute = _minute_of_day(t)
+            if minute is not None:
+                self._put(minute, ("media", pl_name, media))
+                minutes.append(minute)
+        self._media[id(media)] = (pl_name, media, minutes)
+
+    def _remove_media(self, key):
+        entry = self._media.pop(key, None)
+        if entry is None:
+            return None
+        pl_name, media, minutes = entry
+        for minute in set(minutes):
+            self._take(minute, lambda e: e[2] is media)
+        return pl_name
+
+    def _put(self, minute, entry):
+        slot = self._slots[minute]
+        if slot is None:
+            self._slots[minute] = [entry]
+            self._next = None
+        else:
+            slot.append(entry)
+        self.count += 1
+
+    def _take(self, minute, match):
+        slot = self._slots[minute]
+        if not slot:
+            return
+        keep = [e for e in slot if not match(e)]
+        self.count -= len(slot) - len(keep)
+        self._slots[minute] = keep or None
+        if not keep:
+            self._next = None
+
+    def touch(self):
+        # same slots, but an entry's length changed (repeats)
+        self._changed()
+
+    def _changed(self):
+        with self._lock:
+            self.version += 1
+        if self._on_change:
+            self._on_change()
+
+    # queries
+    def at(self, minute):
+        with self._lock:
+            return list(self._slots[minute % MINUTES_PER_DAY] or ())
+
+    def entries(self):
+        # (minute, entry) for the whole day, in time order
+        with self._lock:
+            return [(minute, e) for minute, slot in enumerate(self._slots) if slot for e in slot]
+
+    def next_minute(self, minute):
+        # first non-empty minute-of-day at or after `minute` (wrapping), as
+        # (minute_of_day, minutes_ahead); None when nothing is scheduled
+        with self._lock:
+            if self._next is None:
+                self._rebuild_next()
+            minute %= MINUTES_PER_DAY
+            nxt = self._next[minute]
+            if nxt < 0:
+                return None
+            return nxt, (nxt - minute) % MINUTES_PER_DAY
+
+    def _rebuild_next(self):
+        table = [-1] * MINUTES_PER_DAY
+        nxt = -1
+        # two passes so the end of the day wraps to the first slot of the next one
+        for _ in range(2):
+            for minute in range(MINUTES_PER_DAY - 1, -1, -1):
+                if self._slots[minute]:
+                    nxt = minute
+                table[minute] = nxt
+        self._next = table
+
+# ------------------------ Scheduler ------------------------
+SCHEDULE_MAX_SLEEP = 30.0   # re-check the wall clock at least this often (clock jumps, suspend)
+SCHEDULE_GRACE = 600.0      # events later than this (e.g. after suspend) are skipped, not replayed
+
+def _floor_minute(dt):
+    return dt.replace(second=0, microsecond=0)
+
+def schedule_fires(index, playlists, start, end):
+    # (datetime, kind, playlist, media) the index schedules in [start, end), in time order
+    out = []
+    entries = index.entries()
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        for minute, (kind, pl_name, media) in entries:
+            when = day + timedelta(minutes=minute)
+            if start <= when < end and pl_name in playlists:
+                out.append((when, kind, pl_name, media))
+        day += timedelta(days=1)
+    return out
+
+class ScheduleEngine:
+    # Walks the wall clock minute by minute over a ScheduleIndex: a dedicated thread sleeps
+    # until the next non-empty minute, fires its entries and moves its cursor past it. Empty
+    # minutes are skipped through the index's next-minute table, and a minute that was missed
+    # (stall, busy machine) is still fired late as long as it is within the grace window.
+    # With a trace list every fire is appended as (scheduled, fired, kind, playlist, media).
+    def __init__(self, index, on_fire, grace=SCHEDULE_GRACE, clock=None, trace=None):
+        self.index = index
+        self.clock = clock or SYSTEM_CLOCK
+        self.trace = trace
+        self._on_fire = on_fire
+        self._grace = grace
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # last minute already handled; start one before "now" so an entry for the current
+        # minute still plays on startup, like the old tick did
+        self._cursor = _floor_minute(self.clock.now()) - timedelta(minutes=1)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        # schedule changed: recompute how long to sleep
+        self._wake.set()
+
+    def next_due(self):
+        # (datetime, entries) of the next scheduled minute after the cursor
+        with self._lock:
+            cur = self._cursor + timedelta(minutes=1)
+        hit = self.index.next_minute(cur.hour * 60 + cur.minute)
+        if hit is None:
+            return None
+        minute, ahead = hit
+        return cur + timedelta(minutes=ahead), self.index.at(minute)
+
+    def upcoming(self, within):
+        # entries due in the next `within` seconds (used for preloading, not on the fire path)
+        out = []
+        with self._lock:
+            cur = self._cursor + timedelta(minutes=1)
+        end = self.clock.now() + timedelta(seconds=within)
+        while cur <= end:
+            hit = self.index.next_minute(cur.hour * 60 + cur.minute)
+            if hit is None:
+                break
+            minute, ahead = hit
+            cur += timedelta(minutes=ahead)
+            if cur > end:
+                break
+            out.extend(self.index.at(minute))
+            cur += timedelta(minutes=1)
+        return out
+
+    def _pop_due(self, now):
+        due = []
+        now_minute = _floor_minute(now)
+        with self._lock:
+            cur = self._cursor + timedelta(minutes=1)
+            if now_minute - cur > timedelta(days=1):
+                # long suspend/clock jump: nothing that old is within grace anyway
+                cur = now_minute - timedelta(seconds=self._grace)
+                cur = _floor_minute(cur)
+            while cur <= now_minute:
+                hit = self.index.next_minute(cur.hour * 60 + cur.minute)
+                if hit is None:
+                    break
+                minute, ahead = hit
+                cur += timedelta(minutes=ahead)
+                if cur > now_minute:
+                    break
+                entries = self.index.at(minute)
+                if (now - cur).total_seconds() <= self._grace:
+                    due.extend((cur, e) for e in entries)
+                else:
+                    print("Agenda: eventos atrasados demais ignorados às", cur.strftime("%H:%M"), len(entries))
+                cur += timedelta(minutes=1)
+            self._cursor = max(self._cursor, now_minute)
+            nxt = self._cursor + timedelta(minutes=1)
+        hit = self.index.next_minute(nxt.hour * 60 + nxt.minute)
+        if hit is None:
+            delay = SCHEDULE_MAX_SLEEP
+        else:
+            delay = (nxt + timedelta(minutes=hit[1]) - now).total_seconds()
+        return due, delay
+
+    def step(self):
+        # fire whatever is due at the clock's current time; returns seconds until the next
+        # scheduled minute. _run() loops on it, time-warp replays call it directly.
+        now = self.clock.now()
+        due, delay = self._pop_due(now)
+        for when, (kind, pl_name, media) in due:
+            if self.trace is not None:
+                self.trace.append((when, now, kind, pl_name, media))
+            if self._on_fire is None:
+                continue
+            try:
+                self._on_fire(kind, pl_name, media)
+            except Exception:
+                traceback.print_exc()
+        return delay
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            delay = self.step()
+            self.clock.wait(self._wake, max(0.0, min(delay, SCHEDULE_MAX_SLEEP)))
+
+# ------------------------ Media info (headers only) ------------------------
+# Duration/format straight from the container headers: WAV chunks, MP3 frame header + Xing/
+# VBRI, FLAC STREAMINFO, Ogg last-page granule. Never decodes audio.
+_MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_BITRATES[(2, 3)] = _MP3_BITRATES[(2, 2)]
+_MP3_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 25: [11025, 12000, 8000]}
+
+def _id3v2_size(head):
+    if head[:3] != b"ID3" or len(head) < 10:
+        return 0
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    return 10 + size + (10 if head[5] & 0x10 else 0)
+
+def _wav_info(f, size):
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+        return None
+    fmt = None
+    while True:
+        hdr = f.read(8)
+        if len(hdr) < 8:
+            return None
+        cid, clen = hdr[:4], struct.unpack("<I", hdr[4:])[0]
+        if cid == b"fmt ":
+            body = f.read(clen + (clen & 1))
+            tag, channels, rate, byte_rate, _align, bits = struct.unpack("<HHIIHH", body[:16])
+            fmt = {"codec": "pcm" if tag in (1, 0xFFFE) else ("float" if tag == 3 else f"wav-{tag:#x}"),
+                   "samplerate": rate, "channels": channels, "bits": bits, "byte_rate": byte_rate}
+        elif cid == b"data":
+            if fmt is None or not fmt["byte_rate"]:
+                return None
+            # some writers leave 0/0xFFFFFFFF when streaming: fall back to what's on disk
+            if clen in (0, 0xFFFFFFFF):
+                clen = size - f.tell()
+            fmt["duration"] = min(clen, size - f.tell()) / float(fmt.pop("byte_rate"))
+            return fmt
+        else:
+            f.seek(clen + (clen & 1), os.SEEK_CUR)
+
+def _mp3_frame(b, i):
+    # parsed frame header at b[i:], or None
+    if i + 4 > len(b) or b[i] != 0xFF or (b[i + 1] & 0xE0) != 0xE0:
+        return None
+    ver_bits = (b[i + 1] >> 3) & 3
+    layer = 4 - ((b[i + 1] >> 1) & 3)
+    br_idx = b[i + 2] >> 4
+    sr_idx = (b[i + 2] >> 2) & 3
+    if ver_bits == 1 or layer == 4 or br_idx in (0, 15) or sr_idx == 3:
+        return None
+    version = {3: 1, 2: 2, 0: 25}[ver_bits]
+    kbps = _MP3_BITRATES[(1 if version == 1 else 2, layer)][br_idx]
+    rate = _MP3_RATES[version][sr_idx]
+    pad = (b[i + 2] >> 1) & 1
+    mono = (b[i + 3] >> 6) == 3
+    if layer == 1:
+        length, spf = (12 * kbps * 1000 // rate + pad) * 4, 384
+    else:
+        spf = 1152 if (layer == 2 or version == 1) else 576
+        length = (spf // 8) * kbps * 1000 // rate + pad
+    return {"version": version, "layer": layer, "kbps": kbps, "samplerate": rate,
+            "channels": 1 if mono else 2, "length": length, "spf": spf}
+
+def _mp3_info(f, size):
+    head = f.read(10)
+    start = _id3v2_size(head)
+    f.seek(start)
+    buf = f.read(64 * 1024)
+    for i in range(len(buf) - 4):
+        fr = _mp3_frame(buf, i)
+        if fr is None or fr["length"] <= 0:
+            continue
+        nxt = i + fr["length"]
+        if nxt + 4 <= len(buf) and _mp3_frame(buf, nxt) is None:
+            continue  # false sync inside tag/junk
+        break
+    else:
+        return None
+    info = {"codec": "mp3", "samplerate": fr["samplerate"], "channels": fr["channels"], "bits": 16}
+    # Xing/Info (LAME) or VBRI header in the first frame carries the frame count
+    side = (32 if fr["channels"] == 2 else 17) if fr["version"] == 1 else (17 if fr["channels"] == 2 else 9)
+    frames = None
+    x = i + 4 + side
+    if buf[x:x + 4] in (b"Xing", b"Info") and struct.unpack(">I", buf[x + 4:x + 8])[0] & 1:
+        frames = struct.unpack(">I", buf[x + 8:x + 12])[0]
+    elif buf[i + 36:i + 40] == b"VBRI":
+        frames = struct.unpack(">I", buf[i + 50:i + 54])[0]
+    if frames:
+        info["duration"] = frames * fr["spf"] / float(fr["samplerate"])
+    else:
+        audio = size - (start + i)
+        f.seek(max(0, size - 128))
+        if f.read(3) == b"TAG":
+            audio -= 128
+        info["duration"] = audio * 8 / (fr["kbps"] * 1000.0)
+    return info
+
+def _flac_info(f, size):
+    head = f.read(10)
+    f.seek(_id3v2_size(head))
+    if f.read(4) != b"fLaC":
+        return None
+    block = f.read(4 + 18)
+    if len(block) < 22 or (block[0] & 0x7F) != 0:
+        return None
+    v = int.from_bytes(block[14:22], "big")
+    rate = v >> 44
+    channels = ((v >> 41) & 7) + 1
+    bits = ((v >> 36) & 31) + 1
+    total = v & ((1 << 36) - 1)
+    if not rate:
+        return None
+    return {"codec": "flac", "samplerate": rate, "channels": channels, "bits": bits,
+            "duration": total / float(rate) if total else None}
+
+def _ogg_info(f, size):
+    first = f.read(4096)
+    if first[:4] != b"OggS":
+        return None
+    skip = 0
+    if b"\x01vorbis" in first:
+        j = first.index(b"\x01vorbis") + 7
+        channels, rate = first[j + 4], struct.unpack("<I", first[j + 5:j + 9])[0]
+        codec, clock = "vorbis", rate
+    elif b"OpusHead" in first:
+        j = first.index(b"OpusHead") + 8
+        channels, skip, rate = first[j + 1], struct.unpack("<H", first[j + 2:j + 4])[0], struct.unpack("<I", first[j + 4:j + 8])[0]
+        codec, clock = "opus", 48000
+    else:
+        return None
+    f.seek(max(0, size - 65536))
+    tail = f.read()
+    k = tail.rfind(b"OggS")
+    granule = struct.unpack("<q", tail[k + 6:k + 14])[0] if k >= 0 and k + 14 <= len(tail) else 0
+    return {"codec": codec, "samplerate": rate, "channels": channels, "bits": 16,
+            "duration": max(0, granule - skip) / float(clock) if granule > 0 else None}
+
+_INFO_READERS = {".wav": _wav_info, ".wave": _wav_info, ".mp3": _mp3_info, ".flac": _flac_info,
+                 ".ogg": _ogg_info, ".oga": _ogg_info, ".opus": _ogg_info}
+
+def read_media_info(path):
+    # {"codec", "samplerate", "channels", "bits", "duration"} or None; tries the reader for
+    # the extension first, then the others (mislabelled files)
+    ext = os.path.splitext(path)[1].lower()
+    readers = [_INFO_READERS[ext]] if ext in _INFO_READERS else []
+    readers += [r for r in (_wav_info, _mp3_info, _flac_info, _ogg_info) if r not in readers]
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            for reader in readers:
+                f.seek(0)
+                try:
+                    info = reader(f, size)
+                except (struct.error, IndexError, KeyError, ValueError):
+                    info = None
+                if info:
+                    return info
+    except OSError:
+        pass
+    return None
+
+META_DB = "media_meta.sqlite3"
+META_WORKERS = 2
+META_FIELDS = ("codec", "samplerate", "channels", "bits", "duration", "peak", "loudness", "analyzed")
+
+class MediaInfoCache:
+    # Facts about media files, keyed by path and invalidated by (mtime, size). Rows live in a
+    # SQLite file next to the config and are all loaded into memory on open(), so peek() and
+    # bulk() answer without touching the disk. get() fills in headers on a miss; submit()
+    # queues the slower decode (peak/loudness) on a small worker pool. `version` goes up
+    # whenever a background result lands, for UIs that want to redraw.
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self._items = {}    # media key -> ((mtime, size), info)
+        self._lock = threading.Lock()
+        self._db = None
+        self._pool = None
+        self._pending = set()
+        self.version = 0
+
+    def open(self):
+        if self._db is not None or not self.db_path:
+            return
+        try:
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS media (key TEXT PRIMARY KEY, path TEXT, mtime REAL, size INTEGER, "
+                       + ", ".join(f"{f} {'TEXT' if f == 'codec' else 'REAL'}" for f in META_FIELDS) + ")")
+            rows = db.execute("SELECT key, mtime, size, " + ", ".join(META_FIELDS) + " FROM media").fetchall()
+        except sqlite3.Error as e:
+            print("Metadados: banco indisponível:", e)
+            return
+        with self._lock:
+            self._db = db
+            for key, mtime, size, *values in rows:
+                info = dict(zip(META_FIELDS, values))
+                info["analyzed"] = bool(info["analyzed"])
+                self._items.setdefault(key, ((mtime, size), info))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _store(self, key, path, stamp, info):
+        with self._lock:
+            self._items[key] = (stamp, info)
+            if self._db is None:
+                return
+            try:
+                self._db.execute("INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, " + ", ".join("?" * len(META_FIELDS)) + ")",
+                                 (key, path, stamp[0], stamp[1]) + tuple(info.get(f) for f in META_FIELDS))
+                self._db.commit()
+            except sqlite3.Error as e:
+                print("Metadados: erro gravando:", e)
+
+    def peek(self, path):
+        # last known info, no disk access (may be stale until the next get())
+        hit = self._items.get(_media_key(path)) if path else None
+        return hit[1] if hit else None
+
+    def bulk(self, paths):
+        # {path: info} for many files in one pass over memory; unknown files read their headers
+        out = {}
+        for path in dict.fromkeys(p for p in paths if p):
+            out[path] = self.peek(path) or self.get(path)
+        return out
+
+    def get(self, path):
+        if not path:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = _media_key(path)
+        stamp = (st.st_mtime, st.st_size)
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is not None and hit[0] == stamp:
+                return hit[1]
+        info = read_media_info(path)
+        if info is None:
+            return None
+        info = dict(info, peak=None, loudness=None, analyzed=False)
+        self._store(key, path, stamp, info)
+        return info
+
+    def duration(self, path, default=None):
+        info = self.get(path)
+        dur = info.get("duration") if info else None
+        return default if dur is None else dur
+
+    def submit(self, paths):
+        # analyze files not analyzed yet (or changed) in the background
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=META_WORKERS, thread_name_prefix="meta")
+            for path in dict.fromkeys(p for p in paths if p):
+                key = _media_key(path)
+                if key in self._pending:
+                    continue
+                self._pending.add(key)
+                self._pool.submit(self._analyze, key, path)
+
+    def needs_analysis(self, path):
+        key = _media_key(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        hit = self._items.get(key)
+        return hit is None or hit[0] != (st.st_mtime, st.st_size) or not hit[1].get("analyzed")
+
+    def analyze_batch(self, paths, progress=None, cancel=None, workers=None):
+        # whole-library pass: PCM WAV is decoded and measured in worker processes (one per
+        # core); other formats need the mixer's decoder, which only this process has
+        todo = [p for p in dict.fromkeys(p for p in paths if p) if self.needs_analysis(p)]
+        wav = [p for p in todo if p.lower().endswith((".wav", ".wave"))]
+        wav_set = set(wav)
+        other = [p for p in todo if p not in wav_set]
+        done = 0
+        if wav:
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+                futures = {pool.submit(analyze_media, p): p for p in wav}
+                for fut in as_completed(futures):
+                    if cancel is not None and cancel.is_set():
+                        for f in futures:
+                            f.cancel()
+                        break
+                    path = futures[fut]
+                    try:
+                        info = fut.result()
+                        st = os.stat(path)
+                        self._store(_media_key(path), path, (st.st_mtime, st.st_size), info)
+                    except Exception as e:
+                        print("Metadados: erro analisando", os.path.basename(path), e)
+                    done += 1
+                    if progress:
+                        progress(done, len(todo))
+        for path in other:
+            if cancel is not None and cancel.is_set():
+                break
+            self._analyze(_media_key(path), path)
+            done += 1
+            if progress:
+                progress(done, len(todo))
+        self.version += 1
+        return done
+
+    def _analyze(self, key, path):
+        try:
+            st = os.stat(path)
+            stamp = (st.st_mtime, st.st_size)
+            hit = self._items.get(key)
+            if hit is not None and hit[0] == stamp and hit[1].get("analyzed"):
+                return
+            self._store(key, path, stamp, analyze_media(path))
+            self.version += 1
+        except Exception as e:
+            print("Metadados: erro analisando", os.path.basename(path), e)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+# ------------------------ Loudness ------------------------
+# Peak and integrated loudness (ITU-R BS.1770: K-weighting, 400 ms blocks with 75% overlap,
+# -70 LUFS absolute and -10 LU relative gates). The K-weighting filter is applied per block in
+# the frequency domain, so a whole file is a handful of vectorized FFTs instead of a sample loop.
+LOUDNESS_BLOCK = 0.4        # seconds
+LOUDNESS_OVERLAP = 0.75
+LOUDNESS_CHUNK = 64         # blocks per FFT batch (bounds memory on long files)
+
+def _biquad_power(b, a, w):
+    z = np.exp(-1j * w)
+    num = b[0] + b[1] * z + b[2] * z * z
+    den = a[0] + a[1] * z + a[2] * z * z
+    return np.abs(num / den) ** 2
+
+def _k_weighting(freqs, rate):
+    # |H(f)|^2 of the BS.1770 pre-filter (high shelf) and RLB high-pass at this sample rate
+    w = 2 * np.pi * freqs / rate
+    K = math.tan(math.pi * 1681.974450955533 / rate)
+    Q = 0.7071752369554196
+    Vh = 10 ** (3.999843853973347 / 20)
+    Vb = Vh ** 0.4996667741545416
+    a0 = 1 + K / Q + K * K
+    shelf = _biquad_power([(Vh + Vb * K / Q + K * K) / a0, 2 * (K * K - Vh) / a0, (Vh - Vb * K / Q + K * K) / a0],
+                          [1.0, 2 * (K * K - 1) / a0, (1 - K / Q + K * K) / a0], w)
+    K = math.tan(math.pi * 38.13547087602444 / rate)
+    Q = 0.5003270373238773
+    a0 = 1 + K / Q + K * K
+    highpass = _biquad_power([1.0, -2.0, 1.0], [1.0, 2 * (K * K - 1) / a0, (1 - K / Q + K * K) / a0], w)
+    return shelf * highpass
+
+def measure_loudness(x, rate):
+    # x: float (frames, channels) in [-1, 1]. Returns (peak dBFS, integrated LUFS); None for silence.
+    if x.size == 0:
+        return None, None
+    peak = float(np.max(np.abs(x)))
+    peak_db = 20 * math.log10(peak) if peak > 0 else None
+    block = int(round(LOUDNESS_BLOCK * rate))
+    hop = max(1, int(round(block * (1 - LOUDNESS_OVERLAP))))
+    if len(x) < block:
+        x = np.concatenate([x, np.zeros((block - len(x), x.shape[1]), dtype=x.dtype)])
+    count = 1 + (len(x) - block) // hop
+    weight = _k_weighting(np.fft.rfftfreq(block, 1.0 / rate), rate)
+    # Parseval for rfft: interior bins stand for two
+    weight[1:(block + 1) // 2] *= 2.0
+    weight /= float(block) * block
+    power = np.zeros(count)
+    for c in range(x.shape[1]):
+        frames = np.lib.stride_tricks.sliding_window_view(x[:, c], block)[::hop][:count]
+        for i in range(0, count, LOUDNESS_CHUNK):
+            spec = np.fft.rfft(frames[i:i + LOUDNESS_CHUNK], axis=1)
+            power[i:i + LOUDNESS_CHUNK] += (spec.real ** 2 + spec.imag ** 2) @ weight
+    with np.errstate(divide="ignore"):
+        loud = -0.691 + 10 * np.log10(power)
+    gated = power[loud > -70.0]
+    if gated.size == 0:
+        return peak_db, None
+    relative = -0.691 + 10 * math.log10(gated.mean()) - 10.0
+    gated = power[(loud > -70.0) & (loud > relative)]
+    return peak_db, -0.691 + 10 * math.log10(gated.mean())
+
+NORMALIZE_LUFS = -20.0      # target integrated loudness
+
+def normalization_gain(loudness, target=NORMALIZE_LUFS):
+    # linear gain that brings a file to the target. The mixer can only attenuate
+    # (volumes are 0..1), so files quieter than the target play at full level.
+    if loudness is None:
+        return 1.0
+    return round(min(1.0, 10 ** ((target - loudness) / 20.0)), 4)
+
+def decode_pcm(path):
+    # (float32 frames x channels, rate) or None. PCM WAV is read directly; anything else goes
+    # through pygame's decoder when the mixer is up.
+    try:
+        with wave.open(path, "rb") as w:
+            width, channels, rate = w.getsampwidth(), w.getnchannels(), w.getframerate()
+            raw = w.readframes(w.getnframes())
+        if width == 1:
+            x = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        elif width == 2:
+            x = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+        elif width == 3:
+            b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+            x = (np.where(v >= 1 << 23, v - (1 << 24), v)).astype(np.float32) / float(1 << 23)
+        elif width == 4:
+            x = np.frombuffer(raw, dtype="<i4").astype(np.float32) / float(1 << 31)
+        else:
+            return None
+        return x.reshape(-1, channels), rate
+    except (wave.Error, EOFError, OSError, ValueError):
+        pass
+    if mixer is None or not mixer.get_init():
+        return None
+    rate, size, channels = mixer.get_init()
+    if size != -16:
+        return None
+    try:
+        raw = mixer.Sound(path).get_raw()
+    except Exception:
+        return None
+    return (np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0).reshape(-1, channels), rate
+
+def analyze_media(path):
+    # header facts plus peak/loudness; peak/loudness stay None when the file can't be decoded
+    info = dict(read_media_info(path) or {})
+    info["peak"] = info["loudness"] = None
+    if numpy_available():
+        pcm = decode_pcm(path)
+        if pcm is not None:
+            info["peak"], info["loudness"] = measure_loudness(*pcm)
+            info["analyzed"] = True
+    return info
+
+# ------------------------ Conflict analysis ------------------------
+SATURATION_GAP = 10.0   # seconds; closer than this counts as back-to-back
+
+def analyze_conflicts(spots, saturation_gap=SATURATION_GAP):
+    # spots: iterable of (start_s, length_s, key, label) over one day. One sweep in start
+    # order finds overlaps (a spot starting before the running max end), back-to-back
+    # chains (gap < saturation_gap) and airtime per hour. The day repeats, so the sweep then
+    # goes on into the first spots of the next day against what is still playing at midnight.
+    spots = sorted(spots, key=lambda sp: sp[0])
+    day = MINUTES_PER_DAY * 60.0
+    overlaps, tight = [], []
+    flags = {}
+    airtime = [0.0] * 24
+    run_end, run_spot = None, None
+
+    def check(spot, start):
+        key = spot[2]
+        if start < run_end:
+            overlaps.append((run_spot, spot, run_end - start))
+            flags.setdefault(key, set()).add("overlap")
+            flags.setdefault(run_spot[2], set()).add("overlap")
+        elif start - run_end < saturation_gap:
+            tight.append((run_spot, spot, start - run_end))
+            flags.setdefault(key, set()).add("tight")
+            flags.setdefault(run_spot[2], set()).add("tight")
+
+    for spot in spots:
+        start, length, key, _label = spot
+        end = start + length
+        if run_end is not None:
+            check(spot, start)
+        if run_end is None or end > run_end:
+            run_end, run_spot = end, spot
+        # split the spot across the hours it covers (wrapping past midnight)
+        t = start
+        while t < end:
+            hour_end = (int(t // 3600) + 1) * 3600
+            airtime[int(t // 3600) % 24] += min(end, hour_end) - t
+            t = hour_end
+    # past midnight: only against the night's run, pairs within the morning were found above
+    for spot in spots:
+        if run_end is None or spot[0] + day - run_end >= saturation_gap:
+            break
+        if spot is not run_spot:
+            check(spot, spot[0] + day)
+    return {"overlaps": overlaps, "tight": tight, "airtime": airtime, "flags": flags}
+
+# ------------------------ Schedule generator ------------------------
+GEN_DAY_START = 6 * 60      # "Gerar Novo" window bounds (minute of day), see distrib_scale
+GEN_DAY_END = 18 * 60
+GEN_MIN_GAP = 60.0          # seconds of silence kept after each generated spot
+DEFAULT_SPOT_SECONDS = 30.0 # when a file's length can't be read
+
+def minutes_to_hhmm(minute):
+    return "%02d:%02d" % divmod(int(minute) % MINUTES_PER_DAY, 60)
+
+def generation_window(span_hours):
+    # the slider sets how many hours around midday the spots are spread over
+    half = int(round(float(span_hours) * 30))
+    return max(GEN_DAY_START, 12 * 60 - half), min(GEN_DAY_END, 12 * 60 + half)
+
+def generate_schedule(seconds, count, window, busy=None, min_gap=GEN_MIN_GAP):
+    # Spread `count` plays of every item across window=(start, end) minutes, in one batched
+    # NumPy pass. seconds[i] is how long one play of item i lasts (duration x loops); busy is
+    # an optional 1440-bool array of minutes already taken by other playlists. Returns
+    # (per-item sorted minute arrays, number of plays that didn't fit).
+    n = len(seconds)
+    start, end = window
+    if n == 0 or count < 1 or end <= start:
+        return [np.zeros(0, dtype=np.int64) for _ in range(n)], 0
+    item = np.tile(np.arange(n), count)                     # round-robin interleave
+    total = item.size
+    occ = np.ceil((np.asarray(seconds, dtype=float) + min_gap) / 60.0).astype(np.int64)
+    occ = np.maximum(occ, 1)[item]                          # minutes each play occupies
+    t = start + ((np.arange(total) + 0.5) * (end - start) / total).astype(np.int64)
+
+    # minutes a play may not touch: other playlists, and everything outside the window
+    size = MINUTES_PER_DAY + 1
+    blocked = np.zeros(size, dtype=bool)
+    if busy is not None:
+        blocked[:MINUTES_PER_DAY] |= np.asarray(busy, dtype=bool)
+    blocked[:start] = True
+    blocked[end:] = True
+    ar = np.arange(size)
+    next_blocked = np.minimum.accumulate(np.where(blocked, ar, size)[::-1])[::-1]
+    free_run = next_blocked - ar                            # free minutes starting here
+    fits = {int(L): np.flatnonzero(free_run >= L) for L in np.unique(occ)}
+
+    csum = np.concatenate(([0], np.cumsum(occ)[:-1]))
+    for _ in range(16):
+        # push each play past the end of the previous one (cumulative max), then forward
+        # to the first free stretch long enough for it; repeat until both hold
+        t = np.maximum.accumulate(t - csum) + csum
+        moved = np.full(total, size, dtype=np.int64)
+        for L, ok_starts in fits.items():
+            sel = occ == L
+            pos = np.searchsorted(ok_starts, t[sel])
+            found = pos < ok_starts.size
+            moved_sel = np.full(pos.size, size, dtype=np.int64)
+            moved_sel[found] = ok_starts[pos[found]]
+            moved[sel] = moved_sel
+        if np.array_equal(moved, t):
+            break
+        t = moved
+    placed = (t < size) & (free_run[np.minimum(t, size - 1)] >= occ)
+    out = [np.sort(t[(item == i) & placed]) for i in range(n)]
+    return out, int(total - placed.sum())
+
+# ------------------------ Playback queue ------------------------
+PRIORITY_MANUAL = 0      # "Tocar Agora"
+PRIORITY_SCHEDULED = 1   # media `times`
+PRIORITY_PLAYLIST = 2    # whole playlist at its `time`
+
+# seconds an item may wait in the queue before it is dropped (None = never expires)
+QUEUE_MAX_WAIT = {
+    PRIORITY_MANUAL: None,
+    PRIORITY_SCHEDULED: 15 * 60.0,
+    PRIORITY_PLAYLIST: 30 * 60.0,
+}
+
+# PlaybackQueue.put() results; a duplicate that changes nothing returns None
+QUEUE_ADDED = "added"
+QUEUE_MERGED = "merged"     # same file already waiting: its priority/repeats were raised
+
+class PlaybackQueue:
+    # Priority queue (lower number first, FIFO within a level) with de-duplication by file
+    # and a per-priority expiry. Thread-safe; get() blocks until an item is ready.
+    # `clock` gives the current time in seconds (the offline renderer passes a simulated one).
+    def __init__(self, max_wait=None, on_expired=None, clock=time.time):
+        self._max_wait = dict(QUEUE_MAX_WAIT if max_wait is None else max_wait)
+        self._clock = clock
+        self._on_expired = on_expired
+        self._heap = []
+        self._pending = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, path, repeats=1, priority=PRIORITY_SCHEDULED, gain=1.0):
+        key = _media_key(path)
+        now = self._clock()
+        with self._cond:
+            old = self._pending.get(key)
+            if old is not None:
+                # same file already waiting: keep one entry, with the best priority/repeats
+                if priority >= old["priority"] and repeats <= old["repeats"]:
+                    return None
+                old["removed"] = True
+                priority = min(priority, old["priority"])
+                repeats = max(repeats, old["repeats"])
+                queued_at = old["queued_at"]
+            else:
+                queued_at = now
+            wait = self._max_wait.get(priority)
+            item = {"path": path, "repeats": max(1, int(repeats)), "priority": priority, "gain": gain,
+                    "queued_at": queued_at, "expires_at": (queued_at + wait) if wait else None,
+                    "removed": False}
+            self._pending[key] = item
+            heapq.heappush(self._heap, (priority, next(self._seq), item))
+            self._cond.notify()
+            return QUEUE_ADDED if old is None else QUEUE_MERGED
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else self._clock() + timeout
+        with self._cond:
+            while not self._closed:
+                while self._heap:
+                    _prio, _seq, item = heapq.heappop(self._heap)
+                    if item["removed"]:
+                        continue
+                    self._pending.pop(_media_key(item["path"]), None)
+                    if item["expires_at"] is not None and self._clock() > item["expires_at"]:
+                        if self._on_expired:
+                            self._on_expired(item)
+                        continue
+                    return item
+                remaining = None if deadline is None else deadline - self._clock()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return None
+
+    def clear(self):
+        with self._cond:
+            self._heap = []
+            self._pending = {}
+
+    def close(self):
+        # wakes blocked consumers; get() returns None until reopened
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reopen(self):
+        with self._cond:
+            self._closed = False
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+class PlaybackEngine:
+    # One long-lived consumer thread that serializes everything queued for playback.
+    # on_busy fires when playback starts after being idle, on_idle when the queue drains.
+    # With a sink (see Output zones) the audio goes there instead of the pygame mixer;
+    # source(path) then provides (pcm buffer, rate, channels, seconds).
+    def __init__(self, on_busy=None, on_idle=None, cache=None, sink=None, source=None, name=None, clock=None):
+        self.queue = PlaybackQueue(on_expired=self._expired, clock=(clock or SYSTEM_CLOCK).time)
+        self.cache = cache
+        self.sink = sink
+        self.source = source
+        self.name = name or DEFAULT_ZONE
+        self._on_busy = on_busy
+        self._on_idle = on_idle
+        self._stop = threading.Event()
+        self._interrupt = threading.Event()
+        self._thread = None
+        self._channel = None
+        self._duck_level = 1.0
+        self._gain = 1.0    # volume of the item playing (normalization x media volume)
+        self.is_playing = False
+        self.current = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.queue.reopen()
+        self._thread = threading.Thread(target=self._run, name="playback", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        self._interrupt.set()
+        self.queue.close()
+        if self._thread:
+            self._thread.join(timeout)
+        if self.sink is not None:
+            self.sink.close()
+
+    def enqueue(self, path, repeats=1, priority=PRIORITY_SCHEDULED, gain=1.0):
+        return self.queue.put(path, repeats, priority, gain)
+
+    def _expired(self, item):
+        print(f"Reprodução ({self.name}): descartado (esperou demais na fila):", os.path.basename(item["path"] or ""))
+
+    def _run(self):
+        busy = False
+        while not self._stop.is_set():
+            item = self.queue.get()
+            if item is None:
+                continue
+            if not busy:
+                busy = True
+                self._notify(self._on_busy)
+            self.current = item
+            self.is_playing = True
+            try:
+                self._play(item["path"], item["repeats"], item.get("gain", 1.0))
+            except Exception as e:
+                print("Playback error:", e)
+            finally:
+                self.is_playing = False
+                self.current = None
+            if not len(self.queue):
+                busy = False
+                self._notify(self._on_idle)
+
+    def _play(self, path, repeats, gain=1.0):
+        if self._stop.is_set():
+            return
+        self._interrupt.clear()
+        self._gain = max(0.0, min(1.0, float(gain)))
+        if self.sink is not None:
+            self.sink.play(path, self.source(path), repeats, self.level, self._interrupt)
+            return
+        sound = self.cache.get(path) if self.cache else None
+        if sound is None:
+            # not decodable as a Sound (or no cache): stream it from disk. The mixer only posts
+            # end events through the display's event queue, so this rare path checks coarsely.
+            mixer.music.load(path)
+            mixer.music.set_volume(self._gain * self._duck_level)
+            mixer.music.play(loops=repeats - 1)
+            while mixer.music.get_busy() and not self._interrupt.wait(0.25):
+                pass
+            if self._interrupt.is_set():
+                mixer.music.stop()
+            return
+        # native loop count: repeats are gapless and need no wakeups in between
+        channel = sound.play(loops=repeats - 1)
+        if channel is None:
+            return
+        channel.set_volume(self._gain * self._duck_level)
+        self._channel = channel
+        try:
+            self._wait_channel(channel, sound.get_length() * repeats)
+        finally:
+            self._channel = None
+
+    def _wait_channel(self, channel, duration):
+        # sleep for the known length of the loop, then confirm the channel really finished
+        deadline = time.monotonic() + duration
+        while not self._interrupt.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                self._interrupt.wait(remaining)
+                continue
+            if not channel.get_busy():
+                return
+            # device clock is slightly behind ours: wait out the tail
+            self._interrupt.wait(0.02)
+        channel.stop()
+
+    def level(self):
+        return self._gain * self._duck_level
+
+    def set_duck(self, level):
+        # attenuate our own playback (e.g. while someone talks on the mic); 1.0 = normal
+        self._duck_level = max(0.0, min(1.0, float(level)))
+        try:
+            channel = self._channel
+            if channel is not None:
+                channel.set_volume(self._gain * self._duck_level)
+            elif mixer is not None and self.is_playing:
+                mixer.music.set_volume(self._gain * self._duck_level)
+        except Exception:
+            pass
+
+    def skip(self):
+        # stop the current item; the queue carries on with the next one
+        self._interrupt.set()
+
+    @staticmethod
+    def _notify(cb):
+        if cb:
+            try:
+                cb()
+            except Exception:
+                traceback.print_exc()
+
+# ------------------------ Audio cache ------------------------
+AUDIO_CACHE_MB = 256        # default decoded-PCM budget
+AUDIO_CACHE_MAPS = 512      # transcoded files kept mapped (each holds a file handle)
+PRELOAD_MINUTES = 10        # preload everything due within this window
+PRELOAD_SOUND_MINUTES = 3   # ...as ready Sounds within this one; the rest stays mapped
+PRELOAD_INTERVAL = 60.0     # seconds between preload passes
+
+def _sound_nbytes(sound):
+    # decoded size in the mixer's native layout, without copying the samples out
+    try:
+        freq, fmt, channels = mixer.get_init()
+        return int(sound.get_length() * freq) * channels * (abs(fmt) // 8)
+    except Exception:
+        return 0
+
+class AudioCache:
+    # Decoded pygame Sounds kept in memory under a byte budget, evicting least recently used.
+    # Files the TranscodeCache has ready are first kept as read-only mmaps: they cost page
+    # cache, not heap, and don't count against the budget. pygame copies a buffer into SDL
+    # when a Sound is made from it, so a mapping is turned into a Sound once, by the preloader
+    # for what is due soon (or on a miss), and that Sound then lives in the budget like any
+    # decoded one. Mappings only hold what isn't coming up yet.
+    def __init__(self, budget_mb=AUDIO_CACHE_MB, transcode=None, max_maps=AUDIO_CACHE_MAPS):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.transcode = transcode
+        self.max_maps = max_maps
+        self._items = OrderedDict()   # key -> (sound or mmap, nbytes, mtime)
+        self._bytes = 0
+        self._maps = 0
+        self._mapped_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._preload_stop = threading.Event()
+        self._preload_wake = threading.Event()
+        self._preload_thread = None
+
+    def get(self, path):
+        # Sound for path, loading it on a miss; None if it can't be decoded
+        item = self._lookup(path)
+        if item is not None and not isinstance(item, mmap.mmap):
+            with self._lock:
+                self.hits += 1
+            return item
+        with self._lock:
+            self.misses += 1
+        return self._load(path)
+
+    def preload(self, paths):
+        # upcoming spots end up as ready Sounds, so nothing is copied when they fire
+        for path in paths:
+            if self._preload_stop.is_set():
+                return
+            if not path:
+                continue
+            item = self._lookup(path, touch=False)
+            if item is None or isinstance(item, mmap.mmap):
+                self._load(path)
+
+    def map(self, paths):
+        # keeps transcoded files mapped without building Sounds (no heap). Files with no PCM
+        # yet are only handed to the transcoder; mapping them would mean decoding a Sound here.
+        pending = []
+        for path in paths:
+            if path and self._lookup(path, touch=False) is None and self._load(path, materialize=False) is None:
+                pending.append(path)
+        if pending and self.transcode:
+            self.transcode.submit(pending)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {"items": len(self._items), "bytes": self._bytes, "budget": self.budget,
+                    "maps": self._maps, "mapped_bytes": self._mapped_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": (self.hits / total) if total else 0.0}
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+            self._maps = self._mapped_bytes = 0
+
+    def _lookup(self, path, touch=True):
+        key = _media_key(path)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is None:
+                return None
+            if hit[2] != mtime:
+                # file changed on disk
+                self._drop(key)
+                return None
+            if touch:
+                self._items.move_to_end(key)
+            return hit[0]
+
+    def _load(self, path, materialize=True):
+        key = _media_key(path)
+        try:
+            mtime = os.path.getmtime(path)
+            with self._lock:
+                hit = self._items.get(key)
+            view = hit[0] if hit is not None and hit[2] == mtime and isinstance(hit[0], mmap.mmap) else None
+            pcm = None
+            if view is None and self.transcode:
+                pcm = self.transcode.lookup(path)
+            if pcm:
+                # already in the mixer's layout: no decoding, no resampling
+                view = self.transcode.open_view(pcm)
+                if not materialize:
+                    with self._lock:
+                        if key in self._items:
+                            self._drop(key)
+                        self._items[key] = (view, 0, mtime)
+                        self._maps += 1
+                        self._mapped_bytes += len(view)
+                        while self._maps > self.max_maps:
+                            old = next(k for k, v in self._items.items() if isinstance(v[0], mmap.mmap))
+                            self._drop(old)
+                            self.evictions += 1
+                    return view
+            if view is None and not materialize:
+                return None     # not transcoded yet, see map()
+            if view is not None:
+                # the one copy into SDL; the mapping is dropped once the Sound is cached
+                sound = mixer.Sound(buffer=view)
+                nbytes = len(view)
+            else:
+                sound = mixer.Sound(path)
+                nbytes = _sound_nbytes(sound)
+                if self.transcode:
+                    self.transcode.submit([path], sound)
+        except Exception as e:
+            print("Cache de áudio: não foi possível decodificar", path, e)
+            return None
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+            if nbytes <= self.budget:
+                self._items[key] = (sound, nbytes, mtime)
+                self._bytes += nbytes
+                while self._bytes > self.budget and len(self._items) > 1:
+                    self._drop(next(k for k, v in self._items.items() if not isinstance(v[0], mmap.mmap)))
+                    self.evictions += 1
+        return sound
+
+    def _drop(self, key):
+        # a dropped mmap is not closed here: a player thread may still be copying from it,
+        # it unmaps when the last reference goes
+        item, nbytes, _mtime = self._items.pop(key)
+        self._bytes -= nbytes
+        if isinstance(item, mmap.mmap):
+            self._maps -= 1
+            self._mapped_bytes -= len(item)
+
+    # background preloading of what the scheduler says is coming up
+    def start_preloader(self, source, interval=PRELOAD_INTERVAL, map_source=None):
+        # source() -> paths to have as Sounds, map_source() -> paths to keep mapped
+        if self._preload_thread and self._preload_thread.is_alive():
+            return
+        self._preload_stop.clear()
+        def run():
+            while not self._preload_stop.is_set():
+                try:
+                    if map_source is not None:
+                        self.map(map_source())
+                    self.preload(source())
+                except Exception:
+                    traceback.print_exc()
+                self._preload_wake.wait(interval)
+                self._preload_wake.clear()
+        self._preload_thread = threading.Thread(target=run, name="preload", daemon=True)
+        self._preload_thread.start()
+
+    def poke_preloader(self):
+        self._preload_wake.set()
+
+    def stop_preloader(self):
+        self._preload_stop.set()
+        self._preload_wake.set()
+
+# ------------------------ Transcode cache ------------------------
+# Every media file decoded once into the mixer's own layout (rate/format/channels) and kept
+# as raw PCM under avisos/.pcm/<sha256>.<rate>-<bits><s|u>-<channels>.pcm. The key is the
+# source hash, so an edited file simply gets a new entry; prune() removes the old ones.
+TRANSCODE_DIR = str(BASE_DIR / "avisos" / ".pcm")
+TRANSCODE_CACHE_MB = 2048
+TRANSCODE_PRUNE_BATCH = 16      # conversions after which a drained queue prunes right away
+TRANSCODE_PRUNE_INTERVAL = 600  # seconds; fewer conversions are pruned at most this often
+
+def _mixer_layout():
+    # "44100-16s-2" for the running mixer, None before mixer.init()
+    init = mixer.get_init() if mixer is not None else None
+    if not init:
+        return None
+    freq, size, channels = init
+    return f"{freq}-{abs(size)}{'s' if size < 0 else 'u'}-{channels}"
+
+class TranscodeCache:
+    def __init__(self, store, root=TRANSCODE_DIR, budget_mb=TRANSCODE_CACHE_MB):
+        self.store = store
+        self.root = root
+        self.budget = int(budget_mb * 1024 * 1024)
+        self._queue = []
+        self._queued = set()
+        self._failed = set()    # media keys that could not be decoded, not retried
+        self._cond = threading.Condition()
+        self._thread = None
+        self._unpruned = 0      # conversions since the last prune
+        self._pruned_at = time.monotonic()
+        self.converted = 0
+
+    def pcm_path(self, digest, layout):
+        return os.path.join(self.root, f"{digest}.{layout}.pcm")
+
+    def lookup(self, path):
+        # ready PCM file for a source, or None. Costs a stat (the digest is cached by mtime/size).
+        layout = _mixer_layout()
+        if not layout or not path:
+            return None
+        try:
+            pcm = self.pcm_path(self.store.digest(path), layout)
+        except OSError:
+            return None
+        return pcm if os.path.exists(pcm) else None
+
+    def submit(self, paths, sound=None):
+        # converts in the background; `sound` (already decoded by the caller) saves a decode
+        with self._cond:
+            for path in paths:
+                if not path or _media_key(path) in self._queued or _media_key(path) in self._failed:
+                    continue
+                self._queued.add(_media_key(path))
+                self._queue.append((path, sound))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="transcode", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _due_prune(self, idle=False):
+        # caller holds the lock. A prune lists and stats the whole folder, so only after a
+        # bulk batch, on the interval, or when the thread idles out
+        if not self._unpruned:
+            return False
+        return (idle or self._unpruned >= TRANSCODE_PRUNE_BATCH
+                or time.monotonic() - self._pruned_at >= TRANSCODE_PRUNE_INTERVAL)
+
+    def _prune_unlocked(self):
+        # caller holds the lock; keeps the folder within its budget
+        self._unpruned = 0
+        self._pruned_at = time.monotonic()
+        self._cond.release()
+        try:
+            self.prune()
+        finally:
+            self._cond.acquire()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queue and self._due_prune():
+                    self._prune_unlocked()
+                while not self._queue:
+                    if not self._cond.wait(30):
+                        if self._due_prune(idle=True):
+                            self._prune_unlocked()
+                            continue
+                        self._thread = None
+                        return
+                path, sound = self._queue.pop(0)
+                self._queued.discard(_media_key(path))
+            try:
+                self.convert(path, sound)
+            except Exception as e:
+                with self._cond:
+                    self._failed.add(_media_key(path))
+                print("Transcode: erro convertendo", os.path.basename(path), e)
+
+    def convert(self, path, sound=None):
+        layout = _mixer_layout()
+        if not layout or not os.path.exists(path):
+            return None
+        pcm = self.pcm_path(self.store.digest(path), layout)
+        if os.path.exists(pcm):
+            return pcm
+        raw = (sound or mixer.Sound(path)).get_raw()
+        os.makedirs(self.root, exist_ok=True)
+        tmp = pcm + ".part"
+        with open(tmp, "wb") as f:
+            f.write(raw)
+        os.replace(tmp, pcm)
+        with self._cond:
+            self.converted += 1
+            self._unpruned += 1
+        return pcm
+
+    def open_view(self, pcm):
+        # read-only mapping of a PCM file, with the kernel asked to start reading it in
+        with open(pcm, "rb") as f:
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(view, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+            try:
+                view.madvise(mmap.MADV_WILLNEED)
+            except OSError:
+                pass
+        return view
+
+    def prune(self, keep_digests=None):
+        # drops PCM of sources no longer referenced, then the least recently used past the budget
+        try:
+            names = [n for n in os.listdir(self.root) if n.endswith(".pcm")]
+        except OSError:
+            return 0
+        entries, removed = [], 0
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if keep_digests is not None and name.split(".", 1)[0] not in keep_digests:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+                continue
+            entries.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+        total = sum(e[1] for e in entries)
+        for _t, size, path in sorted(entries):
+            if total <= self.budget:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                total -= size
+            except OSError:
+                pass
+        return removed
+
+# ------------------------ Output zones ------------------------
+# A zone is one output with its own queue and PlaybackEngine, so different floors can play
+# different spots at the same time. The default zone is the pygame mixer; other zones use a
+# sink: a sounddevice output, a WAV file, or nothing at all (null). Sinks play the transcoded
+# PCM (mixer layout, 16-bit) and read the engine's level once per block, so gain and ducking
+# changes apply while a spot plays.
+DEFAULT_ZONE = "Principal"
+SINK_KINDS = ("sounddevice", "file", "null")
+SINK_BLOCK = 2048           # frames per write
+
+class NullSink:
+    # takes as long as the audio would, plays nothing; remembers what it was given
+    name = "null"
+
+    def __init__(self, realtime=True, clock=None):
+        self.realtime = realtime
+        self.clock = clock or SYSTEM_CLOCK
+        self.played = []    # (clock time, path, seconds, repeats, level at start)
+
+    def play(self, path, pcm, repeats, level, interrupt):
+        _buf, _rate, _channels, seconds = pcm
+        self.played.append((self.clock.time(), path, seconds, repeats, level()))
+        if self.realtime:
+            self.clock.wait(interrupt, seconds * repeats)
+
+    def close(self):
+        pass
+
+class FileSink(NullSink):
+    # appends everything played to one WAV file
+    name = "file"
+
+    def __init__(self, path, realtime=True, clock=None):
+        super().__init__(realtime, clock)
+        self.path = path
+        self._wav = None
+        self._fmt = None
+
+    def play(self, path, pcm, repeats, level, interrupt):
+        buf, rate, channels, seconds = pcm
+        self.played.append((self.clock.time(), path, seconds, repeats, level()))
+        if buf is None:
+            print("Zona (arquivo): sem PCM para", os.path.basename(path))
+            return
+        if self._wav is None or self._fmt != (rate, channels):
+            self.close()
+            self._wav = wave.open(self.path, "wb")
+            self._wav.setnchannels(channels)
+            self._wav.setsampwidth(2)
+            self._wav.setframerate(rate)
+            self._fmt = (rate, channels)
+        samples = np.frombuffer(buf, dtype="<i2").reshape(-1, channels)
+        start = self.clock.time()
+        for _ in range(repeats):
+            for i in range(0, len(samples), SINK_BLOCK):
+                if interrupt.is_set():
+                    return
+                self._wav.writeframes(_scaled(samples[i:i + SINK_BLOCK], level()).tobytes())
+        if self.realtime:
+            self.clock.wait(interrupt, max(0.0, seconds * repeats - (self.clock.time() - start)))
+
+    def close(self):
+        if self._wav is not None:
+            try:
+                self._wav.close()
+            except Exception:
+                pass
+            self._wav = None
+
+class SoundDeviceSink:
+    # blocking writes to one PortAudio output; the stream stays open between spots
+    name = "sounddevice"
+
+    def __init__(self, device=None):
+        self.device = device
+        self._stream = None
+        self._fmt = None
+
+    def play(self, path, pcm, repeats, level, interrupt):
+        buf, rate, channels, seconds = pcm
+        if buf is None:
+            print("Zona: sem PCM para", os.path.basename(path))
+            return
+        if self._stream is None or self._fmt != (rate, channels):
+            self.close()
+            self._stream = sd.OutputStream(samplerate=rate, channels=channels, dtype="int16",
+                                           device=self.device, blocksize=SINK_BLOCK)
+            self._stream.start()
+            self._fmt = (rate, channels)
+        samples = np.frombuffer(buf, dtype="<i2").reshape(-1, channels)
+        for _ in range(repeats):
+            for i in range(0, len(samples), SINK_BLOCK):
+                if interrupt.is_set():
+                    return
+                self._stream.write(_scaled(samples[i:i + SINK_BLOCK], level()))
+
+    def close(self):
+        if self._stream is not None:
+            try:
+                self._stream.stop()
+                self._stream.close()
+            except Exception:
+                pass
+            self._stream = None
+
+def _scaled(block, level):
+    if level >= 0.999:
+        return block
+    return (block * level).astype(np.int16)
+
+def make_sink(zone, spec, clock=None):
+    # sink for a zone's config entry; None means the pygame mixer
+    kind = spec.get("sink")
+    if kind == "null":
+        return NullSink(clock=clock)
+    if kind == "file":
+        if not numpy_available():
+            print(f"Zona {zone}: 'numpy' não instalado, usando saída nula")
+            return NullSink(clock=clock)
+        return FileSink(spec.get("path") or str(BASE_DIR / f"zona_{zone}.wav"), clock=clock)
+    if kind == "sounddevice":
+        if not sound_available():
+            print(f"Zona {zone}: 'sounddevice' e 'numpy' não instalados, usando saída nula")
+            return NullSink(clock=clock)
+        return SoundDeviceSink(spec.get("device"))
+    return None
+
+# ------------------------ Session ducking ------------------------
+FADE_RATE = 50              # Hz, tick rate of the fade thread
+SESSION_REFRESH = 2.0       # seconds a session listing stays fresh
+VOLUME_EPSILON = 0.002      # smaller changes are not sent to the OS
+
+class PycawVolumeBackend:
+    # Windows audio sessions through pycaw. sessions() lists what is there right now (cheap
+    # handles); control() does the QueryInterface once, the cache keeps the result.
+    name = "pycaw"
+
+    def thread_init(self):
+        # COM must be initialized on every thread that talks to the sessions
+        try:
+            import comtypes
+            comtypes.CoInitialize()
+        except Exception:
+            pass
+
+    def sessions(self):
+        out = []
+        for s in AudioUtilities.GetAllSessions():
+            pid = getattr(s.Process, "pid", None) if getattr(s, "Process", None) else None
+            try:
+                key = s.InstanceIdentifier
+            except Exception:
+                key = None
+            out.append((key or pid or id(s), pid, s))
+        return out
+
+    def control(self, handle):
+        return handle._ctl.QueryInterface(ISimpleAudioVolume)
+
+    def get_volume(self, ctl):
+        return float(ctl.GetMasterVolume())
+
+    def set_volume(self, ctl, value):
+        ctl.SetMasterVolume(value, None)
+
+class FakeVolumeBackend:
+    # In-process sessions, for running the ducking path on Linux (config "volume_backend": "fake").
+    # Counts the calls the real backend would make.
+    name = "fake"
+
+    def __init__(self, sessions=None):
+        self._lock = threading.Lock()
+        self.volumes = {}   # key -> volume
+        self.pids = {}
+        self.listings = 0
+        self.opens = 0
+        self.sets = 0
+        for key, pid, vol in (sessions or [("app-%d" % i, 10000 + i, 1.0) for i in range(3)]):
+            self.add_session(key, pid, vol)
+
+    def add_session(self, key, pid=None, volume=1.0):
+        with self._lock:
+            self.volumes[key] = float(volume)
+            self.pids[key] = pid
+
+    def remove_session(self, key):
+        with self._lock:
+            self.volumes.pop(key, None)
+            self.pids.pop(key, None)
+
+    def thread_init(self):
+        pass
+
+    def sessions(self):
+        with self._lock:
+            self.listings += 1
+            return [(key, self.pids.get(key), key) for key in self.volumes]
+
+    def control(self, handle):
+        self.opens += 1
+        return handle
+
+    def get_volume(self, ctl):
+        with self._lock:
+            if ctl not in self.volumes:
+                raise KeyError(ctl)
+            return self.volumes[ctl]
+
+    def set_volume(self, ctl, value):
+        with self._lock:
+            if ctl not in self.volumes:
+                raise KeyError(ctl)
+            self.volumes[ctl] = value
+            self.sets += 1
+
+def make_volume_backend(name="auto"):
+    if name == "fake":
+        return FakeVolumeBackend()
+    if name in ("auto", "pycaw") and pycaw_available():
+        return PycawVolumeBackend()
+    if name == "pycaw":
+        print("pycaw not available")
+    return None
+
+class SessionCache:
+    # key -> (pid, control). A refresh lists the sessions and only opens controls for new ones;
+    # vanished sessions are dropped. Used from the fade thread only.
+    def __init__(self, backend, max_age=SESSION_REFRESH):
+        self.backend = backend
+        self.max_age = max_age
+        self._sessions = {}
+        self._stamp = None
+
+    def sessions(self, force=False):
+        now = time.monotonic()
+        if force or self._stamp is None or now - self._stamp >= self.max_age:
+            self._refresh()
+            self._stamp = now
+        return self._sessions
+
+    def invalidate(self):
+        self._stamp = None
+
+    def drop(self, key):
+        self._sessions.pop(key, None)
+
+    def _refresh(self):
+        try:
+            listed = self.backend.sessions()
+        except Exception:
+            return
+        fresh = {}
+        for key, pid, handle in listed:
+            known = self._sessions.get(key)
+            if known is not None:
+                fresh[key] = known
+                continue
+            try:
+                fresh[key] = (pid, self.backend.control(handle))
+            except Exception:
+                pass
+        self._sessions = fresh
+
+class FadeEngine:
+    # Ducks other applications' audio sessions. Several owners ("playback", "voice", "mic") can
+    # hold a duck at once; sessions sit at the lowest held level and go back to their original
+    # volume only when the last owner releases. Fades run on one fixed-rate thread that writes
+    # every changed session per tick, so neither Tk nor back-to-back requests affect them.
+    def __init__(self, backend, rate=FADE_RATE):
+        self.backend = backend
+        self.rate = rate
+        self.cache = SessionCache(backend) if backend else None
+        self._cond = threading.Condition()
+        self._holds = {}    # owner -> (level, exclude_pids)
+        self._fade = 0.5    # seconds, duration of the fade in progress
+        self._dirty = False
+        self._state = {}    # key -> [orig, current, start, target, t0]
+        self._stop = False
+        self._thread = None
+        self.ticks = 0
+
+    @property
+    def available(self):
+        return self.backend is not None
+
+    @property
+    def active(self):
+        with self._cond:
+            return bool(self._holds) or bool(self._state)
+
+    def duck(self, owner, level, fade=0.5, exclude_pids=None):
+        if not self.backend:
+            return False
+        with self._cond:
+            self._holds[owner] = (max(0.0, min(1.0, float(level))), set(exclude_pids or ()) | {os.getpid()})
+            self._kick(fade)
+        return True
+
+    def release(self, owner, fade=1.0):
+        if not self.backend:
+            return False
+        with self._cond:
+            if self._holds.pop(owner, None) is None:
+                return True
+            self._kick(fade)
+        return True
+
+    def release_all(self, timeout=1.0):
+        # shutdown: jump back to the original volumes and wait for the fade thread to write them
+        if not self.backend:
+            return
+        with self._cond:
+            self._holds.clear()
+            self._kick(0.0)
+            end = time.monotonic() + timeout
+            while self._state and self._thread and self._thread.is_alive():
+                left = end - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            self._stop = True
+            self._cond.notify_all()
+
+    def _kick(self, fade):
+        # caller holds the lock
+        self._fade = max(0.0, float(fade))
+        self._dirty = True
+        self._stop = False
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="fade", daemon=True)
+            self._thread.start()
+        self._cond.notify_all()
+
+    def _origins(self, holds, known):
+        # lock not held: lists the sessions (normal cache age) and reads the volume of every
+        # session a hold newly covers. None marks a session whose volume could not be read.
+        sessions = self.cache.sessions()
+        origs = {}
+        for key, (pid, ctl) in sessions.items():
+            if key in known or not any(pid not in excl for _lvl, excl in holds.values()):
+                continue
+            try:
+                origs[key] = self.backend.get_volume(ctl)
+            except Exception:
+                origs[key] = None
+        return sessions, origs
+
+    def _retarget(self, now, sessions, origs):
+        # caller holds the lock; new fades start from wherever each session is right now
+        for key, (pid, ctl) in sessions.items():
+            held = [lvl for lvl, excl in self._holds.values() if pid not in excl]
+            st = self._state.get(key)
+            if st is None:
+                if not held:
+                    continue
+                if key not in origs:
+                    self._dirty = True  # a hold came in after the snapshot, read it next tick
+                    continue
+                orig = origs[key]
+                if orig is None:
+                    continue
+                st = self._state[key] = [orig, orig, orig, orig, now]
+            target = min(held) if held else st[0]
+            st[2], st[3], st[4] = st[1], target, now
+        for key in [k for k in self._state if k not in sessions]:
+            del self._state[key]
+
+    def _run(self):
+        self.backend.thread_init()
+        period = 1.0 / self.rate
+        next_tick = time.monotonic()
+        while True:
+            with self._cond:
+                while not self._stop and not self._dirty and not self._moving():
+                    self._cond.wait()
+                if self._stop:
+                    return
+                dirty, self._dirty = self._dirty, False
+                if dirty:
+                    holds, known = dict(self._holds), set(self._state)
+            if dirty:
+                # session listing and volume reads talk to the OS, so they run unlocked
+                sessions, origs = self._origins(holds, known)
+            with self._cond:
+                now = time.monotonic()
+                if dirty:
+                    self._retarget(now, sessions, origs)
+                    next_tick = now
+                fade = self._fade
+                writes = []
+                for key, st in self._state.items():
+                    orig, cur, start, target, t0 = st
+                    t = 1.0 if fade <= 0 else min(1.0, (now - t0) / fade)
+                    new = start + (target - start) * t
+                    if abs(new - cur) >= VOLUME_EPSILON or (t >= 1.0 and cur != target):
+                        st[1] = target if t >= 1.0 else new
+                        writes.append((key, st[1]))
+                sessions = self.cache._sessions
+            # one batch per tick, outside the lock so duck()/release() never wait on the OS
+            for key, value in writes:
+                entry = sessions.get(key)
+                if entry is None:
+                    continue
+                try:
+                    self.backend.set_volume(entry[1], max(0.0, min(1.0, value)))
+                except Exception:
+                    with self._cond:
+                        self._state.pop(key, None)
+                        self.cache.drop(key)
+            with self._cond:
+                self.ticks += 1
+                if not self._holds:
+                    # fully restored sessions are forgotten, a later duck re-reads their volume
+                    for key in [k for k, st in self._state.items() if st[1] == st[0]]:
+                        del self._state[key]
+                if not self._state:
+                    self._cond.notify_all()
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
+
+    def _moving(self):
+        return any(st[1] != st[3] for st in self._state.values())
+
+# ------------------------ Mic passthrough ------------------------
+MIC_SAMPLERATE = 44100
+MIC_BLOCKSIZE = 256
+MIC_GAIN_SMOOTHING = 0.03   # seconds, time constant of the gain ramp (no zipper noise)
+# voice-activated ducking (sidechain on the mic level)
+MIC_VOX_THRESHOLD_DB = -40.0    # envelope above this = speech
+MIC_VOX_HYSTERESIS_DB = 4.0     # ...and it must drop this much lower to count as silence
+MIC_VOX_ATTACK = 0.005          # seconds
+MIC_VOX_RELEASE = 0.25
+MIC_VOX_HOLD = 0.6              # keep ducking this long after the level falls
+
+class MicPassthrough:
+    # Low-latency mic -> speakers stream. The callback works in place on preallocated buffers
+    # (no per-block array allocation in the audio thread), ramps gain changes sample by sample,
+    # counts xruns from `status` and measures round-trip latency from the stream timestamps.
+    def __init__(self, samplerate=MIC_SAMPLERATE, blocksize=MIC_BLOCKSIZE, channels_out=2):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.channels_out = channels_out
+        self.gain = 1.0                 # target; written by the UI thread
+        self._gain_now = 1.0            # applied; audio thread only
+        self._stream = None
+        self._alloc(max(1, blocksize or 1024))
+        self.reset_stats()
+        # envelope follower / voice detector; on_voice(bool) is called from the audio thread
+        # on every transition and must not block
+        self.on_voice = None
+        self.vox_threshold_db = MIC_VOX_THRESHOLD_DB
+        self.envelope = 0.0
+        self.peak = 0.0
+        self.speaking = False
+        self._hold_left = 0
+
+    def _alloc(self, frames):
+        self._idx = np.arange(1, frames + 1, dtype=np.float32)
+        self._ramp = np.empty(frames, dtype=np.float32)
+
+    def reset_stats(self):
+        self.input_overflows = 0
+        self.input_underflows = 0
+        self.output_underflows = 0
+        self.output_overflows = 0
+        self.errors = 0
+        self.blocks = 0
+        self.measured_latency = None    # seconds, ADC -> DAC, smoothed
+
+    @property
+    def active(self):
+        return self._stream is not None
+
+    def start(self, input_device=None, output_device=None):
+        if self._stream is not None:
+            return
+        device_pair = None
+        if input_device is not None or output_device is not None:
+            device_pair = (input_device, output_device)
+        self._gain_now = self.gain
+        self.reset_stats()
+        self.envelope = self.peak = 0.0
+        self.speaking = False
+        self._hold_left = 0
+        stream = sd.Stream(samplerate=self.samplerate, blocksize=self.blocksize, device=device_pair,
+                           channels=(1, self.channels_out), dtype="float32",
+                           callback=self._callback, latency="low")
+        stream.start()
+        self._stream = stream
+
+    def stop(self):
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.stop()
+                stream.close()
+            except Exception:
+                pass
+        if self.speaking:
+            self.speaking = False
+            self._notify_voice(False)
+
+    def stats(self):
+        nominal = None
+        if self._stream is not None:
+            try:
+                lin, lout = self._stream.latency
+                nominal = lin + lout
+            except Exception:
+                pass
+        return {"xruns": self.input_overflows + self.input_underflows + self.output_underflows + self.output_overflows,
+                "input_overflows": self.input_overflows, "input_underflows": self.input_underflows,
+                "output_underflows": self.output_underflows, "output_overflows": self.output_overflows,
+                "errors": self.errors, "blocks": self.blocks,
+                "latency": self.measured_latency, "nominal_latency": nominal}
+
+    def _callback(self, indata, outdata, frames, time_info, status):
+        try:
+            if status:
+                self.input_overflows += bool(status.input_overflow)
+                self.input_underflows += bool(status.input_underflow)
+                self.output_underflows += bool(status.output_underflow)
+                self.output_overflows += bool(status.output_overflow)
+            self.blocks += 1
+            if frames > self._ramp.size:
+                self._alloc(frames)     # only if the host changes the block size
+            out = outdata[:, 0]
+            src = indata[:, 0]
+            self._follow(src, frames)
+            cur, target = self._gain_now, self.gain
+            if cur == target:
+                np.multiply(src, cur, out=out)
+            else:
+                # one-pole glide towards the target, linear within the block
+                alpha = 1.0 - math.exp(-frames / (self.samplerate * MIC_GAIN_SMOOTHING))
+                nxt = target if abs(target - cur) < 1e-4 else cur + (target - cur) * alpha
+                ramp = self._ramp[:frames]
+                np.multiply(self._idx[:frames], (nxt - cur) / frames, out=ramp)
+                ramp += cur
+                np.multiply(src, ramp, out=out)
+                self._gain_now = nxt
+            np.clip(out, -1.0, 1.0, out=out)
+            if outdata.shape[1] > 1:
+                outdata[:, 1:] = outdata[:, :1]
+            adc, dac = time_info.inputBufferAdcTime, time_info.outputBufferDacTime
+            if adc > 0 and dac > adc:
+                lat = dac - adc
+                prev = self.measured_latency
+                self.measured_latency = lat if prev is None else prev + (lat - prev) * 0.05
+        except Exception:
+            self.errors += 1
+            outdata.fill(0)
+
+    def _follow(self, src, frames):
+        # block RMS/peak (reductions only, no temporaries) into an attack/release envelope,
+        # then a hold timer so short pauses between words don't release the duck
+        rms = math.sqrt(float(np.dot(src, src)) / frames) if frames else 0.0
+        self.peak = max(float(src.max()), -float(src.min())) if frames else 0.0
+        env = self.envelope
+        tau = MIC_VOX_ATTACK if rms > env else MIC_VOX_RELEASE
+        env += (rms - env) * (1.0 - math.exp(-frames / (self.samplerate * tau)))
+        self.envelope = env
+        db = 20.0 * math.log10(env) if env > 1e-9 else -180.0
+        if db >= self.vox_threshold_db:
+            self._hold_left = int(MIC_VOX_HOLD * self.samplerate)
+            if not self.speaking:
+                self.speaking = True
+                self._notify_voice(True)
+        elif self.speaking:
+            if db < self.vox_threshold_db - MIC_VOX_HYSTERESIS_DB:
+                self._hold_left -= frames
+            if self._hold_left <= 0:
+                self.speaking = False
+                self._notify_voice(False)
+
+    def _notify_voice(self, speaking):
+        cb = self.on_voice
+        if cb is not None:
+            try:
+                cb(speaking)
+            except Exception:
+                self.errors += 1
+
+MIC_DUCK_MODES = ("voice", "always")
+VOICE_DUCK_SESSIONS = 0.03      # other apps while someone speaks
+VOICE_DUCK_PLAYBACK = 0.25      # our own scheduled playback while someone speaks
+
+class VoiceDuck:
+    # Applies mic voice-activity to ducking off the audio thread: signal() only records the
+    # state and wakes this worker, which then ducks/restores playback and other sessions.
+    def __init__(self, core):
+        self.core = core
+        self._speaking = False
+        self._applied = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def signal(self, speaking):
+        # audio-thread safe
+        self._speaking = bool(speaking)
+        self._wake.set()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="voice-duck", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._applied:
+            self._apply(False)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            if self._speaking != self._applied:
+                self._apply(self._speaking)
+
+    def _apply(self, speaking):
+        self._applied = speaking
+        core = self.core
+        if speaking:
+            core.set_playback_duck(VOICE_DUCK_PLAYBACK)
+            core.ducker.duck("voice", VOICE_DUCK_SESSIONS, fade=0.06)
+        else:
+            core.set_playback_duck(1.0)
+            # a spot still playing keeps its own hold, sessions only come back after it
+            core.ducker.release("voice", fade=0.5)
+
+# ------------------------ Engine (no Tk) ------------------------
+def migrate_playlists(playlists):
+    # ensure consistent data structure, migrate old fields
+    for pl in playlists.values():
+        for m in pl.get("files", []):
+            if isinstance(m, dict):
+                if "times" not in m:
+                    if "time" in m:
+                        m["times"] = [m.get("time")]
+                        m.pop("time", None)
+                    else:
+                        m["times"] = []
+                if "repeats" not in m:
+                    m["repeats"] = 1
+    return playlists
+
+MEDIA_VOLUME_FIELDS = ("volume", "media_volume")
+
+def media_volume(m):
+    # exports carry the same value in both fields: "media_volume" wins, "volume" is the legacy one
+    value = m.get("media_volume")
+    if value is None:
+        value = m.get("volume", 1.0)
+    return float(value)
+
+def imported_entry(entry, path):
+    # playlist entry from an export's file record. Older exports list times as
+    # [{"time": "HH:MM", "repeats": n}, ...]; the volume fields are carried over as-is.
+    times, repeats = [], entry.get("repeats", 1)
+    for t in entry.get("times", []):
+        if isinstance(t, dict):
+            if t.get("time"):
+                times.append(t["time"])
+            repeats = max(int(repeats), int(t.get("repeats", 1)))
+        elif t:
+            times.append(t)
+    m = {"path": path, "times": times, "repeats": repeats}
+    for key in MEDIA_VOLUME_FIELDS + ("hash",):
+        if entry.get(key) is not None:
+            m[key] = entry[key]
+    return m
+
+def exported_entry(m, name):
+    e = {"path": name, "hash": m.get("hash"), "times": m.get("times", []), "repeats": m.get("repeats",1)}
+    for key in MEDIA_VOLUME_FIELDS:
+        if key in m:
+            e[key] = m[key]
+    return e
+
+class TimelyAdsCore:
+    # Playlists, scheduler, playback queue, audio cache and ducking without any UI.
+    # TimelyAdsApp drives one; so does the --headless daemon.
+    def __init__(self, playlist_file=PLAYLISTS_JSON, config_file=CONFIG_JSON, clock=None):
+        self.playlist_file = playlist_file
+        self.config_file = config_file
+        self.clock = clock or SYSTEM_CLOCK
+        self.playlists = {}
+        self.config = {}
+        self.preload_minutes = PRELOAD_MINUTES
+        self.normalize_lufs = NORMALIZE_LUFS   # None: no loudness normalization
+        self.ducker = FadeEngine(None)
+        self.store = MediaStore()
+        self.transcode = TranscodeCache(self.store)
+        self.audio_cache = AudioCache(transcode=self.transcode)
+        self.media_info = MediaInfoCache(os.path.join(os.path.dirname(os.path.abspath(config_file)), META_DB))
+        self.library = MediaLibrary(os.path.join(os.path.dirname(os.path.abspath(config_file)), LIBRARY_FILE))
+        self._ingest_wake = threading.Event()
+        self._ingest_thread = None
+        self._conflicts = None  # ((index version, metadata version), analyze_conflicts result)
+        self.player = PlaybackEngine(on_busy=self._on_playback_busy, on_idle=self._on_playback_idle,
+                                     cache=self.audio_cache, clock=self.clock)
+        self.zones = {}     # zone name -> PlaybackEngine with a sink (DEFAULT_ZONE is self.player)
+        self.index = ScheduleIndex(on_change=self._on_schedule_change)
+        self.scheduler = ScheduleEngine(self.index, on_fire=self._on_schedule_fire, clock=self.clock)
+        self.voice_duck = VoiceDuck(self)
+        self.playlist_writer = DebouncedJsonWriter(playlist_file, lambda: self.playlists)
+
+    # config / persistence
+    def load_config(self):
+        cfg = safe_load_json(self.config_file, {})
+        self.config = cfg if isinstance(cfg, dict) else {}
+        self.audio_cache.budget = int(float(self.config.get("audio_cache_mb", AUDIO_CACHE_MB)) * 1024 * 1024)
+        self.preload_minutes = float(self.config.get("preload_minutes", PRELOAD_MINUTES))
+        target = self.config.get("normalize_lufs", NORMALIZE_LUFS)
+        self.normalize_lufs = None if target is None else float(target)
+        self.media_info.open()
+        roots = self.config.get("library_roots")
+        if roots:
+            self.library.roots = [os.path.abspath(r) for r in roots]
+        self.load_zones()
+        backend = self.config.get("volume_backend", "auto")
+        if not self.ducker.active and backend != getattr(self.ducker.backend, "name", None):
+            self.ducker = FadeEngine(make_volume_backend(backend))
+
+    def save_config(self):
+        self.config["audio_cache_mb"] = self.audio_cache.budget // (1024 * 1024)
+        self.config["preload_minutes"] = self.preload_minutes
+        safe_save_json(self.config_file, self.config)
+
+    def load_playlists(self):
+        self.playlists = migrate_playlists(safe_load_json(self.playlist_file, {}))
+        if not self.library.files:
+            self.library.load()
+        self.resolve_paths()
+
+    def scan_library(self):
+        # blocking; the GUI runs it on a thread and calls resolve_paths() afterwards
+        extra = [m.get("path") for pl in list(self.playlists.values()) for m in pl.get("files", [])
+                 if isinstance(m, dict)]
+        changed, removed = self.library.scan(self.store.digest, extra)
+        if changed or removed or not os.path.exists(self.library.index_file):
+            self.library.save()
+        for path, size, mtime, digest in list(self.library.files.values()):
+            self.store.remember(path, mtime, size, digest)
+        return changed, removed
+
+    def resolve_paths(self):
+        # points entries whose file isn't here (another machine's layout, moved folders) at
+        # the library's copy; returns how many were changed
+        lib = self.library
+        changed = 0
+        for pl in self.playlists.values():
+            for m in pl.get("files", []):
+                path = m.get("path") if isinstance(m, dict) else None
+                if not path or lib.known(path):
+                    continue    # in the roots, or a file outside them still where it was added from
+                found = lib.resolve(path, m.get("hash"))
+                if found:
+                    m["path"] = found
+                    changed += 1
+        return changed
+
+    def save_playlists(self):
+        # debounced: bursts of edits become one atomic write on the writer thread. The schedule
+        # index is patched by the caller (self.index.update_media etc.), not rebuilt here.
+        self.playlist_writer.request()
+
+    def flush(self):
+        self.playlist_writer.flush()
+
+    def reschedule(self):
+        # full rebuild, after (re)loading the playlists
+        self.index.build(self.playlists)
+
+    def _on_schedule_change(self):
+        self.scheduler.wake()
+        self.audio_cache.poke_preloader()
+
+    # lifecycle
+    def init_mixer(self):
+        # only the mixer subsystem is used; pygame.init() would also bring up video/joystick/etc.
+        load_pygame()
+        with STARTUP.phase("mixer init"):
+            mixer.pre_init(44100, -16, 2, 512)
+            mixer.init()
+
+    def load_zones(self):
+        # (re)creates the zone engines from config["zones"]: {name: {"sink", "device"/"path"}}
+        specs = self.config.get("zones") or {}
+        running = self.player._thread is not None and self.player._thread.is_alive()
+        for name in list(self.zones):
+            if name not in specs or specs[name] != self.zones[name].spec:
+                self.zones.pop(name).stop()
+        for name, spec in specs.items():
+            if name in self.zones or name == DEFAULT_ZONE:
+                continue
+            sink = make_sink(name, spec, self.clock)
+            if sink is None:
+                continue
+            owner = f"playback:{name}"
+            engine = PlaybackEngine(on_busy=lambda o=owner: self._on_playback_busy(o),
+                                    on_idle=lambda o=owner: self._on_playback_idle(o),
+                                    sink=sink, source=self.pcm_source, name=name, clock=self.clock)
+            engine.spec = dict(spec)
+            self.zones[name] = engine
+            if running:
+                engine.start()
+
+    def engines(self):
+        return [self.player] + list(self.zones.values())
+
+    def engine_for(self, pl_name):
+        zone = self.playlists.get(pl_name, {}).get("zone")
+        return self.zones.get(zone, self.player)
+
+    def set_playback_duck(self, level):
+        for engine in self.engines():
+            engine.set_duck(level)
+
+    def pcm_source(self, path):
+        # zone sinks play the transcoded PCM; converted on the spot if it isn't ready yet
+        pcm = self.transcode.lookup(path)
+        if pcm is None and _mixer_layout():
+            try:
+                pcm = self.transcode.convert(path)
+            except Exception as e:
+                print("Zona: não foi possível decodificar", os.path.basename(path), e)
+        init = mixer.get_init() if mixer is not None else None
+        if pcm and init and init[1] == -16 and os.path.getsize(pcm):
+            rate, _size, channels = init
+            view = self.transcode.open_view(pcm)
+            return view, rate, channels, len(view) / float(rate * channels * 2)
+        return None, 0, 0, self.media_info.duration(path, DEFAULT_SPOT_SECONDS)
+
+    def start(self):
+        for engine in self.engines():
+            engine.start()
+        self.index.build(self.playlists)
+        self.scheduler.start()
+        self.audio_cache.start_preloader(lambda: self.upcoming_media_paths(PRELOAD_SOUND_MINUTES),
+                                         map_source=self.upcoming_media_paths)
+
+    def stop(self):
+        self.playlist_writer.close()
+        self.voice_duck.stop()
+        self.scheduler.stop()
+        self.audio_cache.stop_preloader()
+        for engine in self.engines():
+            engine.stop()
+        self.media_info.close()
+        try:
+            self.ducker.release_all()
+        except Exception:
+            pass
+        if mixer is not None:
+            try:
+                mixer.quit()
+            except Exception:
+                pass
+
+    # media store
+    def media_path(self, media):
+        # the stored blob when there is one, else the original file. No disk access: the
+        # entry's hash is trusted, the ingest thread re-hashes sources that changed since.
+        digest = media.get("hash")
+        if digest:
+            blob = self.store.find(digest, check=False)
+            if blob:
+                return blob
+        return media.get("path")
+
+    @staticmethod
+    def _source_changed(media):
+        # True when the entry's file exists and differs from what was hashed (ingest thread only)
+        path = media.get("path")
+        try:
+            st = os.stat(path) if path else None
+        except OSError:
+            return False
+        if st is None:
+            return False
+        return media.get("mtime") != st.st_mtime or media.get("size") != st.st_size
+
+    def ingest(self, media):
+        # puts one entry's file in the store; False if nothing changed or the file is gone
+        path = media.get("path")
+        if not path or not os.path.exists(path):
+            return False
+        st = os.stat(path)
+        digest = self.store.put(path)
+        if (media.get("hash"), media.get("mtime"), media.get("size")) != (digest, st.st_mtime, st.st_size):
+            media["hash"] = digest
+            media["mtime"] = st.st_mtime
+            media["size"] = st.st_size
+            return True
+        return False
+
+    def start_ingest(self):
+        # background pass that stores entries without a blob (old playlists, fresh imports),
+        # and every INGEST_INTERVAL re-stores sources edited since they were hashed
+        self._ingest_wake.set()
+        if self._ingest_thread and self._ingest_thread.is_alive():
+            return
+        def run():
+            while True:
+                self._ingest_wake.wait(INGEST_INTERVAL)
+                self._ingest_wake.clear()
+                changed = False
+                for pl in list(self.playlists.values()):
+                    for m in list(pl.get("files", [])):
+                        if not isinstance(m, dict):
+                            continue
+                        if (m.get("hash") and self.store.find(m["hash"]) and not self._source_changed(m)
+                                and self.store.unshare(m["hash"])):
+                            continue
+                        try:
+                            changed = self.ingest(m) or changed
+                        except Exception as e:
+                            print("Armazenamento: não foi possível adicionar", m.get("path"), e)
+                if changed:
+                    self.save_playlists()
+        self._ingest_thread = threading.Thread(target=run, name="ingest", daemon=True)
+        self._ingest_thread.start()
+
+    def referenced_digests(self):
+        return {m.get("hash") for pl in self.playlists.values() for m in pl.get("files", [])
+                if isinstance(m, dict) and m.get("hash")}
+
+    def collect_garbage(self):
+        keep = self.referenced_digests()
+        self.transcode.prune(keep)
+        return self.store.gc(keep)
+
+    def export_job(self, pl_name, folder):
+        # ExportJob for export_<name>/ inside folder; None if no file of the playlist exists
+        pl = self.playlists[pl_name]
+        items, exported, names = [], [], {}
+        for m in pl.get("files", []):
+            if not isinstance(m, dict):
+                continue
+            src = self.media_path(m)
+            if not src or not os.path.exists(src):
+                continue
+            name = os.path.basename(m.get("path") or src)
+            stem, ext = os.path.splitext(name)
+            n = 2
+            # two different files with the same name must not overwrite each other
+            while name in names and names[name] != (m.get("hash") or src):
+                name = f"{stem} ({n}){ext}"; n += 1
+            if name not in names:
+                names[name] = m.get("hash") or src
+                items.append((src, name))
+            exported.append(exported_entry(m, name))
+        if not items:
+            return None
+        cfg = {"playlist": {"files": exported, "time": pl.get("time", "00:00"), "repeats": pl.get("repeats",1)},
+               "metadata": {"playlist_name": pl_name, "export_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}}
+        return ExportJob(os.path.join(folder, f"export_{pl_name}"), items, cfg, store=self.store)
+
+    def unique_playlist_name(self, name):
+        base = name; i = 1
+        while name in self.playlists:
+            name = f"{base}_{i}"; i += 1
+        return name
+
+    def export_bundle(self, pl_name, path, progress=None, cancel=None):
+        # single-file export; returns the number of entries written
+        pl = self.playlists[pl_name]
+        files, blobs, entries = [], {}, []
+        for m in pl.get("files", []):
+            if not isinstance(m, dict):
+                continue
+            src = self.media_path(m)
+            if not src or not os.path.exists(src):
+                continue
+            digest = m.get("hash") or self.store.digest(src)
+            if digest not in blobs:
+                member = f"media/{digest}{os.path.splitext(src)[1].lower()}"
+                blobs[digest] = {"hash": digest, "member": member, "size": os.path.getsize(src),
+                                 "duration": round(self.media_info.duration(src, 0.0), 3)}
+                files.append((digest, src, member))
+            entry = exported_entry(m, os.path.basename(m.get("path") or src))
+            entry["name"] = entry.pop("path")
+            entry["hash"] = digest
+            entries.append(entry)
+        if not files:
+            raise BundleError("nenhum arquivo da playlist foi encontrado")
+        manifest = {"format": BUNDLE_FORMAT, "version": BUNDLE_VERSION,
+                    "metadata": {"playlist_name": pl_name, "export_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")},
+                    "playlist": {"files": entries, "time": pl.get("time", "00:00"), "repeats": pl.get("repeats",1)},
+                    "blobs": list(blobs.values())}
+        write_bundle(path, manifest, files, progress, cancel)
+        return len(entries)
+
+    def add_bundle_playlist(self, manifest):
+        # the playlist of an imported bundle, once its media is in the store
+        name = self.unique_playlist_name(manifest.get("metadata", {}).get("playlist_name")
+                                         or f"import_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        data = manifest.get("playlist", {})
+        files = [imported_entry(e, e.get("name", e["hash"])) for e in data.get("files", []) if e.get("hash")]
+        self.playlists[name] = {"files": files, "time": data.get("time", "00:00"),
+                                "repeats": data.get("repeats",1), "active": True}
+        self.index.set_playlist(name, self.playlists[name])
+        self.save_playlists()
+        return name
+
+    def import_bundle(self, path, progress=None, cancel=None):
+        manifest, stats = read_bundle(path, self.store, progress, cancel)
+        return self.add_bundle_playlist(manifest), stats
+
+    # playback
+    def media_gain(self, media):
+        # playback volume of an entry: stored normalization gain x its volume
+        gain = media.get("norm_gain")
+        if gain is None:
+            gain = 1.0
+            if self.normalize_lufs is not None:
+                # not normalized yet: use the cached loudness if it is known (no analysis here)
+                info = self.media_info.peek(self.media_path(media))
+                if info and info.get("loudness") is not None:
+                    gain = normalization_gain(info["loudness"], self.normalize_lufs)
+        elif self.normalize_lufs is None:
+            gain = 1.0
+        return gain * media_volume(media)
+
+    def normalize(self, entries, progress=None, cancel=None):
+        # blocking: measures what isn't measured yet, on all cores. Call apply_normalization()
+        # on the thread that owns the playlists afterwards.
+        return self.media_info.analyze_batch([self.media_path(m) for m in entries if isinstance(m, dict)],
+                                             progress, cancel)
+
+    def apply_normalization(self, entries):
+        # stores each entry's gain; returns how many changed
+        changed = 0
+        for m in entries:
+            if not isinstance(m, dict):
+                continue
+            info = self.media_info.peek(self.media_path(m))
+            if not info or not info.get("analyzed"):
+                continue
+            gain = normalization_gain(info.get("loudness"), self.normalize_lufs if self.normalize_lufs is not None else NORMALIZE_LUFS)
+            if m.get("norm_gain") != gain:
+                m["norm_gain"] = gain
+                changed += 1
+        return changed
+
+    def play_media(self, path, repeats=1, priority=PRIORITY_SCHEDULED, gain=1.0, engine=None):
+        if not path:
+            return False
+        engine = engine or self.player
+        result = engine.enqueue(path, repeats, priority, gain)
+        if result is None:
+            print(f"Reprodução ({engine.name}): já está na fila:", os.path.basename(path))
+            return False
+        if result == QUEUE_MERGED:
+            print(f"Reprodução ({engine.name}): já estava na fila, prioridade/repetições atualizadas:",
+                  os.path.basename(path))
+        return True
+
+    def play_playlist(self, playlist_name):
+        engine = self.engine_for(playlist_name)
+        for path, repeats, priority, gain in self.fire_items("playlist", playlist_name, None):
+            self.play_media(path, repeats, priority=priority, gain=gain, engine=engine)
+
+    def fire_items(self, kind, pl_name, media):
+        # (path, repeats, priority, gain) queued when a schedule entry fires; live playback and
+        # the offline renderer both go through here
+        if kind == "playlist":
+            return [(self.media_path(m), m.get("repeats",1), PRIORITY_PLAYLIST, self.media_gain(m))
+                    for m in self.playlists.get(pl_name, {}).get("files", []) if isinstance(m, dict)]
+        return [(self.media_path(media), media.get("repeats",1), PRIORITY_SCHEDULED, self.media_gain(media))]
+
+    # durations / generator support
+    def media_seconds(self, media, infos=None):
+        # how long one play of a media entry lasts (all its loops); infos: a bulk() result
+        if not isinstance(media, dict):
+            return 0.0
+        path = self.media_path(media)
+        if infos is not None and path in infos:
+            info = infos[path]
+            dur = info.get("duration") if info else None
+            dur = DEFAULT_SPOT_SECONDS if dur is None else dur
+        else:
+            dur = self.media_info.duration(path, DEFAULT_SPOT_SECONDS)
+        return dur * max(1, int(media.get("repeats", 1)))
+
+    def entry_seconds(self, kind, pl_name, media, infos=None):
+        if kind == "playlist":
+            # the whole playlist is queued back to back
+            return sum(self.media_seconds(m, infos) for m in self.playlists.get(pl_name, {}).get("files", []))
+        return self.media_seconds(media, infos)
+
+    def cached_seconds(self, media):
+        # single-play duration from the metadata cache only (None if not known yet)
+        info = self.media_info.peek(self.media_path(media))
+        return info.get("duration") if info else None
+
+    def analyze_media(self, entries):
+        # background metadata/loudness and playback-ready PCM for newly added or imported entries
+        paths = [self.media_path(m) for m in entries if isinstance(m, dict)]
+        self.media_info.submit(paths)
+        self.transcode.submit(paths)
+
+    def _scheduled_infos(self):
+        # one bulk metadata lookup for every media the index can fire
+        paths = []
+        for _minute, (kind, pl_name, media) in self.index.entries():
+            if kind == "playlist":
+                paths.extend(self.media_path(m) for m in self.playlists.get(pl_name, {}).get("files", []) if isinstance(m, dict))
+            else:
+                paths.append(self.media_path(media))
+        return self.media_info.bulk(paths)
+
+    def schedule_spots(self):
+        # (start_s, length_s, key, label) for every scheduled play of the active playlists;
+        # key is id(media) for media entries and ("playlist", name) for playlist starts
+        spots = []
+        infos = self._scheduled_infos()
+        for minute, (kind, pl_name, media) in self.index.entries():
+            if kind == "playlist":
+                key, name = ("playlist", pl_name), f"[{pl_name}]"
+            else:
+                key, name = id(media), os.path.basename(media.get("path", ""))
+            spots.append((minute * 60.0, self.entry_seconds(kind, pl_name, media, infos), key,
+                          f"{minutes_to_hhmm(minute)} {name} ({pl_name})"))
+        return spots
+
+    def conflicts(self):
+        # cached until the index or the metadata behind the spot lengths change
+        key = (self.index.version, self.media_info.version)
+        if self._conflicts is None or self._conflicts[0] != key:
+            self._conflicts = (key, analyze_conflicts(self.schedule_spots()))
+        return self._conflicts[1]
+
+    def busy_minutes(self, exclude_playlist=None):
+        # 1440-bool NumPy array of minutes taken by the other active playlists
+        busy = np.zeros(MINUTES_PER_DAY, dtype=bool)
+        infos = self._scheduled_infos()
+        for minute, (kind, pl_name, media) in self.index.entries():
+            if pl_name == exclude_playlist:
+                continue
+            span = max(1, int(-(-self.entry_seconds(kind, pl_name, media, infos) // 60)))
+            busy[minute:minute + span] = True
+            if minute + span > MINUTES_PER_DAY:
+                busy[:minute + span - MINUTES_PER_DAY] = True
+        return busy
+
+    def generate_for_playlist(self, pl_name, count, window, min_gap=GEN_MIN_GAP):
+        # {id(media): [HH:MM, ...]} for every media of pl_name, plus the number not placed
+        files = [m for m in self.playlists[pl_name].get("files", []) if isinstance(m, dict)]
+        seconds = [self.media_seconds(m) for m in files]
+        minutes, unplaced = generate_schedule(seconds, count, window,
+                                              busy=self.busy_minutes(exclude_playlist=pl_name), min_gap=min_gap)
+        plan = {id(m): [minutes_to_hhmm(x) for x in mins] for m, mins in zip(files, minutes)}
+        return files, plan, unplaced
+
+    def upcoming_media_paths(self, minutes=None):
+        # runs on the preload thread
+        paths = []
+        minutes = self.preload_minutes if minutes is None else min(minutes, self.preload_minutes)
+        for kind, pl_name, media in self.scheduler.upcoming(minutes * 60):
+            if kind == "playlist":
+                paths.extend(self.media_path(m) for m in self.playlists.get(pl_name, {}).get("files", []) if isinstance(m, dict))
+            else:
+                paths.append(self.media_path(media))
+        return [p for p in dict.fromkeys(paths) if p]
+
+    def _on_schedule_fire(self, kind, pl_name, media):
+        # scheduler thread; the queue is thread-safe so no hand-over is needed
+        if pl_name not in self.playlists:
+            return
+        engine = self.engine_for(pl_name)
+        for path, repeats, priority, gain in self.fire_items(kind, pl_name, media):
+            self.play_media(path, repeats, priority=priority, gain=gain, engine=engine)
 
-# ------------------------ Utility Helpers ------------------------
-def safe_load_json(path, default):
-    try:
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except Exception:
-        return default
-    return default
+    def _on_playback_busy(self, owner="playback"):
+        # playback thread; the fade engine is thread-safe and never blocks. Each zone holds
+        # its own duck, so sessions come back only when every zone is idle.
+        self.ducker.duck(owner, 0.06, fade=0.7)
 
-def safe_save_json(path, data):
-    try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-            return True
-    except Exception as e:
-        print("save json error:", e)
-        return False
+    def _on_playback_idle(self, owner="playback"):
+        # playback thread, once the queue has drained. Other holds (mic, voice) stay in effect.
+        self.ducker.release(owner, fade=1.5)
 
 # ------------------------ Main App ------------------------
 class TimelyAdsApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, playlist_file=PLAYLISTS_JSON, config_file=CONFIG_JSON):
         super().__init__()
         self.title(APP_TITLE)
         self.geometry("1220x740")
         self.minsize(960, 600)
         self.configure(bg=BG)
 
+        # schedule / playback / ducking engine
+        self.core = TimelyAdsCore(playlist_file, config_file)
+        # tells --import-bundle that this window owns the playlists file
+        self._instance_lock = InstanceLock(playlist_file)
+        if not self._instance_lock.acquire():
+            print("Aviso: outra janela do TimelyAds já usa", playlist_file)
+
         # state
-        self.playlist_file = PLAYLISTS_JSON
-        self.playlists = safe_load_json(self.playlist_file, {})
         self.current_playlist = None
 
-        # playback / audio state
-        self._playback_thread = None
-        self._playback_lock = threading.Lock()
-        self._is_playing = False
-
-        # pycaw duck state
-        self._saved_sessions = {}
-        self._duck_active = False
-
         # mic state
         self._mic_active = False
-        self._mic_stream = None
+        self._mic = None
+        self._mic_blocksize = MIC_BLOCKSIZE
+        self._mic_duck_mode = "voice"
+        self._mic_vox_threshold_db = MIC_VOX_THRESHOLD_DB
         self._mic_gain = 1.0
         self._mic_input_device = None
         self._mic_output_device = None
@@ -119,48 +3649,91 @@ class TimelyAdsApp(tk.Tk):
         self._global_locked = True
 
         # load saved config
-        self._load_config()
-
-        # init audio mixer
-        self._init_mixer()
+        with STARTUP.phase("config load"):
+            self._load_config()
 
         # build UI
-        self._setup_styles()
-        self._build_layout()
-        self._after_ui_setup()
+        with STARTUP.phase("UI build"):
+            self._setup_styles()
+            self._build_layout()
+        with STARTUP.phase("_after_ui_setup (load + migrate)"):
+            self._after_ui_setup()
 
         self.protocol("WM_DELETE_WINDOW", self._on_close)
 
+    @property
+    def playlists(self):
+        return self.core.playlists
+
+    @playlists.setter
+    def playlists(self, value):
+        self.core.playlists = value
+
     # ------------------------ Config / Persistence ------------------------
     def _load_config(self):
-        cfg = safe_load_json(CONFIG_JSON, {})
+        self.core.load_config()
+        cfg = self.core.config
         self._mic_input_device = cfg.get("mic_input_device")
         self._mic_output_device = cfg.get("mic_output_device")
         self._global_locked = bool(cfg.get("global_locked", True))
+        self._mic_blocksize = int(cfg.get("mic_blocksize", MIC_BLOCKSIZE))
+        mode = cfg.get("mic_duck_mode", "voice")
+        self._mic_duck_mode = mode if mode in MIC_DUCK_MODES else "voice"
+        self._mic_vox_threshold_db = float(cfg.get("mic_vox_threshold_db", MIC_VOX_THRESHOLD_DB))
 
     def _save_config(self):
-        cfg = {
+        self.core.config.update({
             "mic_input_device": self._mic_input_device,
             "mic_output_device": self._mic_output_device,
+            "mic_blocksize": self._mic_blocksize,
+            "mic_duck_mode": self._mic_duck_mode,
+            "mic_vox_threshold_db": self._mic_vox_threshold_db,
             "global_locked": self._global_locked
-        }
-        safe_save_json(CONFIG_JSON, cfg)
+        })
+        self.core.save_config()
 
     def _load_playlists(self):
-        self.playlists = safe_load_json(self.playlist_file, {})
+        self.core.load_playlists()
 
     def _save_playlists(self):
-        safe_save_json(self.playlist_file, self.playlists)
+        self.core.save_playlists()
 
     # ------------------------ Audio init ------------------------
     def _init_mixer(self):
         try:
-            pygame.mixer.pre_init(44100, -16, 2, 512)
-            pygame.init()
-            mixer.init()
+            self.core.init_mixer()
         except Exception as e:
             messagebox.showwarning("Áudio", f"Erro iniciando mixer: {e}")
 
+    def _start_audio(self):
+        # runs once the window is up: pygame is only imported here
+        self._init_mixer()
+        self.core.start()
+        self._refresh_media_table()  # the schedule index (conflict flags) exists from here on
+        self._scan_library()
+
+    def _scan_library(self):
+        # incremental rescan of the library roots off the Tk thread, then fix stale paths
+        done = threading.Event()
+        def run():
+            try:
+                self.core.scan_library()
+            except Exception as e:
+                print("Biblioteca: erro na varredura:", e)
+            finally:
+                done.set()
+        threading.Thread(target=run, name="library-scan", daemon=True).start()
+        def poll():
+            if not done.is_set():
+                self.after(200, poll)
+                return
+            if self.core.resolve_paths():
+                self._save_playlists()
+                self._refresh_media_table()
+            self.core.start_ingest()    # the GUI owns playlists.json, so only it adds blob hashes
+            self.core.analyze_media([m for pl in self.playlists.values() for m in pl.get("files", [])])
+        poll()
+
     # ------------------------ Styles ------------------------
     def _setup_styles(self):
         style = ttk.Style(self)
@@ -261,28 +3834,45 @@ class TimelyAdsApp(tk.Tk):
         center_card.rowconfigure(0, weight=1)
         center_card.columnconfigure(0, weight=1)
 
-        cols = ("name", "time", "repeat", "play")
+        cols = ("name", "time", "dur", "repeat", "play")
         self.tree = ttk.Treeview(center_card, columns=cols, show="headings", selectmode="browse", style="Treeview")
         self.tree.heading("name", text="Nome")
         self.tree.heading("time", text="Horários")
+        self.tree.heading("dur", text="Duração")
         self.tree.heading("repeat", text="Repetir")
         self.tree.heading("play", text="▶")
         # column sizes
-        self.tree.column("name", anchor="w", width=640)
+        self.tree.column("name", anchor="w", width=560)
         self.tree.column("time", anchor="center", width=140)
+        self.tree.column("dur", anchor="center", width=80)
         self.tree.column("repeat", anchor="center", width=90)
         self.tree.column("play", anchor="center", width=50)
         self.tree.grid(row=0, column=0, sticky="nsew", padx=8, pady=8)
 
         # scrollbar
         vs = ttk.Scrollbar(center_card, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=vs.set)
+        self._tree_vs = vs
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
         vs.grid(row=0, column=1, sticky="ns")
 
         # Bindings: click on time column opens schedule editor; double-click opens editor
         self.tree.bind("<Button-1>", self._on_tree_click)
         self.tree.bind("<Double-1>", self._on_tree_double_click)
         self.tree.bind("<Button-3>", self._on_tree_right_click)
+        self.tree.tag_configure("overlap", foreground="#ff8a5c")
+        self.tree.tag_configure("tight", foreground="#e6c75a")
+        self._conflicts = {}
+
+        # media table state: stable iid per media, iid <-> index maps, rendered rows
+        self._iid_seq = itertools.count(1)
+        self._media_iids = {}       # row key (see _row_key) -> (iid, media)
+        self._row_index = {}        # iid -> index in the current playlist
+        self._row_media = {}        # iid -> media
+        self._rendered = {}         # iid -> (values, tags) currently in the tree
+        self._rendered_order = []
+        self._table_playlist = None
+        self._table_limit = TABLE_PAGE
+        self._meta_version = 0      # media_info.version the table was drawn with
 
         # Right - Rules
         right = ttk.Frame(self, style="App.TFrame")
@@ -340,19 +3930,8 @@ class TimelyAdsApp(tk.Tk):
 
     # After UI: load data and start ticks
     def _after_ui_setup(self):
-        # ensure consistent data structure, migrate old fields
+        # load (and migrate) playlists
         self._load_playlists()
-        for pl in self.playlists.values():
-            for m in pl.get("files", []):
-                if isinstance(m, dict):
-                    if "times" not in m:
-                        if "time" in m:
-                            m["times"] = [m.get("time")]
-                            m.pop("time", None)
-                        else:
-                            m["times"] = []
-                    if "repeats" not in m:
-                        m["repeats"] = 1
 
         if not self.playlists:
             # create demo playlists
@@ -362,9 +3941,9 @@ class TimelyAdsApp(tk.Tk):
             }
         self._refresh_playlist_list()
         self._refresh_media_table()
-        # clock and schedule ticks
+        # clock tick; mixer, playback consumer and scheduler start after the first paint
         self._clock_tick()
-        self._schedule_tick()
+        self.after_idle(self._start_audio)
 
     # ------------------------ UI helpers ------------------------
     def _update_global_lock_btn(self):
@@ -374,7 +3953,11 @@ class TimelyAdsApp(tk.Tk):
             self._global_lock_btn.config(text="🔓 UNLOCK", style="Neon.TButton")
 
     def _clock_tick(self):
-        self._clock_label.config(text=time.strftime("%H:%M"))
+        self._clock_label.config(text=self.core.clock.now().strftime("%H:%M"))
+        # background metadata results (durations) landed since the last redraw
+        if self.core.media_info.version != self._meta_version:
+            self._meta_version = self.core.media_info.version
+            self._refresh_media_table()
         self.after(1000, self._clock_tick)
 
     # ------------------------ Playlist helpers ------------------------
@@ -382,7 +3965,8 @@ class TimelyAdsApp(tk.Tk):
         self.playlist_list.delete(0, tk.END)
         for name, data in self.playlists.items():
             tag = "ON" if data.get("active", True) else "OFF"
-            self.playlist_list.insert(tk.END, f"{name}   [{tag}]")
+            zone = f" · {data['zone']}" if data.get("zone") else ""
+            self.playlist_list.insert(tk.END, f"{name}   [{tag}]{zone}")
         names = list(self.playlists.keys())
         if not names:
             self.current_playlist = None
@@ -405,34 +3989,119 @@ class TimelyAdsApp(tk.Tk):
         if not self.current_playlist:
             messagebox.showwarning("Aviso", "Nenhuma playlist selecionada.")
             return
-        self.playlists[self.current_playlist]["active"] = not self.playlists[self.current_playlist].get("active", True)
+        pl = self.playlists[self.current_playlist]
+        pl["active"] = not pl.get("active", True)
+        self.core.index.set_playlist(self.current_playlist, pl)
         self._refresh_playlist_list()
         self._save_playlists()
 
     # ------------------------ Media table ------------------------
     def _refresh_media_table(self):
-        for iid in self.tree.get_children():
-            self.tree.delete(iid)
-        if not self.current_playlist:
-            return
-        items = self.playlists[self.current_playlist]["files"]
-        for it in items:
-            if isinstance(it, dict):
-                name = os.path.basename(it.get("path", ""))
-                times = it.get("times", [])
-                time_label = times[0] if len(times) == 1 else ("Múltiplos" if times else "—")
-                repeats = it.get("repeats", 1)
+        # Diff the playlist against the rows already in the Treeview: only rows whose values
+        # changed are touched, and only the first `_table_limit` rows are materialized (more
+        # are added as the list is scrolled). Every media keeps the same iid across refreshes.
+        items = self.playlists[self.current_playlist]["files"] if self.current_playlist in self.playlists else []
+        if self.current_playlist != self._table_playlist:
+            self._table_playlist = self.current_playlist
+            self._table_limit = TABLE_PAGE
+        # conflicts show up inline as soon as a time is edited; the core reruns the sweep only
+        # when the schedule changed
+        self._conflicts = self.core.conflicts() if items else {}
+        flags = self._conflicts.get("flags", {})
+
+        row_index, row_media, live, iids = {}, {}, {}, []
+        for i, it in enumerate(items):
+            key = self._row_key(i, it)
+            iid = self._media_iids.get(key)
+            if iid is None or iid[1] is not it:
+                iid = (f"m{next(self._iid_seq)}", it)
+            live[key] = iid
+            iids.append(iid[0])
+            row_index[iid[0]] = i
+            row_media[iid[0]] = it
+        self._media_iids = live
+        self._row_index = row_index
+        self._row_media = row_media
+
+        desired = []
+        for iid, it in zip(iids, items[:self._table_limit]):
+            desired.append((iid,) + self._media_row(it, flags))
+
+        wanted = {row[0] for row in desired}
+        stale = [iid for iid in self._rendered if iid not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+            for iid in stale:
+                del self._rendered[iid]
+        order = [iid for iid in self._rendered_order if iid in self._rendered]
+        for pos, (iid, values, tags) in enumerate(desired):
+            prev = self._rendered.get(iid)
+            if prev is None:
+                self.tree.insert("", pos, iid=iid, values=values, tags=tags)
+                order.insert(pos, iid)
             else:
-                name = os.path.basename(it)
-                time_label = "—"
-                repeats = 1
-            self.tree.insert("", "end", values=(name, time_label, repeats, "▶"))
+                if prev != (values, tags):
+                    self.tree.item(iid, values=values, tags=tags)
+                if pos >= len(order) or order[pos] != iid:
+                    self.tree.move(iid, "", pos)
+                    order.remove(iid)
+                    order.insert(pos, iid)
+            self._rendered[iid] = (values, tags)
+        self._rendered_order = order
+
+    @staticmethod
+    def _row_key(i, it):
+        # dict entries are their own stable id; legacy string entries can repeat (and the same
+        # string is often the same object), so those are keyed by position
+        return id(it) if isinstance(it, dict) else ("pos", i)
+
+    def _media_row(self, it, flags):
+        tags = ()
+        dur_label = "—"
+        if isinstance(it, dict):
+            name = os.path.basename(it.get("path", ""))
+            secs = self.core.cached_seconds(it)    # metadata cache only, no file access
+            if secs is not None:
+                dur_label = f"{int(secs) // 60}:{int(round(secs)) % 60:02d}" if secs >= 1 else f"{secs:.1f}s"
+
+            times = it.get("times", [])
+            time_label = times[0] if len(times) == 1 else ("Múltiplos" if times else "—")
+            repeats = it.get("repeats", 1)
+            flag = flags.get(id(it), ())
+            if "overlap" in flag:
+                time_label, tags = f"⚠ {time_label}", ("overlap",)
+            elif "tight" in flag:
+                tags = ("tight",)
+        else:
+            name = os.path.basename(it)
+            time_label = "—"
+            repeats = 1
+        return (name, time_label, dur_label, repeats, "▶"), tags
+
+    def _on_tree_scroll(self, first, last):
+        self._tree_vs.set(first, last)
+        # near the bottom of what is materialized: render the next page
+        total = len(self._row_index)
+        if float(last) > 0.9 and self._table_limit < total:
+            self._table_limit += TABLE_PAGE
+            self.after_idle(self._refresh_media_table)
+
+    def _media_conflict_lines(self, media):
+        # human-readable overlaps involving one media entry (schedule editor)
+        lines = []
+        for a, b, secs in self._conflicts.get("overlaps", []):
+            if a[2] == id(media) or b[2] == id(media):
+                lines.append(f"⚠ {a[3]} × {b[3]}: {secs:.0f}s sobrepostos")
+        for a, b, secs in self._conflicts.get("tight", []):
+            if a[2] == id(media) or b[2] == id(media):
+                lines.append(f"• {a[3]} → {b[3]}: só {secs:.0f}s de intervalo")
+        return lines
 
     def _get_selected_media_index(self):
         sel = self.tree.selection()
         if not sel:
             return None
-        return self.tree.index(sel[0])
+        return self._row_index.get(sel[0])
 
     # ------------------------ Tree events ------------------------
     def _on_tree_right_click(self, event):
@@ -450,7 +4119,9 @@ class TimelyAdsApp(tk.Tk):
         row = self.tree.identify_row(event.y)
         if not row:
             return
-        idx = list(self.tree.get_children()).index(row)
+        idx = self._row_index.get(row)
+        if idx is None:
+            return
         if col == "#2":  # time column
             # if global locked -> request PIN first
             if self._global_locked:
@@ -467,7 +4138,9 @@ class TimelyAdsApp(tk.Tk):
         row = self.tree.identify_row(event.y)
         if not row:
             return
-        idx = list(self.tree.get_children()).index(row)
+        idx = self._row_index.get(row)
+        if idx is None:
+            return
         if self._global_locked:
             pin = simpledialog.askstring("Senha", "Digite a senha para editar (PIN):", show="*")
             if pin != SCHEDULE_PIN:
@@ -487,6 +4160,7 @@ class TimelyAdsApp(tk.Tk):
             messagebox.showwarning("Aviso", "Playlist já existe.")
             return
         self.playlists[name] = {"files": [], "time": "00:00", "repeats": 1, "active": True}
+        self.core.index.set_playlist(name, self.playlists[name])
         self.current_playlist = name
         self._refresh_playlist_list()
         self._refresh_media_table()
@@ -499,10 +4173,12 @@ class TimelyAdsApp(tk.Tk):
         files = filedialog.askopenfilenames(title="Selecione arquivos de áudio", filetypes=[("Áudio", "*.mp3 *.wav *.ogg *.flac"), ("Todos","*.*")])
         if not files:
             return
-        for p in files:
-            self.playlists[self.current_playlist]["files"].append({"path": p, "times": [], "repeats": 1})
+        added = [{"path": p, "times": [], "repeats": 1} for p in files]
+        self.playlists[self.current_playlist]["files"].extend(added)
         self._refresh_media_table()
         self._save_playlists()
+        self.core.start_ingest()
+        self.core.analyze_media(added)
 
     def _play_selected_media(self):
         idx = self._get_selected_media_index()
@@ -510,7 +4186,7 @@ class TimelyAdsApp(tk.Tk):
             messagebox.showwarning("Aviso", "Selecione um item para tocar.")
             return
         media = self.playlists[self.current_playlist]["files"][idx]
-        path = media.get("path")
+        path = self.core.media_path(media)
         if not path or not os.path.exists(path):
             messagebox.showerror("Erro", "Arquivo não encontrado.")
             return
@@ -519,215 +4195,146 @@ class TimelyAdsApp(tk.Tk):
         except Exception:
             repeats = 1
         media["repeats"] = max(1, min(50, repeats))
+        self.core.index.touch()
         self._save_playlists()
-        # duck others (pycaw) and play async
-        self.duck_all_sessions(target=0.06, exclude_pids={os.getpid()}, steps=6, step_ms=120)
-        self.play_media_async(path, media["repeats"])
+        # jumps ahead of scheduled items; ducking happens when the queue starts playing
+        self.play_media_async(path, media["repeats"], priority=PRIORITY_MANUAL, gain=self.core.media_gain(media),
+                              engine=self.core.engine_for(self.current_playlist))
 
     def _generate_schedule(self):
-        msg = f"Gerar agenda (mock)\n\nPlaylist: {self.current_playlist}\nRepetir global: {self._get_repeat_global()}x\nDistribuição: ~{int(self.distrib_scale.get())}h"
-        messagebox.showinfo("Gerar Novo", msg)
-
-    # ------------------------ Playback worker ------------------------
-    def play_media_async(self, path, repeats=1):
-        if self._is_playing:
-            messagebox.showinfo("Info", "Já está tocando outro arquivo. Aguarde.")
+        if not self.current_playlist:
+            messagebox.showwarning("Aviso", "Selecione uma playlist primeiro.")
+            return
+        if not numpy_available():
+            messagebox.showwarning("Gerar Novo", "Instale 'numpy' para gerar agendas.")
+            return
+        if self._global_locked:
+            pin = simpledialog.askstring("Senha", "Digite a senha para editar (PIN):", show="*")
+            if pin != SCHEDULE_PIN:
+                messagebox.showerror("Senha", "PIN incorreto.")
+                return
+            self._global_locked = False; self._update_global_lock_btn(); self._save_config()
+        pl_name = self.current_playlist
+        count = self._get_repeat_global()
+        window = generation_window(self.distrib_scale.get())
+        files, plan, unplaced = self.core.generate_for_playlist(pl_name, count, window)
+        if not files:
+            messagebox.showwarning("Gerar Novo", "A playlist não tem mídias.")
             return
-        th = threading.Thread(target=self._playback_worker, args=(path, repeats), daemon=True)
-        th.start()
-        self._playback_thread = th
+        self._open_generate_preview(pl_name, files, plan, unplaced, count, window)
 
-    def _playback_worker(self, path, repeats):
-        self._is_playing = True
-        try:
-            with self._playback_lock:
-                mixer.music.load(path)
-                for _ in range(repeats):
-                    mixer.music.play()
-                    while mixer.music.get_busy():
-                        time.sleep(0.08)
-        except Exception as e:
-            print("Playback error:", e)
-        finally:
-            self._is_playing = False
-            # restore volumes smoothly
-            self.after(150, lambda: self.restore_all_sessions(steps=10, step_ms=150))
-
-    # ------------------------ pycaw duck helpers ------------------------
-    def _get_all_audio_sessions(self):
-        if not PYCAW_OK:
-            return []
-        sessions = []
-        try:
-            all_sessions = AudioUtilities.GetAllSessions()
-            for s in all_sessions:
-                pid = getattr(s.Process, "pid", None) if getattr(s, "Process", None) else None
-                vol_iface = None
-                try:
-                    vol_iface = s._ctl.QueryInterface(ISimpleAudioVolume)
-                except Exception:
-                    vol_iface = None
-                sessions.append((pid, s, vol_iface))
-        except Exception:
-            return []
-        return sessions
+    def _open_generate_preview(self, pl_name, files, plan, unplaced, count, window):
+        dlg = tk.Toplevel(self)
+        dlg.title("Gerar Novo — Prévia")
+        dlg.geometry("640x460")
+        dlg.transient(self)
+        dlg.grab_set()
+        dlg.configure(bg=BG)
 
-    def duck_all_sessions(self, target=0.06, exclude_pids=None, steps=6, step_ms=120):
-        if not PYCAW_OK:
-            print("pycaw not available")
-            return False
-        if exclude_pids is None:
-            exclude_pids = set()
-        sessions = self._get_all_audio_sessions()
-        if not self._duck_active:
-            self._saved_sessions = {}
-        to_duck = []
-        for pid, s, vol in sessions:
-            if vol is None:
-                continue
-            if pid in exclude_pids or pid == os.getpid():
-                continue
-            key = pid if pid is not None else id(s)
-            try:
-                orig = vol.GetMasterVolume()
-            except Exception:
-                orig = 1.0
-            if key not in self._saved_sessions:
-                self._saved_sessions[key] = float(orig)
-            to_duck.append((key, vol))
-        if not to_duck:
-            self._duck_active = True
-            return True
-        def step(i):
-            t = i / float(steps)
-            for key, vol in to_duck:
-                orig = self._saved_sessions.get(key, 1.0)
-                new = float(orig) + (float(target) - float(orig)) * t
-                try:
-                    vol.SetMasterVolume(max(0.0, min(1.0, new)), None)
-                except Exception:
-                    pass
-            if i < steps:
-                self.after(step_ms, lambda: step(i+1))
-            else:
-                self._duck_active = True
-        self.after(0, lambda: step(1))
-        return True
+        info = f"{pl_name}: {count}x por mídia entre {minutes_to_hhmm(window[0])} e {minutes_to_hhmm(window[1])}"
+        if unplaced:
+            info += f"  ({unplaced} não couberam)"
+        ttk.Label(dlg, text=info, style="Accent.TLabel").pack(fill="x", padx=12, pady=(12,6))
 
-    def restore_all_sessions(self, steps=10, step_ms=150):
-        if not PYCAW_OK:
-            return False
-        if not self._saved_sessions:
-            return True
-        sessions = self._get_all_audio_sessions()
-        vol_map = {}
-        for pid, s, vol in sessions:
-            if vol is None:
-                continue
-            key = pid if pid is not None else id(s)
-            vol_map[key] = vol
-        def step(i):
-            t = i / float(steps)
-            for key, orig in list(self._saved_sessions.items()):
-                voliface = vol_map.get(key)
-                if voliface is None:
-                    continue
-                try:
-                    cur = voliface.GetMasterVolume()
-                except Exception:
-                    cur = orig
-                new = float(cur) + (float(orig) - float(cur)) * t
-                try:
-                    voliface.SetMasterVolume(max(0.0, min(1.0, new)), None)
-                except Exception:
-                    pass
-            if i < steps:
-                self.after(step_ms, lambda: step(i+1))
-            else:
-                for key, orig in list(self._saved_sessions.items()):
-                    voliface = vol_map.get(key)
-                    if voliface:
-                        try:
-                            voliface.SetMasterVolume(float(orig), None)
-                        except Exception:
-                            pass
-                self._saved_sessions = {}
-                self._duck_active = False
-        self.after(0, lambda: step(1))
-        return True
+        tree = ttk.Treeview(dlg, columns=("name", "times"), show="headings", style="Treeview")
+        tree.heading("name", text="Nome")
+        tree.heading("times", text="Horários")
+        tree.column("name", anchor="w", width=240)
+        tree.column("times", anchor="w", width=360)
+        tree.pack(fill="both", expand=True, padx=12, pady=6)
+        for m in files:
+            tree.insert("", "end", values=(os.path.basename(m.get("path", "")), ", ".join(plan[id(m)]) or "—"))
+
+        def apply():
+            for m in files:
+                m["times"] = plan[id(m)]
+                self.core.index.update_media(pl_name, m)
+            self._save_playlists()
+            self._refresh_media_table()
+            dlg.destroy()
+
+        bottom = ttk.Frame(dlg, style="App.TFrame")
+        bottom.pack(fill="x", padx=12, pady=(0,12))
+        bottom.columnconfigure(0, weight=1)
+        ttk.Button(bottom, text="Cancelar", style="Neon.TButton", command=dlg.destroy).grid(row=0, column=1, sticky="e", padx=6)
+        ttk.Button(bottom, text="Aplicar", style="Primary.TButton", command=apply).grid(row=0, column=2, sticky="e")
+
+    # ------------------------ Playback ------------------------
+    def play_media_async(self, path, repeats=1, priority=PRIORITY_SCHEDULED, gain=1.0, engine=None):
+        self.core.play_media(path, repeats, priority, gain, engine)
+
+    def duck_all_sessions(self, owner="manual", target=0.06, fade=0.7, exclude_pids=None):
+        return self.core.ducker.duck(owner, target, fade=fade, exclude_pids=exclude_pids)
+
+    def restore_all_sessions(self, owner="manual", fade=1.5):
+        return self.core.ducker.release(owner, fade=fade)
 
     # ------------------------ Mic passthrough (low-latency) ------------------------
     def _toggle_mic(self):
-        if not SOUND_OK:
+        if not sound_available():
             messagebox.showwarning("Mic", "Instale 'sounddevice' e 'numpy' para usar o microfone.")
             return
         if not self._mic_active:
-            # duck others
-            self.duck_all_sessions(target=0.03, exclude_pids={os.getpid()}, steps=6, step_ms=60)
+            if self._mic_duck_mode == "always":
+                # duck others for as long as the mic is open, whatever playback does meanwhile
+                self.duck_all_sessions("mic", target=0.03, fade=0.36)
+            else:
+                # duck only while someone is actually speaking
+                self.core.voice_duck.start()
             self._start_mic()
         else:
             self._stop_mic()
-            self.restore_all_sessions(steps=8, step_ms=120)
+            if self._mic_duck_mode == "always":
+                self.restore_all_sessions("mic", fade=1.0)
 
     def _start_mic(self):
         if self._mic_active:
             return
-        # parameters tuned for low latency
-        samplerate = 44100
-        channels_in = 1
-        channels_out = 2
-        blocksize = 256
-        latency = 'low'
-
-        def callback(indata, outdata, frames, time_info, status):
-            try:
-                data = indata * (self._mic_gain)
-                # mono to stereo
-                if data.ndim == 2 and data.shape[1] == 1:
-                    outdata[:,0] = data[:,0]
-                    outdata[:,1] = data[:,0]
-                else:
-                    outdata[:] = data
-            except Exception:
-                outdata.fill(0)
-
+        if self._mic is None or self._mic.blocksize != self._mic_blocksize:
+            self._mic = MicPassthrough(blocksize=self._mic_blocksize)
+        self._mic.gain = self._mic_gain
+        self._mic.vox_threshold_db = self._mic_vox_threshold_db
+        self._mic.on_voice = self.core.voice_duck.signal if self._mic_duck_mode == "voice" else None
         try:
-            device_pair = None
-            if self._mic_input_device is not None or self._mic_output_device is not None:
-                in_dev = self._mic_input_device
-                out_dev = self._mic_output_device
-                device_pair = (in_dev, out_dev)
-            self._mic_stream = sd.Stream(samplerate=samplerate, blocksize=blocksize, device=device_pair,
-                                         channels=(channels_in, channels_out), callback=callback, latency=latency)
-            self._mic_stream.start()
+            self._mic.start(self._mic_input_device, self._mic_output_device)
             self._mic_active = True
             self._mic_btn.config(text="🎙 Mic (ON)")
             self._mic_label.config(text="Mic: on")
+            self._mic_stats_tick()
         except Exception as e:
             messagebox.showerror("Mic", f"Erro iniciando microfone: {e}")
-            self._mic_stream = None
+            self._mic.stop()
             self._mic_active = False
 
     def _stop_mic(self):
         if not self._mic_active:
             return
-        try:
-            if self._mic_stream:
-                self._mic_stream.stop()
-                self._mic_stream.close()
-        except Exception:
-            pass
-        self._mic_stream = None
+        if self._mic is not None:
+            self._mic.stop()
         self._mic_active = False
         self._mic_btn.config(text="🎙 Mic")
         self._mic_label.config(text="Mic: off")
 
+    def _mic_stats_tick(self):
+        # latency / xrun readout while the mic is open
+        if not self._mic_active or self._mic is None:
+            return
+        st = self._mic.stats()
+        lat = st["latency"] if st["latency"] is not None else st["nominal_latency"]
+        lat_txt = f"{lat * 1000:.1f} ms" if lat is not None else "-- ms"
+        voice = " · 🗣" if self._mic.speaking else ""
+        self._mic_label.config(text=f"Mic: on · {lat_txt} · xruns {st['xruns']}{voice}")
+        self.after(500, self._mic_stats_tick)
+
     def _on_mic_vol_change(self, _v):
         try:
             v = float(self._mic_vol.get())
             self._mic_gain = max(0.0, v / 100.0)
         except Exception:
             self._mic_gain = 1.0
+        if self._mic is not None:
+            # picked up by the audio callback, which ramps to it
+            self._mic.gain = self._mic_gain
 
     # ------------------------ Global lock logic (single lock) ------------------------
     def _toggle_global_lock(self):
@@ -767,6 +4374,14 @@ class TimelyAdsApp(tk.Tk):
         for t in media.get("times", []):
             listbox.insert(tk.END, t)
 
+        conflict_label = ttk.Label(dlg, text="", style="Muted.TLabel", justify="left", wraplength=490)
+        conflict_label.pack(fill="x", padx=12)
+        def show_conflicts():
+            lines = self._media_conflict_lines(media)
+            more = f"\n… +{len(lines) - 4}" if len(lines) > 4 else ""
+            conflict_label.config(text="\n".join(lines[:4]) + more)
+        show_conflicts()
+
         ctrl = ttk.Frame(dlg, style="App.TFrame")
         ctrl.pack(fill="x", padx=12, pady=(6,12))
         ctrl.columnconfigure(0, weight=1); ctrl.columnconfigure(1, weight=1); ctrl.columnconfigure(2, weight=1)
@@ -781,8 +4396,10 @@ class TimelyAdsApp(tk.Tk):
                 return
             media.setdefault("times", []).append(new)
             listbox.insert(tk.END, new)
+            self.core.index.update_media(self.current_playlist, media)
             self._save_playlists()
             self._refresh_media_table()
+            show_conflicts()
 
         def edit_time():
             sel = listbox.curselection()
@@ -797,8 +4414,10 @@ class TimelyAdsApp(tk.Tk):
                 return
             media["times"][sel[0]] = new
             listbox.delete(sel[0]); listbox.insert(sel[0], new)
+            self.core.index.update_media(self.current_playlist, media)
             self._save_playlists()
             self._refresh_media_table()
+            show_conflicts()
 
         def remove_time():
             sel = listbox.curselection()
@@ -806,8 +4425,10 @@ class TimelyAdsApp(tk.Tk):
             if not messagebox.askyesno("Remover", "Remover horário selecionado?"): return
             media["times"].pop(sel[0])
             listbox.delete(sel[0])
+            self.core.index.update_media(self.current_playlist, media)
             self._save_playlists()
             self._refresh_media_table()
+            show_conflicts()
 
         ttk.Button(ctrl, text="＋ Adicionar", style="Neon.TButton", command=add_time).grid(row=0, column=0, sticky="ew", padx=6)
         ttk.Button(ctrl, text="✎ Editar", style="Neon.TButton", command=edit_time).grid(row=0, column=1, sticky="ew", padx=6)
@@ -822,6 +4443,7 @@ class TimelyAdsApp(tk.Tk):
         spin.grid(row=0, column=1, sticky="e")
         def save_and_close():
             media["repeats"] = int(repeats.get())
+            self.core.index.touch()
             self._save_playlists()
             self._refresh_media_table()
             dlg.destroy()
@@ -856,6 +4478,7 @@ class TimelyAdsApp(tk.Tk):
         except Exception:
             return
         media["repeats"] = max(1, min(100, new_r))
+        self.core.index.touch()
         self._save_playlists()
         self._refresh_media_table()
 
@@ -870,7 +4493,8 @@ class TimelyAdsApp(tk.Tk):
         if idx is None:
             return
         if not messagebox.askyesno("Remover", "Deseja remover o item selecionado?"): return
-        self.playlists[self.current_playlist]["files"].pop(idx)
+        removed = self.playlists[self.current_playlist]["files"].pop(idx)
+        self.core.index.remove_media(removed)
         self._save_playlists()
         self._refresh_media_table()
 
@@ -881,27 +4505,41 @@ class TimelyAdsApp(tk.Tk):
             return
         folder = filedialog.askdirectory(title="Exportar para pasta")
         if not folder: return
-        pl = self.playlists[self.current_playlist]
-        export_folder = os.path.join(folder, f"export_{self.current_playlist}")
-        os.makedirs(export_folder, exist_ok=True)
-        exported = []
-        for m in pl.get("files", []):
-            src = m.get("path")
-            if not src or not os.path.exists(src): continue
-            try:
-                dst = os.path.join(export_folder, os.path.basename(src))
-                shutil.copy2(src, dst)
-                exported.append({"path": os.path.basename(src), "times": m.get("times", []), "repeats": m.get("repeats",1)})
-            except Exception:
-                pass
-        if not exported:
+        job = self.core.export_job(self.current_playlist, folder)
+        if job is None:
             messagebox.showwarning("Exportar", "Nenhum arquivo exportado.")
-            shutil.rmtree(export_folder, ignore_errors=True)
             return
-        cfg = {"playlist": {"files": exported, "time": pl.get("time", "00:00"), "repeats": pl.get("repeats",1)}, "metadata": {"playlist_name": self.current_playlist, "export_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}}
-        with open(os.path.join(export_folder, "playlist_config.json"), "w", encoding="utf-8") as f:
-            json.dump(cfg, f, indent=4, ensure_ascii=False)
-        messagebox.showinfo("Exportar", f"Exportado em: {export_folder}")
+        threading.Thread(target=job.run, name="export", daemon=True).start()
+
+        dlg = tk.Toplevel(self)
+        dlg.title("Exportar")
+        dlg.geometry("420x140")
+        dlg.transient(self)
+        dlg.configure(bg=BG)
+        label = ttk.Label(dlg, text=os.path.basename(job.folder), style="Accent.TLabel")
+        label.pack(fill="x", padx=12, pady=(12,6))
+        bar = ttk.Progressbar(dlg, maximum=job.total, mode="determinate")
+        bar.pack(fill="x", padx=12, pady=6)
+        status = ttk.Label(dlg, text="", style="Muted.TLabel")
+        status.pack(fill="x", padx=12)
+        ttk.Button(dlg, text="Cancelar", style="Neon.TButton", command=job.cancel).pack(anchor="e", padx=12, pady=(6,12))
+        dlg.protocol("WM_DELETE_WINDOW", job.cancel)
+
+        def tick():
+            bar["value"] = job.done
+            status.config(text=f"{job.done}/{job.total} arquivos · {job.skipped} sem alteração")
+            if not job.finished.is_set():
+                self.after(100, tick)
+                return
+            dlg.destroy()
+            if job.ok:
+                messagebox.showinfo("Exportar", f"Exportado em: {job.folder}\n{job.total - job.skipped} copiados, {job.skipped} já estavam lá")
+            elif job.cancelled.is_set():
+                messagebox.showwarning("Exportar", "Exportação cancelada (playlist_config.json não foi gravado).")
+            else:
+                lines = [f"{name}: {err}" for name, err in job.failed[:5]]
+                messagebox.showerror("Exportar", "Falha ao exportar:\n" + "\n".join(lines))
+        tick()
 
     def _import_playlist(self):
         folder = filedialog.askdirectory(title="Selecione pasta exportada")
@@ -916,42 +4554,95 @@ class TimelyAdsApp(tk.Tk):
         except Exception as e:
             messagebox.showerror("Importar", f"Erro lendo arquivo: {e}")
             return
-        name = data.get("metadata", {}).get("playlist_name", f"import_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
-        base = name; i=1
-        while name in self.playlists:
-            name = f"{base}_{i}"; i+=1
+        name = self.core.unique_playlist_name(data.get("metadata", {}).get("playlist_name", f"import_{datetime.now().strftime('%Y%m%d_%H%M%S')}"))
         imported = []
         for entry in data.get("playlist", {}).get("files", []):
             fname = entry.get("path")
             path = os.path.join(folder, fname)
-            if os.path.exists(path):
-                imported.append({"path": path, "times": entry.get("times", []), "repeats": entry.get("repeats",1)})
+            if os.path.exists(path) or (entry.get("hash") and self.core.store.find(entry["hash"])):
+                # a file missing from the folder is fine when the station already has the blob
+                imported.append(imported_entry(entry, path))
         if not imported:
             messagebox.showwarning("Importar", "Nenhum arquivo válido encontrado para importar.")
             return
         self.playlists[name] = {"files": imported, "time": data.get("playlist", {}).get("time", "00:00"), "repeats": data.get("playlist", {}).get("repeats",1), "active": True}
+        self.core.index.set_playlist(name, self.playlists[name])
         self.current_playlist = name
         self._refresh_playlist_list()
         self._refresh_media_table()
         self._save_playlists()
+        # copies the files into the store, so the folder (USB stick) can go away afterwards
+        self.core.start_ingest()
+        self.core.analyze_media(imported)
 
-    # ------------------------ Scheduler tick ------------------------
-    def _schedule_tick(self):
-        now = datetime.now().strftime("%H:%M")
-        for pl_name, pl in self.playlists.items():
-            if not pl.get("active", True): continue
-            if pl.get("time") == now:
-                self._play_playlist(pl_name)
-            for m in pl.get("files", []):
-                for t in m.get("times", []):
-                    if t == now:
-                        self.play_media_async(m.get("path"), m.get("repeats",1))
-        self.after(60000, self._schedule_tick)
+    def _export_bundle(self):
+        if not self.current_playlist:
+            messagebox.showwarning("Aviso", "Selecione uma playlist para exportar.")
+            return
+        path = filedialog.asksaveasfilename(title="Exportar pacote", defaultextension=BUNDLE_EXT,
+                                            initialfile=self.current_playlist + BUNDLE_EXT,
+                                            filetypes=[("Pacote TimelyAds", "*" + BUNDLE_EXT)])
+        if not path: return
+        name = self.current_playlist
+        def done(count):
+            messagebox.showinfo("Exportar", f"{count} itens exportados em: {path}")
+        self._run_with_progress("Exportar pacote", os.path.basename(path),
+                                lambda progress, cancel: self.core.export_bundle(name, path, progress, cancel), done)
+
+    def _import_bundle(self):
+        path = filedialog.askopenfilename(title="Importar pacote", filetypes=[("Pacote TimelyAds", "*" + BUNDLE_EXT), ("Todos","*.*")])
+        if not path: return
+        def done(result):
+            manifest, stats = result
+            name = self.core.add_bundle_playlist(manifest)
+            self.core.analyze_media(self.playlists[name]["files"])
+            self.current_playlist = name
+            self._refresh_playlist_list()
+            self._refresh_media_table()
+            messagebox.showinfo("Importar", f"Playlist '{name}' importada\n{stats['added']} arquivos novos, {stats['skipped']} já existentes")
+        self._run_with_progress("Importar pacote", os.path.basename(path),
+                                lambda progress, cancel: read_bundle(path, self.core.store, progress, cancel), done)
+
+    def _run_with_progress(self, title, text, work, on_done):
+        # work(progress, cancel) runs on a thread; on_done(result) back on the Tk thread
+        state = {"done": 0, "total": 0, "result": None, "error": None}
+        cancel = threading.Event()
+        finished = threading.Event()
+        def progress(done, total):
+            state["done"], state["total"] = done, total
+        def run():
+            try:
+                state["result"] = work(progress, cancel)
+            except Exception as e:
+                state["error"] = e
+            finally:
+                finished.set()
+        threading.Thread(target=run, name=title, daemon=True).start()
+
+        dlg = tk.Toplevel(self)
+        dlg.title(title)
+        dlg.geometry("420x140")
+        dlg.transient(self)
+        dlg.configure(bg=BG)
+        ttk.Label(dlg, text=text, style="Accent.TLabel").pack(fill="x", padx=12, pady=(12,6))
+        bar = ttk.Progressbar(dlg, mode="determinate")
+        bar.pack(fill="x", padx=12, pady=6)
+        ttk.Button(dlg, text="Cancelar", style="Neon.TButton", command=cancel.set).pack(anchor="e", padx=12, pady=(6,12))
+        dlg.protocol("WM_DELETE_WINDOW", cancel.set)
+        def tick():
+            bar.configure(maximum=max(1, state["total"]), value=state["done"])
+            if not finished.is_set():
+                self.after(100, tick)
+                return
+            dlg.destroy()
+            if state["error"] is not None:
+                messagebox.showerror(title, f"Erro: {state['error']}")
+            else:
+                on_done(state["result"])
+        tick()
 
     def _play_playlist(self, playlist_name):
-        for m in self.playlists[playlist_name]["files"]:
-            self.duck_all_sessions(target=0.06, exclude_pids={os.getpid()}, steps=6, step_ms=120)
-            self.play_media_async(m.get("path"), m.get("repeats",1))
+        self.core.play_playlist(playlist_name)
 
     # ------------------------ Misc ------------------------
     def _get_repeat_global(self):
@@ -960,26 +4651,15 @@ class TimelyAdsApp(tk.Tk):
         except Exception:
             return 3
 
-    def _get_selected_media_index(self):
-        sel = self.tree.selection()
-        if not sel: return None
-        return self.tree.index(sel[0])
-
     def _on_close(self):
         try:
             self._stop_mic()
         except Exception:
             pass
-        try:
-            self.restore_all_sessions(steps=1, step_ms=10)
-        except Exception:
-            pass
         self._save_playlists()
         self._save_config()
-        try:
-            mixer.quit()
-        except Exception:
-            pass
+        self.core.stop()
+        self._instance_lock.release()
         self.destroy()
 
     # ------------------------ Menu & debug ------------------------
@@ -992,21 +4672,43 @@ class TimelyAdsApp(tk.Tk):
         pm.add_separator()
         pm.add_command(label="Exportar Playlist", command=self._export_playlist)
         pm.add_command(label="Importar Playlist", command=self._import_playlist)
+        pm.add_command(label="Exportar Pacote (.tads)", command=self._export_bundle)
+        pm.add_command(label="Importar Pacote (.tads)", command=self._import_bundle)
         menu.add_cascade(label="Playlist", menu=pm)
 
         cm = Menu(menu, tearoff=0, bg=PANEL, fg=TEXT)
         cm.add_command(label="Ligar/Desligar Playlist", command=self._toggle_current_playlist)
+        vox = tk.BooleanVar(value=self._mic_duck_mode == "voice")
+        cm.add_checkbutton(label="Mic: abaixar só quando houver voz", variable=vox,
+                           command=lambda: self._set_mic_duck_mode("voice" if vox.get() else "always"))
         menu.add_cascade(label="Configurações", menu=cm)
 
         menu.add_command(label="Config Mic", command=self._open_mic_config)
+        menu.add_command(label="Zonas de Saída", command=self._open_zone_config)
+        menu.add_command(label="Cache de Áudio", command=self._show_cache_stats)
+        menu.add_command(label="Limpar Armazenamento", command=self._collect_store_garbage)
+        menu.add_command(label="Normalizar Volume", command=self._normalize_library)
+        menu.add_command(label="Conflitos de Horário", command=self._show_conflict_report)
         menu.add_separator()
-        menu.add_command(label="Salvar Tudo", command=self._save_playlists)
+        menu.add_command(label="Salvar Tudo", command=self._save_all)
 
         try:
             menu.tk_popup(self._gear_btn.winfo_rootx(), self._gear_btn.winfo_rooty() + self._gear_btn.winfo_height())
         finally:
             menu.grab_release()
 
+    def _set_mic_duck_mode(self, mode):
+        if self._mic_active:
+            messagebox.showinfo("Mic", "Desligue o microfone para trocar o modo de ducking.")
+            return
+        self._mic_duck_mode = mode
+        self._save_config()
+
+    def _save_all(self):
+        self._save_playlists()
+        self.core.flush()
+        self._save_config()
+
     def _rename_playlist(self):
         if not self.current_playlist:
             messagebox.showwarning("Aviso", "Selecione uma playlist primeiro.")
@@ -1015,6 +4717,7 @@ class TimelyAdsApp(tk.Tk):
         if not new or new == self.current_playlist:
             return
         self.playlists[new] = self.playlists.pop(self.current_playlist)
+        self.core.index.rename_playlist(self.current_playlist, new, self.playlists[new])
         self.current_playlist = new
         self._refresh_playlist_list()
         self._save_playlists()
@@ -1026,14 +4729,167 @@ class TimelyAdsApp(tk.Tk):
         if not messagebox.askyesno("Confirmar", f"Excluir playlist '{self.current_playlist}'?"):
             return
         self.playlists.pop(self.current_playlist, None)
+        self.core.index.remove_playlist(self.current_playlist)
         self.current_playlist = None
         self._refresh_playlist_list()
         self._refresh_media_table()
         self._save_playlists()
 
+    def _show_cache_stats(self):
+        st = self.core.audio_cache.stats()
+        msg = (f"Itens: {st['items']}\n"
+               f"Memória: {st['bytes'] / 1048576:.1f} / {st['budget'] / 1048576:.0f} MB\n"
+               f"Mapeados (PCM pronto): {st['maps']} · {st['mapped_bytes'] / 1048576:.1f} MB\n"
+               f"Acertos: {st['hits']}  Falhas: {st['misses']}  ({st['hit_rate']:.0%})\n"
+               f"Descartes (LRU): {st['evictions']}\n"
+               f"Pré-carga: próximos {self.core.preload_minutes:g} min")
+        messagebox.showinfo("Cache de Áudio", msg)
+
+    def _normalize_library(self):
+        if not numpy_available():
+            messagebox.showwarning("Normalizar", "Instale 'numpy' para analisar o volume dos áudios.")
+            return
+        entries = [m for pl in self.playlists.values() for m in pl.get("files", []) if isinstance(m, dict)]
+        def done(_count):
+            changed = self.core.apply_normalization(entries)
+            if changed:
+                self._save_playlists()
+            target = self.core.normalize_lufs if self.core.normalize_lufs is not None else NORMALIZE_LUFS
+            messagebox.showinfo("Normalizar", f"Alvo: {target:g} LUFS\n{changed} mídias ajustadas")
+        self._run_with_progress("Normalizar volume", "Analisando áudios…",
+                                lambda progress, cancel: self.core.normalize(entries, progress, cancel), done)
+
+    def _collect_store_garbage(self):
+        if not messagebox.askyesno("Armazenamento", "Remover do armazenamento os áudios que nenhuma playlist usa?"):
+            return
+        self.core.flush()
+        try:
+            removed, freed = self.core.collect_garbage()
+        except Exception as e:
+            messagebox.showerror("Armazenamento", f"Erro: {e}")
+            return
+        messagebox.showinfo("Armazenamento", f"Removidos: {removed}\nEspaço liberado: {freed / 1048576:.1f} MB")
+
+    def _show_conflict_report(self):
+        rep = self.core.conflicts()
+        lines = [f"Sobreposições: {len(rep['overlaps'])}   Sem intervalo (<{SATURATION_GAP:.0f}s): {len(rep['tight'])}", ""]
+        for a, b, secs in rep["overlaps"][:8]:
+            lines.append(f"⚠ {a[3]} × {b[3]}: {secs:.0f}s")
+        if len(rep["overlaps"]) > 8:
+            lines.append(f"… +{len(rep['overlaps']) - 8}")
+        lines.append("")
+        lines.append("Tempo no ar por hora:")
+        for hour, secs in enumerate(rep["airtime"]):
+            if secs:
+                lines.append(f"  {hour:02d}h  {secs / 60:5.1f} min ({secs / 36:.0f}%)")
+        messagebox.showinfo("Conflitos de Horário", "\n".join(lines))
+
+    # ------------------------ Zones dialog ------------------------
+    def _open_zone_config(self):
+        zones = {k: dict(v) for k, v in (self.core.config.get("zones") or {}).items()}
+        devices = []
+        if sound_available():
+            try:
+                devices = [(i, d["name"]) for i, d in enumerate(sd.query_devices()) if d.get("max_output_channels", 0) > 0]
+            except Exception:
+                devices = []
+
+        dlg = tk.Toplevel(self)
+        dlg.title("Zonas de Saída")
+        dlg.geometry("620x440")
+        dlg.transient(self)
+        dlg.grab_set()
+        dlg.configure(bg=BG)
+
+        ttk.Label(dlg, text="Zonas", style="Accent.TLabel").pack(fill="x", padx=12, pady=(12,6))
+        zone_list = tk.Listbox(dlg, bg=CARD, fg=TEXT, height=7, font=DEFAULT_FONT)
+        zone_list.pack(fill="both", expand=True, padx=12)
+        def describe(name, spec):
+            if spec.get("sink") == "sounddevice":
+                target = next((f"{i}: {n}" for i, n in devices if i == spec.get("device")), f"dispositivo {spec.get('device')}")
+            elif spec.get("sink") == "file":
+                target = spec.get("path") or f"zona_{name}.wav"
+            else:
+                target = "sem saída"
+            return f"{name}  —  {spec.get('sink')} · {target}"
+        def refresh():
+            zone_list.delete(0, tk.END)
+            zone_list.insert(tk.END, f"{DEFAULT_ZONE}  —  mixer (pygame)")
+            for name, spec in zones.items():
+                zone_list.insert(tk.END, describe(name, spec))
+        refresh()
+
+        form = ttk.Frame(dlg, style="App.TFrame")
+        form.pack(fill="x", padx=12, pady=8)
+        form.columnconfigure(1, weight=1)
+        ttk.Label(form, text="Nome:", background=BG, foreground=TEXT).grid(row=0, column=0, sticky="w")
+        name_var = tk.StringVar()
+        ttk.Entry(form, textvariable=name_var).grid(row=0, column=1, sticky="ew", padx=6)
+        ttk.Label(form, text="Saída:", background=BG, foreground=TEXT).grid(row=1, column=0, sticky="w")
+        kind_var = tk.StringVar(value="sounddevice" if devices else "null")
+        ttk.Combobox(form, textvariable=kind_var, values=SINK_KINDS, state="readonly").grid(row=1, column=1, sticky="ew", padx=6, pady=4)
+        ttk.Label(form, text="Dispositivo / arquivo:", background=BG, foreground=TEXT).grid(row=2, column=0, sticky="w")
+        target_var = tk.StringVar()
+        ttk.Combobox(form, textvariable=target_var, values=[f"{i}: {n}" for i, n in devices]).grid(row=2, column=1, sticky="ew", padx=6)
+
+        def add_zone():
+            name = name_var.get().strip()
+            if not name or name == DEFAULT_ZONE:
+                messagebox.showwarning("Zonas", "Informe um nome de zona válido.", parent=dlg)
+                return
+            spec = {"sink": kind_var.get()}
+            target = target_var.get().strip()
+            if spec["sink"] == "sounddevice":
+                try:
+                    spec["device"] = int(target.split(":")[0])
+                except ValueError:
+                    messagebox.showwarning("Zonas", "Escolha um dispositivo de saída.", parent=dlg)
+                    return
+            elif spec["sink"] == "file" and target:
+                spec["path"] = target
+            zones[name] = spec
+            refresh()
+        def remove_zone():
+            sel = zone_list.curselection()
+            if not sel or sel[0] == 0:
+                return
+            zones.pop(list(zones)[sel[0] - 1], None)
+            refresh()
+
+        ctrl = ttk.Frame(dlg, style="App.TFrame")
+        ctrl.pack(fill="x", padx=12)
+        ttk.Button(ctrl, text="＋ Adicionar", style="Neon.TButton", command=add_zone).pack(side="left")
+        ttk.Button(ctrl, text="🗑 Remover", style="Neon.TButton", command=remove_zone).pack(side="left", padx=6)
+
+        bottom = ttk.Frame(dlg, style="App.TFrame")
+        bottom.pack(fill="x", padx=12, pady=12)
+        bottom.columnconfigure(1, weight=1)
+        zone_var = tk.StringVar(value=(self.playlists.get(self.current_playlist, {}).get("zone") or DEFAULT_ZONE))
+        if self.current_playlist:
+            ttk.Label(bottom, text=f"Zona de '{self.current_playlist}':", background=BG, foreground=TEXT).grid(row=0, column=0, sticky="w")
+            ttk.Combobox(bottom, textvariable=zone_var, values=[DEFAULT_ZONE] + list(zones), state="readonly").grid(row=0, column=1, sticky="ew", padx=6)
+
+        def save_and_close():
+            self.core.config["zones"] = zones
+            self.core.load_zones()
+            self.core.save_config()
+            for pl in self.playlists.values():
+                if pl.get("zone") and pl["zone"] not in zones:
+                    pl.pop("zone")
+            if self.current_playlist in self.playlists:
+                zone = zone_var.get()
+                if zone in zones:
+                    self.playlists[self.current_playlist]["zone"] = zone
+                else:
+                    self.playlists[self.current_playlist].pop("zone", None)
+            self._save_playlists()
+            self._refresh_playlist_list()
+            dlg.destroy()
+        ttk.Button(bottom, text="Salvar", style="Primary.TButton", command=save_and_close).grid(row=0, column=2, sticky="e")
+
     # ------------------------ Mic config dialog ------------------------
     def _open_mic_config(self):
-        if not SOUND_OK:
+        if not sound_available():
             messagebox.showwarning("Config Mic", "Instale 'sounddevice' e 'numpy' para configurar microfones.")
             return
         try:
@@ -1126,7 +4982,548 @@ class TimelyAdsApp(tk.Tk):
         ttk.Button(bottom, text="Atualizar", style="Neon.TButton", command=on_update).grid(row=0, column=0, sticky="w", padx=(0,6))
         ttk.Button(bottom, text="Salvar", style="Primary.TButton", command=on_save).grid(row=0, column=1, sticky="e", padx=(6,0))
 
+# ------------------------ Headless ------------------------
+HEADLESS_RELOAD_INTERVAL = 5.0  # seconds between checks for edits to playlists.json
+
+def _file_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def run_headless(playlist_file=PLAYLISTS_JSON, config_file=CONFIG_JSON):
+    core = TimelyAdsCore(playlist_file, config_file)
+    with STARTUP.phase("config load"):
+        core.load_config()
+    try:
+        core.init_mixer()
+    except Exception as e:
+        print("Áudio: erro iniciando mixer:", e)
+    with STARTUP.phase("playlists load + migrate"):
+        core.library.load()
+        core.load_playlists()
+    with STARTUP.phase("library scan"):
+        # after the playlists, so the files they use outside the roots are indexed too
+        core.scan_library()
+        core.resolve_paths()
+    core.start()
+    if STARTUP.enabled:
+        print(STARTUP.report("headless startup"))
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            signal.signal(sig, lambda *_: stop.set())
+        except (ValueError, OSError):
+            pass
+    active = [n for n, pl in core.playlists.items() if pl.get("active", True)]
+    print(f"{APP_TITLE} (headless) — playlists ativas: {', '.join(active) or 'nenhuma'}")
+
+    # pick up edits made by the GUI (or by hand) without a restart
+    mtime = _file_mtime(playlist_file)
+    while not stop.wait(HEADLESS_RELOAD_INTERVAL):
+        current = _file_mtime(playlist_file)
+        if current != mtime:
+            mtime = current
+            core.scan_library()
+            core.load_playlists()
+            core.reschedule()
+            print("playlists.json recarregado")
+    core.stop()
+    return 0
+
+def run_bundle_cli(args):
+    core = TimelyAdsCore(args.playlists, args.config)
+    core.load_playlists()
+    try:
+        if args.export_bundle:
+            name, path = args.export_bundle
+            if name not in core.playlists:
+                print(f"Playlist não encontrada: {name}")
+                return 2
+            count = core.export_bundle(name, path)
+            print(f"{count} itens exportados em {path}")
+        else:
+            # the window would overwrite the import with its own copy of the playlists
+            lock = InstanceLock(core.playlist_file)
+            if not lock.acquire():
+                print("Erro: o TimelyAds está aberto; importe o pacote pela janela (Importar pacote)")
+                return 1
+            try:
+                name, stats = core.import_bundle(args.import_bundle)
+            finally:
+                lock.release()
+            print(f"Playlist '{name}' importada: {stats['added']} arquivos novos, {stats['skipped']} já existentes")
+    except (BundleError, OSError, ValueError, tarfile.TarError) as e:
+        print("Erro:", e)
+        return 1
+    finally:
+        core.playlist_writer.close()
+    return 0
+
+# ------------------------ Offline render ------------------------
+# Renders what the scheduler would play over a time range into WAV files, as fast as the CPU
+# allows. The fires come from the same ScheduleIndex and fire_items() as live playback and go
+# through a PlaybackQueue per zone on a simulated clock, so priorities, de-duplication and
+# expiry match; repeats, volume and the playback duck level (voice/mic intervals) are applied
+# like the engines do. Audio is the transcoded PCM in the mixer layout.
+RENDER_CHUNK = 10.0         # seconds mixed per step
+RENDER_GAP = 1.0            # silence between active stretches in compact mode
+WAV_MAX_BYTES = 0xFFFFFFFF - 64
+
+def _parse_render_time(value, day=None):
+    # "HH:MM[:SS]" (on `day`, default today) or "YYYY-MM-DD HH:MM[:SS]"
+    value = str(value).strip()
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    for fmt in ("%H:%M", "%H:%M:%S"):
+        try:
+            t = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        day = day or datetime.now()
+        return day.replace(hour=t.hour, minute=t.minute, second=t.second, microsecond=0)
+    raise ValueError(f"horário inválido: {value}")
+
+def _parse_render_span(value, day):
+    # "HH:MM-HH:MM" duck interval; the end wraps past midnight when it is earlier
+    try:
+        a, b = str(value).split("-", 1)
+    except ValueError:
+        raise ValueError(f"intervalo inválido: {value}")
+    start, end = _parse_render_time(a, day), _parse_render_time(b, day)
+    if end <= start:
+        end += timedelta(days=1)
+    return start, end
+
+class RenderJob:
+    # plan() lays the range out as segments per zone, run() mixes and writes them. With
+    # per_zone every zone gets its own file (<out>_<zone>.wav), otherwise all are mixed into
+    # one. gap=None keeps real time; a number collapses silences longer than that, and the
+    # .csv cue sheet next to each file maps output offsets back to wall-clock times. Files that
+    # are missing or can't be decoded take no time, as live playback skips them at once; they
+    # stay in the plan (and the cue sheet) marked "skipped".
+    def __init__(self, core, start, end, out, per_zone=False, gap=None, duck=(), duck_level=None):
+        self.core = core
+        self.start = start
+        self.end = end
+        self.out = out
+        self.per_zone = per_zone
+        self.gap = gap
+        self.duck = sorted(duck)                # [(datetime, datetime)] playback ducked
+        self.duck_level = VOICE_DUCK_PLAYBACK if duck_level is None else duck_level
+        self.segments = {}                      # zone -> [segment dict]
+        self.dropped = []                       # (zone, wall time, path) expired in the queue
+        self.files = []
+        self.done = 0.0
+        self.total = 0.0
+        self.cancelled = threading.Event()
+        self._pcm = {}
+
+    def cancel(self):
+        self.cancelled.set()
+
+    # planning
+    def fires(self):
+        return schedule_fires(self.core.index, self.core.playlists, self.start, self.end)
+
+    def _source(self, path):
+        # pcm_source() result, or None for what live playback would skip. Without a mixer
+        # (time-warp replays) nothing is decoded and the known duration stands in.
+        if path not in self._pcm:
+            pcm = None
+            if path and os.path.exists(path):
+                pcm = self.core.pcm_source(path)
+                if pcm[0] is None and _mixer_layout():
+                    pcm = None
+            self._pcm[path] = pcm
+        return self._pcm[path]
+
+    def plan(self, fires=None):
+        # fires: (datetime, kind, playlist, media) to play instead of the index's, e.g. the
+        # trace of a time-warp replay
+        clock = ManualClock(self.start)
+        zones = {}      # name -> [queue, cursor (seconds from start)]
+        def zone(name):
+            if name not in zones:
+                expired = lambda item, z=name: self.dropped.append((z, clock.now(), item["path"]))
+                zones[name] = [PlaybackQueue(on_expired=expired, clock=clock.time), 0.0]
+                self.segments[name] = []
+            return zones[name]
+        def drain(limit):
+            # let every zone start what it would have started before `limit`
+            for name, z in zones.items():
+                while z[1] <= limit:
+                    clock.set(self.start + timedelta(seconds=z[1]))
+                    item = z[0].get(timeout=0)
+                    if item is None:
+                        break
+                    pcm = self._source(item["path"])
+                    repeats = max(1, int(item["repeats"]))
+                    length = 0.0 if pcm is None else pcm[3] * repeats
+                    self.segments[name].append({
+                        "start": z[1], "end": z[1] + length, "path": item["path"],
+                        "repeats": repeats, "gain": max(0.0, min(1.0, float(item.get("gain", 1.0)))),
+                        "pcm": pcm or (None, 0, 0, 0.0), "skipped": pcm is None})
+                    z[1] += length
+        span = (self.end - self.start).total_seconds()
+        last = None
+        for when, kind, pl_name, media in (self.fires() if fires is None else fires):
+            t = (when - self.start).total_seconds()
+            if t != last:
+                # the scheduler queues a whole minute's entries in one go
+                drain(t)
+                last = t
+            z = zone(self.core.engine_for(pl_name).name)
+            clock.set(when)
+            z[1] = max(z[1], t)
+            for path, repeats, priority, gain in self.core.fire_items(kind, pl_name, media):
+                z[0].put(path, repeats, priority, gain)
+        drain(span - 1e-9)
+        return self.segments
+
+    # mixing
+    def _duck_spans(self):
+        return [((a - self.start).total_seconds(), (b - self.start).total_seconds()) for a, b in self.duck]
+
+    def _active(self, segments, span):
+        # merged [start, end) stretches with audio, clipped to the range
+        spans = []
+        for s in sorted(segments, key=lambda s: s["start"]):
+            a, b = s["start"], min(s["end"], span)
+            if spans and a <= spans[-1][1]:
+                spans[-1][1] = max(spans[-1][1], b)
+            elif a < b:
+                spans.append([a, b])
+        return spans
+
+    def _layout(self, segments, span):
+        # [(real start, real end)] stretches written to the file, in order
+        if self.gap is None:
+            return [(0.0, span)]
+        return [(a, b) for a, b in self._active(segments, span)]
+
+    def _mix(self, segments, a, b, rate, channels, duck):
+        first = int(round(a * rate))
+        n = int(round(b * rate)) - first
+        out = np.zeros((n, channels), dtype=np.float32)
+        for s in segments:
+            buf, _rate, seg_ch, _seconds = s["pcm"]
+            if buf is None or s["end"] <= a or s["start"] >= b or not len(buf):
+                continue
+            samples = np.frombuffer(buf, dtype="<i2").reshape(-1, seg_ch)
+            seg_first = int(round(s["start"] * rate))
+            seg_len = len(samples) * s["repeats"]
+            lo = max(first, seg_first)
+            hi = min(first + n, seg_first + seg_len)
+            if hi <= lo:
+                continue
+            idx = np.arange(lo - seg_first, hi - seg_first) % len(samples)
+            out[lo - first:hi - first] += samples[idx] * s["gain"]
+        for da, db in duck:
+            lo = max(first, int(round(da * rate)))
+            hi = min(first + n, int(round(db * rate)))
+            if hi > lo:
+                out[lo - first:hi - first] *= self.duck_level
+        return np.clip(out, -32768, 32767).astype("<i2")
+
+    def _write(self, path, segments, span, rate, channels):
+        layout = self._layout(segments, span)
+        gap = int(round((self.gap or 0.0) * rate))
+        frames = sum(int(round(b * rate)) - int(round(a * rate)) for a, b in layout)
+        frames += gap * max(0, len(layout) - 1)
+        if frames * channels * 2 > WAV_MAX_BYTES:
+            raise ValueError(f"{os.path.basename(path)}: {frames / rate / 3600:.1f} h não cabem num WAV; "
+                             "use o modo compacto ou um intervalo menor")
+        duck = self._duck_spans()
+        cues = []
+        marks = []      # (real start, real end, frames written before it) per stretch
+        tmp = path + ".part"
+        with wave.open(tmp, "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(rate)
+            written = 0
+            for i, (a, b) in enumerate(layout):
+                if i and gap:
+                    wav.writeframes(bytes(gap * channels * 2))
+                    written += gap
+                marks.append((a, b, written))
+                for s in segments:
+                    if not s["skipped"] and s["start"] < b and s["end"] > a:
+                        cues.append((written / rate + max(0.0, s["start"] - a), s))
+                t = a
+                while t < b:
+                    if self.cancelled.is_set():
+                        raise InterruptedError("cancelado")
+                    step = min(b, t + RENDER_CHUNK)
+                    block = self._mix(segments, t, step, rate, channels, duck)
+                    wav.writeframes(block.tobytes())
+                    written += len(block)
+                    self.done += step - t
+                    t = step
+        os.replace(tmp, path)
+        for s in segments:
+            if s["skipped"]:
+                # no length: cued where it would have started (or where the next stretch does)
+                at = next((w + max(0, int(round((s["start"] - a) * rate))) for a, b, w in marks if s["start"] < b), written)
+                cues.append((at / rate, s))
+        self._write_cues(os.path.splitext(path)[0] + ".csv", cues)
+        self.files.append(path)
+
+    def _write_cues(self, path, cues):
+        lines = ["saida;inicio;fim;zona;arquivo;repeticoes;volume;situacao"]
+        for offset, s in sorted(cues, key=lambda c: (c[0], c[1]["start"])):
+            lines.append(";".join([
+                f"{offset:.3f}",
+                (self.start + timedelta(seconds=s["start"])).strftime("%Y-%m-%d %H:%M:%S"),
+                (self.start + timedelta(seconds=s["end"])).strftime("%Y-%m-%d %H:%M:%S"),
+                s["zone"], os.path.basename(s["path"] or ""), str(s["repeats"]), f"{s['gain']:.3f}",
+                "ignorado" if s["skipped"] else "ok"]))
+        atomic_write_text(path, "\n".join(lines) + "\n")
+
+    def run(self):
+        if not numpy_available():
+            raise RuntimeError("numpy não instalado")
+        init = mixer.get_init() if mixer is not None else None
+        if not init or init[1] != -16:
+            raise RuntimeError("mixer de áudio não iniciado")
+        rate, _size, channels = init
+        self.plan()
+        for name, segments in self.segments.items():
+            for s in segments:
+                s["zone"] = name
+        span = (self.end - self.start).total_seconds()
+        if self.per_zone:
+            base, ext = os.path.splitext(self.out)
+            tracks = [(f"{base}_{name}{ext or '.wav'}", segs) for name, segs in self.segments.items()]
+        else:
+            tracks = [(self.out, [s for segs in self.segments.values() for s in segs])]
+        self.total = sum(sum(b - a for a, b in self._layout(segs, span)) for _p, segs in tracks)
+        for path, segments in tracks:
+            self._write(path, segments, span, rate, channels)
+        return self.files
+
+def run_render_cli(args):
+    start_arg, end_arg, out = args.render
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    core = TimelyAdsCore(args.playlists, args.config)
+    try:
+        core.load_config()
+        core.init_mixer()
+        # previews only read the library index; scanning and hashing belong to the ingest path
+        core.library.load()
+        core.load_playlists()
+        core.index.build(core.playlists)
+        start = _parse_render_time(start_arg)
+        end = _parse_render_time(end_arg, start)
+        if end <= start:
+            end += timedelta(days=1)
+        duck = [_parse_render_span(v, start) for v in args.render_duck or ()]
+        job = RenderJob(core, start, end, out, per_zone=args.render_zones,
+                        gap=RENDER_GAP if args.render_compact else None, duck=duck)
+        t0 = time.perf_counter()
+        files = job.run()
+    except (ValueError, RuntimeError, OSError) as e:
+        print("Erro:", e)
+        return 1
+    finally:
+        core.playlist_writer.close()
+        core.media_info.close()
+    took = time.perf_counter() - t0
+    count = sum(len(s) for s in job.segments.values())
+    print(f"{count} itens de {start:%Y-%m-%d %H:%M} a {end:%Y-%m-%d %H:%M} renderizados em {took:.1f} s "
+          f"({(end - start).total_seconds() / max(took, 1e-6):.0f}x tempo real)")
+    for zone, when, path in job.dropped:
+        print(f"  descartado ({zone}, {when:%H:%M:%S}): {os.path.basename(path or '')}")
+    for zone, segments in job.segments.items():
+        for s in segments:
+            if s["skipped"]:
+                when = start + timedelta(seconds=s["start"])
+                print(f"  ignorado ({zone}, {when:%H:%M:%S}, ausente ou ilegível): {os.path.basename(s['path'] or '')}")
+    for path in files:
+        print("  ", path)
+    return 0
+
+# ------------------------ Time warp ------------------------
+# Replays a window of the schedule through the real ScheduleEngine on a simulated clock:
+# instantly (ManualClock, stepped from here) or at N x speed (WarpClock, the engine's own
+# thread). The trace says what fired when, check() compares it with what the index schedules
+# so dense schedules can be load-tested for missed or doubled fires. Playback starts come from
+# the per-zone queue simulation of the offline renderer.
+WARP_POLL = 0.05            # seconds between end-of-window checks at N x speed
+
+class TimeWarp:
+    def __init__(self, core, start, end, speed=None):
+        self.core = core
+        self.start = start
+        self.end = end
+        self.speed = speed or None              # None: instant
+        self.trace = []                         # (scheduled, fired, kind, playlist, media)
+        self.playback = None                    # RenderJob planned from the trace
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        if self.speed:
+            clock = WarpClock(self.start, self.speed)
+        else:
+            clock = ManualClock(self.start)
+        engine = ScheduleEngine(self.core.index, on_fire=None, clock=clock, trace=self.trace)
+        if self.speed:
+            engine.start()
+            while clock.now() < self.end and not self.cancelled.wait(WARP_POLL):
+                pass
+            engine.stop()
+            engine._thread.join(2.0)
+        else:
+            while not self.cancelled.is_set():
+                delay = engine.step()
+                nxt = clock.now() + timedelta(seconds=delay)
+                if nxt >= self.end:
+                    break
+                clock.set(nxt)
+        self.trace[:] = [t for t in self.trace if self.start <= t[0] < self.end]
+        self.playback = RenderJob(self.core, self.start, self.end, None)
+        self.playback.plan([(fired, kind, pl_name, media) for _when, fired, kind, pl_name, media in self.trace])
+        return self.trace
+
+    def check(self):
+        # (missing, doubled): scheduled fires absent from the trace / present more than once
+        expected = {}
+        want = Counter()
+        for when, kind, pl_name, media in schedule_fires(self.core.index, self.core.playlists, self.start, self.end):
+            key = (when, kind, pl_name, id(media))
+            expected[key] = (when, kind, pl_name, media)
+            want[key] += 1
+        got = Counter((when, kind, pl_name, id(media)) for when, _fired, kind, pl_name, media in self.trace)
+        missing = [expected[k] for k, n in sorted((want - got).items(), key=lambda kv: kv[0][0]) for _ in range(n)]
+        doubled = []
+        for key, n in (got - want).items():
+            when, kind, pl_name, media = next((t[0], t[2], t[3], t[4]) for t in self.trace
+                                              if (t[0], t[2], t[3], id(t[4])) == key)
+            doubled.append((when, kind, pl_name, media, n))
+        doubled.sort(key=lambda d: d[0])
+        return missing, doubled
+
+    def max_delay(self):
+        return max(((fired - when).total_seconds() for when, fired, *_ in self.trace), default=0.0)
+
+    def rows(self):
+        # trace as text rows, in time order
+        def label(kind, media):
+            return "(playlist)" if kind == "playlist" else os.path.basename(media.get("path") or "")
+        rows = []
+        for when, fired, kind, pl_name, media in self.trace:
+            rows.append((fired, "disparo", self.core.engine_for(pl_name).name, pl_name, label(kind, media),
+                         f"{(fired - when).total_seconds():.3f}"))
+        for zone, segments in self.playback.segments.items():
+            for s in segments:
+                rows.append((self.start + timedelta(seconds=s["start"]), "ignorado" if s["skipped"] else "inicio",
+                             zone, "", os.path.basename(s["path"] or ""), ""))
+        for zone, when, path in self.playback.dropped:
+            rows.append((when, "descartado", zone, "", os.path.basename(path or ""), ""))
+        rows.sort(key=lambda r: r[0])
+        return ["horario;evento;zona;playlist;arquivo;atraso"] + [
+            ";".join([r[0].strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]] + list(r[1:])) for r in rows]
+
+def run_simulate_cli(args):
+    start_arg, end_arg = args.simulate
+    core = TimelyAdsCore(args.playlists, args.config)
+    try:
+        core.load_config()
+        core.library.load()
+        core.load_playlists()
+        core.index.build(core.playlists)
+        start = _parse_render_time(start_arg)
+        end = _parse_render_time(end_arg, start)
+        if end <= start:
+            end += timedelta(days=1)
+        warp = TimeWarp(core, start, end, args.speed)
+        t0 = time.perf_counter()
+        warp.run()
+        took = time.perf_counter() - t0
+        lines = warp.rows()
+        if args.trace:
+            atomic_write_text(args.trace, "\n".join(lines) + "\n")
+        else:
+            print("\n".join(lines))
+    except (ValueError, OSError) as e:
+        print("Erro:", e)
+        return 1
+    finally:
+        core.playlist_writer.close()
+        core.media_info.close()
+    missing, doubled = warp.check()
+    mode = f"{args.speed:g}x" if args.speed else "instantâneo"
+    print(f"{len(warp.trace)} disparos de {start:%Y-%m-%d %H:%M} a {end:%Y-%m-%d %H:%M} em {took:.2f} s ({mode}), "
+          f"atraso máx {warp.max_delay():.3f} s")
+    for when, kind, pl_name, media in missing:
+        print(f"  faltou: {when:%Y-%m-%d %H:%M} {pl_name} {kind}")
+    for when, kind, pl_name, media, n in doubled:
+        print(f"  repetido ({n}x a mais): {when:%Y-%m-%d %H:%M} {pl_name} {kind}")
+    return 1 if missing or doubled else 0
+
 # ------------------------ Run ------------------------
-if __name__ == "__main__":
-    app = TimelyAdsApp()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=APP_TITLE)
+    parser.add_argument("--headless", action="store_true",
+                        help="roda só o agendador e a reprodução, sem janela")
+    parser.add_argument("--playlists", default=PLAYLISTS_JSON, help="arquivo de playlists (JSON)")
+    parser.add_argument("--config", default=CONFIG_JSON, help="arquivo de configuração (JSON)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="mostra o tempo gasto em cada etapa da inicialização")
+    parser.add_argument("--export-bundle", nargs=2, metavar=("PLAYLIST", "ARQUIVO"),
+                        help="exporta uma playlist para um pacote " + BUNDLE_EXT)
+    parser.add_argument("--import-bundle", metavar="ARQUIVO", help="importa um pacote " + BUNDLE_EXT)
+    parser.add_argument("--render", nargs=3, metavar=("INICIO", "FIM", "SAIDA"),
+                        help="grava num WAV o que tocaria entre INICIO e FIM (HH:MM ou AAAA-MM-DD HH:MM)")
+    parser.add_argument("--render-zones", action="store_true", help="um WAV por zona de saída")
+    parser.add_argument("--render-compact", action="store_true",
+                        help="encurta os silêncios entre os avisos (ver a planilha .csv)")
+    parser.add_argument("--render-duck", action="append", metavar="HH:MM-HH:MM",
+                        help="intervalo com a reprodução abaixada, como quando alguém fala no microfone")
+    parser.add_argument("--simulate", nargs=2, metavar=("INICIO", "FIM"),
+                        help="repassa a agenda entre INICIO e FIM num relógio simulado e lista o que disparou")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="velocidade da simulação (ex.: 60 = 1 h por minuto); sem ela é instantânea")
+    parser.add_argument("--trace", metavar="ARQUIVO", help="grava o registro da simulação (.csv)")
+    args = parser.parse_args(argv)
+    STARTUP.enabled = args.profile_startup
+    if args.export_bundle or args.import_bundle:
+        return run_bundle_cli(args)
+    if args.render:
+        return run_render_cli(args)
+    if args.simulate:
+        return run_simulate_cli(args)
+    if args.headless:
+        return run_headless(args.playlists, args.config)
+    with STARTUP.phase("Tk root"):
+        app = TimelyAdsApp(args.playlists, args.config)
+    if STARTUP.enabled:
+        _profile_first_paint(app)
     app.mainloop()
+    return 0
+
+def _profile_first_paint(app):
+    # first <Map> of the root window, then the idle pass that draws it
+    built = time.perf_counter()
+    def on_map(_evt=None):
+        if getattr(app, "_profiled", False):
+            return
+        app._profiled = True
+        def painted():
+            STARTUP.add("first UI paint", time.perf_counter() - built)
+            print(STARTUP.report())
+            # mixer/pygame import land in the next idle pass; report them separately
+            app.after(500, lambda: print(STARTUP.report("startup + audio")))
+        app.after_idle(painted)
+    app.bind("<Map>", on_map, add="+")
+
+if __name__ == "__main__":
+    raise SystemExit(main())